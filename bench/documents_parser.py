@@ -0,0 +1,93 @@
+"""
+Benchmark of the parsing of the blocks received while the blockchain is synchronized,
+in the worker processes of the DocumentsParser against inline Block.from_signed_raw calls.
+The longest time the event loop is blocked is measured with a heartbeat task.
+
+Usage : python bench/documents_parser.py [nb_blocks]
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import mirage
+from duniterpy.documents import Block, BlockUID
+from duniterpy.key import ScryptParams
+from sakia.data.processors import DocumentsParser
+
+
+def forge_blocks(nb_blocks):
+    """
+    Forge a blockchain with members, certifications and dividends
+    :param int nb_blocks: the number of blocks
+    :return: the signed raw blocks
+    :rtype: List[str]
+    """
+    forge = mirage.BlockForge.start("test_currency", "12356", "123456", ScryptParams(2 ** 12, 16, 1))
+    users = [mirage.User.create("test_currency", "user{0}".format(i), "salt{0}".format(i),
+                                "password{0}".format(i), BlockUID.empty()) for i in range(0, 4)]
+    for user in users:
+        forge.push(user.identity())
+        forge.push(user.join(BlockUID.empty()))
+    for user, other in zip(users, users[1:] + users[:1]):
+        forge.push(user.certify(other, BlockUID.empty()))
+    forge.forge_block()
+    for user in users:
+        forge.set_member(user.key.pubkey, True)
+    while len(forge.blocks) < nb_blocks:
+        forge.generate_dividend()
+        forge.forge_block()
+    return [b.signed_raw() for b in forge.blocks]
+
+
+async def measure(parse, signed_raws):
+    """
+    Parse blocks while measuring the longest time the event loop was blocked
+    :param parse: the coroutine function parsing the blocks
+    :param List[str] signed_raws: the signed raw blocks
+    :return: the parsed blocks, the parsing time and the longest stall of the event loop
+    :rtype: Tuple[List[duniterpy.documents.Block], float, float]
+    """
+    stalls = []
+    parsing = True
+
+    async def heartbeat():
+        while parsing:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stalls.append(time.perf_counter() - start - 0.005)
+
+    task = asyncio.ensure_future(heartbeat())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    blocks = await parse(signed_raws)
+    elapsed = time.perf_counter() - start
+    parsing = False
+    await task
+    return blocks, elapsed, max(stalls)
+
+
+async def parse_inline(signed_raws):
+    return [Block.from_signed_raw(raw) for raw in signed_raws]
+
+
+async def main(nb_blocks):
+    signed_raws = forge_blocks(nb_blocks)
+    parser = DocumentsParser()
+    # Start the workers before measuring
+    await parser.blocks(signed_raws[:parser.min_batch])
+    try:
+        for name, parse in (("inline Block.from_signed_raw", parse_inline),
+                            ("DocumentsParser, {0} workers".format(parser.max_workers), parser.blocks)):
+            blocks, elapsed, stall = await measure(parse, signed_raws)
+            assert len(blocks) == len(signed_raws)
+            print("{0} : {1} blocks in {2:.2f}s, {3:.0f} blocks/s, longest stall of the event loop {4:.3f}s"
+                  .format(name, len(blocks), elapsed, len(blocks) / elapsed, stall))
+    finally:
+        parser.close()
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000))
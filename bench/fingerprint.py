@@ -0,0 +1,130 @@
+"""
+Benchmark of the fingerprint of the answers compared by BmaConnector.verified_get,
+against the former deepcopy based _filter_data + make_hash pair.
+
+Usage : python bench/fingerprint.py [nb_items]
+"""
+import copy
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from duniterpy.api import bma
+from sakia.data.connectors.bma import fingerprint, VOLATILE_FIELDS
+
+
+def make_hash(o):
+    """
+    The former hash of the answers, copied from the former sakia.data.connectors.bma
+    """
+    if isinstance(o, (set, tuple, list)):
+        return tuple(sorted([make_hash(e) for e in o]))
+    elif not isinstance(o, dict):
+        return hash(o)
+
+    new_o = copy.deepcopy(o)
+    for k, v in new_o.items():
+        new_o[k] = make_hash(v)
+
+    return hash(tuple(frozenset(sorted(new_o.items()))))
+
+
+def _filter_data(request, data):
+    """
+    The former filter of the volatile fields of the answers, copied from the former sakia.data.connectors.bma
+    """
+    filtered = data
+    if request is bma.tx.history:
+        filtered = copy.deepcopy(data)
+        filtered["history"].pop("sending")
+        filtered["history"].pop("receiving")
+        filtered["history"].pop("pending")
+    elif request is bma.wot.requirements:
+        filtered = copy.deepcopy(data)
+        for idty in filtered["identities"]:
+            for c in idty["certifications"]:
+                c.pop("expiresIn")
+            idty.pop('membershipPendingExpiresIn')
+
+    return filtered
+
+
+def tx_history(nb_tx):
+    transactions = [{
+        "version": 10,
+        "hash": "{0:064X}".format(i),
+        "block_number": i,
+        "time": 1500000000 + i,
+        "comment": "tx {0}".format(i),
+        "issuers": ["7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ"],
+        "inputs": ["{0}:0:T:{1:064X}:0".format(100 + i, i)],
+        "outputs": ["{0}:0:SIG(FADxcH5LmXGmGFgdixSes6nWnC4Vb4pRUBYT81zQRhjn)".format(100 + i)],
+        "unlocks": ["0:SIG(0)"],
+        "signatures": ["{0:088X}".format(i)]
+    } for i in range(0, nb_tx)]
+    return {
+        "currency": "test_currency",
+        "pubkey": "7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ",
+        "history": {
+            "sent": transactions[:nb_tx // 2],
+            "received": transactions[nb_tx // 2:],
+            "sending": [],
+            "receiving": [],
+            "pending": [{"comment": "pending"}]
+        }
+    }
+
+
+def wot_requirements(nb_certifications):
+    identities = [{
+        "pubkey": "{0:044X}".format(i),
+        "uid": "member{0}".format(i),
+        "meta": {"timestamp": "{0}-{1:064X}".format(i, i)},
+        "revocation_sig": None,
+        "revoked": False,
+        "revoked_on": None,
+        "expired": False,
+        "outdistanced": False,
+        "isSentry": True,
+        "wasMember": True,
+        "certifications": [{
+            "from": "{0:044X}".format(j),
+            "to": "{0:044X}".format(i),
+            "expiresIn": 1000000 + j
+        } for j in range(0, nb_certifications)],
+        "membershipPendingExpiresIn": 0,
+        "membershipExpiresIn": 1000000 + i
+    } for i in range(0, 10)]
+    return {"pubkey": "{0:044X}".format(0), "identities": identities}
+
+
+def measure(function, repeat=5):
+    """
+    Get the best time of a few runs of a function
+    :param function: the function to measure
+    :param int repeat: the number of runs
+    :rtype: float
+    """
+    best = None
+    for i in range(0, repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(nb_items):
+    payloads = (("tx.history", bma.tx.history, tx_history(nb_items)),
+                ("wot.requirements", bma.wot.requirements, wot_requirements(nb_items // 10)))
+    for name, request, data in payloads:
+        legacy_time = measure(lambda: make_hash(_filter_data(request, data)))
+        fingerprint_time = measure(lambda: fingerprint(data, VOLATILE_FIELDS[request]))
+        print("{0} : _filter_data + make_hash {1:.3f}s, fingerprint {2:.3f}s, {3:.1f}x"
+              .format(name, legacy_time, fingerprint_time, legacy_time / fingerprint_time))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
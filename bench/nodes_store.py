@@ -0,0 +1,106 @@
+"""
+Benchmark of the node updates handled by NetworkService.handle_change,
+in the write-behind NodesStore against the former per-event upserts in the database.
+Each event updates a node and looks up the consensus block, as handle_change does.
+
+Usage : python bench/nodes_store.py [nb_nodes] [nb_blocks]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from duniterpy.documents import BlockUID
+from sakia.data.entities import Node
+from sakia.data.repositories import SakiaDatabase, ConnectionsRepo, IdentitiesRepo, BlockchainsRepo, \
+    CertificationsRepo, TransactionsRepo, NodesRepo, SourcesRepo, DividendsRepo, ContactsRepo, BlocksRepo, \
+    BlocksIndexRepo
+from sakia.data.processors.nodes_store import NodesStore
+
+CURRENCY = "test_currency"
+
+
+def open_database(path):
+    """
+    Open a sakia database in a file
+    :param str path: the path of the file
+    :rtype: sakia.data.repositories.SakiaDatabase
+    """
+    sqlite3.register_adapter(BlockUID, str)
+    sqlite3.register_adapter(bool, int)
+    sqlite3.register_converter("BOOLEAN", lambda v: bool(int(v)))
+    con = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    db = SakiaDatabase(con, ConnectionsRepo(con), IdentitiesRepo(con), BlockchainsRepo(con),
+                       CertificationsRepo(con), TransactionsRepo(con), NodesRepo(con), SourcesRepo(con),
+                       DividendsRepo(con), ContactsRepo(con), BlocksRepo(con), BlocksIndexRepo(con))
+    db.prepare()
+    db.upgrade_database()
+    return db
+
+
+def nodes(nb_nodes):
+    return [Node(currency=CURRENCY, pubkey="pubkey{0}".format(i),
+                 endpoints="BASIC_MERKLED_API node{0}.test 80".format(i),
+                 peer_blockstamp=BlockUID.empty(), state=Node.ONLINE) for i in range(0, nb_nodes)]
+
+
+def new_head(nodes, number):
+    """
+    Every node finds the new block
+    """
+    for node in nodes:
+        node.current_buid = BlockUID(number, "{0:064X}".format(number))
+        node.current_ts = 1500000000 + number
+        yield node
+
+
+def upserts(db, nodes, nb_blocks):
+    """
+    The former NodesProcessor.update_node and current_buid, run on each event
+    """
+    repo = db.nodes_repo
+    for number in range(1, nb_blocks + 1):
+        for node in new_head(nodes, number):
+            if repo.get_one(currency=node.currency, pubkey=node.pubkey):
+                repo.update(node)
+            else:
+                repo.insert(node)
+            repo.current_buid(CURRENCY)
+    db.commit()
+
+
+def store(db, nodes, nb_blocks):
+    """
+    The NodesStore, flushed once at the end as the flush loop of the NetworkService does
+    """
+    nodes_store = NodesStore.load(db.nodes_repo, CURRENCY)
+    for number in range(1, nb_blocks + 1):
+        for node in new_head(nodes, number):
+            nodes_store.put(node)
+            nodes_store.consensus.current_buid()
+    nodes_store.flush()
+    db.commit()
+
+
+def main(nb_nodes, nb_blocks):
+    nb_updates = nb_nodes * nb_blocks
+    with tempfile.TemporaryDirectory() as directory:
+        for name, update in (("per-event upserts", upserts), ("nodes store", store)):
+            db = open_database(os.path.join(directory, "{0}.db".format(update.__name__)))
+            known = nodes(nb_nodes)
+            db.nodes_repo.insert_all(known)
+            db.commit()
+            start = time.perf_counter()
+            update(db, known, nb_blocks)
+            elapsed = time.perf_counter() - start
+            print("{0} : {1} updates of {2} nodes in {3:.2f}s, {4:.0f} updates/s"
+                  .format(name, nb_updates, nb_nodes, elapsed, nb_updates / elapsed))
+            db.conn.close()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -7,13 +7,14 @@ import aiohttp
 from PyQt5.QtCore import QObject, pyqtSignal, QTranslator, QCoreApplication, QLocale, Qt
 from . import __version__
 from .options import SakiaOptions
-from sakia.data.connectors import BmaConnector
+from sakia.data.connectors import BmaConnector, NodeConnector, SessionPool
 from sakia.services import NetworkService, BlockchainService, IdentitiesService, \
     SourcesServices, TransactionsService, DocumentsService
 from sakia.data.repositories import SakiaDatabase
 from sakia.data.entities import Transaction, Connection, Identity, Dividend
 from sakia.data.processors import BlockchainProcessor, NodesProcessor, IdentitiesProcessor, \
-    CertificationsProcessor, SourcesProcessor, TransactionsProcessor, ConnectionsProcessor, DividendsProcessor
+    BlocksProcessor, CertificationsProcessor, SourcesProcessor, TransactionsProcessor, ConnectionsProcessor, \
+    DividendsProcessor, DocumentsParser
 from sakia.data.files import AppDataFile, UserParametersFile, PluginsDirectory
 from sakia.decorators import asyncify
 from sakia.money import *
@@ -35,6 +36,9 @@ class Application(QObject):
     :param sakia.data.entities.AppData app_data: the application data
     :param sakia.data.entities.UserParameters parameters: the application current user parameters
     :param sakia.data.repositories.SakiaDatabase db: The database
+    :param sakia.data.connectors.BmaConnector bma_connector: The connector to BMA API shared by all processors
+    :param sakia.data.processors.DocumentsParser documents_parser: The parser of the documents shared by all processors
+    :param dict blockchain_snapshots: The local blockchains by currency shared by all blockchain processors
     :param sakia.services.NetworkService network_service: All network services for current currency
     :param sakia.services.BlockchainService blockchain_service: All blockchain services for current currency
     :param sakia.services.IdentitiesService identities_service: All identities services for current currency
@@ -61,6 +65,9 @@ class Application(QObject):
     db = attr.ib()
     currency = attr.ib()
     plugins_dir = attr.ib()
+    bma_connector = attr.ib(default=None)
+    documents_parser = attr.ib(default=attr.Factory(DocumentsParser))
+    blockchain_snapshots = attr.ib(default=attr.Factory(dict))
     network_service = attr.ib(default=None)
     blockchain_service = attr.ib(default=None)
     identities_service = attr.ib(default=None)
@@ -100,15 +107,22 @@ class Application(QObject):
         self.plugins_dir = PluginsDirectory.in_config_path(self.options.config_path, profile_name).load_or_init()
         self.parameters = UserParametersFile.in_config_path(self.options.config_path, profile_name).load_or_init()
         self.db = SakiaDatabase.load_or_init(self.options, profile_name)
+        self.blockchain_snapshots.clear()
 
         self.instanciate_services()
 
     def instanciate_services(self):
         nodes_processor = NodesProcessor(self.db.nodes_repo)
-        bma_connector = BmaConnector(nodes_processor, self.parameters)
+        # Each node gets enough connections for its websockets and its concurrent merkle leaves requests
+        session_pool = SessionPool(limit_per_host=NodeConnector.max_concurrent_leaves
+                                   + NodeConnector.websockets_per_node)
+        blocks_processor = BlocksProcessor.instanciate(self)
+        self.bma_connector = BmaConnector(nodes_processor, self.parameters,
+                                          session_pool=session_pool,
+                                          blocks_processor=blocks_processor)
         connections_processor = ConnectionsProcessor(self.db.connections_repo)
-        identities_processor = IdentitiesProcessor(self.db.identities_repo, self.db.certifications_repo, self.db.blockchains_repo, bma_connector)
-        certs_processor = CertificationsProcessor(self.db.certifications_repo, self.db.identities_repo, bma_connector)
+        identities_processor = IdentitiesProcessor(self.db.identities_repo, self.db.certifications_repo, self.db.blockchains_repo, self.bma_connector)
+        certs_processor = CertificationsProcessor(self.db.certifications_repo, self.db.identities_repo, self.bma_connector)
         blockchain_processor = BlockchainProcessor.instanciate(self)
         sources_processor = SourcesProcessor.instanciate(self)
         transactions_processor = TransactionsProcessor.instanciate(self)
@@ -120,25 +134,28 @@ class Application(QObject):
         self.identities_service = IdentitiesService(self.currency, connections_processor,
                                                     identities_processor,
                                                     certs_processor, blockchain_processor,
-                                                    bma_connector)
+                                                    self.bma_connector)
 
         self.transactions_service = TransactionsService(self.currency, transactions_processor,
                                                                    dividends_processor,
                                                                    identities_processor, connections_processor,
-                                                                   bma_connector)
+                                                                   self.bma_connector, self.documents_parser)
 
         self.sources_service = SourcesServices(self.currency, sources_processor,
                                                connections_processor, transactions_processor,
-                                               blockchain_processor, bma_connector)
+                                               blockchain_processor, self.bma_connector,
+                                               self.documents_parser)
 
-        self.blockchain_service = BlockchainService(self, self.currency, blockchain_processor, bma_connector,
+        self.blockchain_service = BlockchainService(self, self.currency, blockchain_processor, self.bma_connector,
                                                                self.identities_service,
                                                                self.transactions_service,
-                                                               self.sources_service)
+                                                               self.sources_service,
+                                                               blocks_processor)
 
         self.network_service = NetworkService.load(self, self.currency, nodes_processor,
                                                     self.blockchain_service,
-                                                    self.identities_service)
+                                                    self.identities_service,
+                                                    session_pool)
 
     async def remove_connection(self, connection):
         connections_processor = ConnectionsProcessor.instanciate(self)
@@ -180,6 +197,8 @@ class Application(QObject):
         and stop the coroutines
         """
         await self.network_service.stop_coroutines(closing)
+        await self.bma_connector.close()
+        self.documents_parser.close()
         self.db.commit()
 
     @asyncify
@@ -1,3 +1,9 @@
 from .node import NodeConnector
 from .bma import BmaConnector
+from .session_pool import SessionPool
+from .scoreboard import NodesScoreboard
+from .rate_limiter import NodesRateLimiter
+from .headers_cache import BlockHeadersCache
+from .seen_messages import SeenMessages
+from .endpoints_index import EndpointsIndex
 from .bma import parse_responses as parse_bma_responses
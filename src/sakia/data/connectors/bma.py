@@ -2,15 +2,16 @@ import logging
 import aiohttp
 from aiohttp import ClientError
 from duniterpy.api import bma, errors
-from duniterpy.documents import BMAEndpoint, SecuredBMAEndpoint
 from sakia.errors import NoPeerAvailable
-from pkg_resources import parse_version
+from .session_pool import SessionPool
 from socket import gaierror
 import asyncio
 import random
+import time
 import jsonschema
 import attr
-import copy
+import functools
+import itertools
 
 
 async def parse_responses(responses):
@@ -37,45 +38,35 @@ async def parse_responses(responses):
                 result = (False, str(e))
     return result
 
-def filter_endpoints(request, nodes):
-    def compare_versions(node, version):
-        if node.version and node.version != '':
-            try:
-                return parse_version(node.version) >= parse_version(version)
-            except TypeError:
-                return False
-        else:
-            return True
-    filters = {
-        bma.ud.history: lambda n: compare_versions(n, "0.11.0"),
-        bma.tx.history: lambda n: compare_versions(n, "0.11.0"),
-        bma.blockchain.membership: lambda n: compare_versions(n, "0.14")
-    }
-    if request in filters:
-        nodes = [n for n in nodes if filters[request](n)]
-    endpoints = []
-    for n in nodes:
-        endpoints += [e for e in n.endpoints if type(e) in (BMAEndpoint, SecuredBMAEndpoint)]
-    return endpoints
-
-
-def make_hash(o):
-    """
-    Makes a hash from a dictionary, list, tuple or set to any level, that contains
-    only other hashable types (including any lists, tuples, sets, and
-    dictionaries).
-    """
+# The fields of the responses which change from a node to another
+# even when the nodes agree, for example the remaining time before an expiration.
+# The fields are given as a tree of keys, a key mapped to None being skipped.
+# Lists are transparent : the tree applies to each of their items.
+VOLATILE_FIELDS = {
+    bma.tx.history: {"history": {"sending": None, "receiving": None, "pending": None}},
+    bma.wot.requirements: {"identities": {"certifications": {"expiresIn": None},
+                                          "membershipPendingExpiresIn": None}}
+}
 
-    if isinstance(o, (set, tuple, list)):
-        return tuple(sorted([make_hash(e) for e in o]))
-    elif not isinstance(o, dict):
-        return hash(o)
 
-    new_o = copy.deepcopy(o)
-    for k, v in new_o.items():
-        new_o[k] = make_hash(v)
+def fingerprint(data, volatile=None):
+    """
+    Makes a hash from a json document, which does not depend on the order
+    of the keys of the dicts nor on the order of the items of the lists.
+    The document is walked once without being copied, skipping the volatile fields.
 
-    return hash(tuple(frozenset(sorted(new_o.items()))))
+    :param data: the json document
+    :param dict volatile: the tree of the volatile fields of the document
+    :rtype: int
+    """
+    if isinstance(data, dict):
+        if volatile:
+            return hash(frozenset((k, fingerprint(v, volatile.get(k)))
+                                  for k, v in data.items() if k not in volatile or volatile[k] is not None))
+        return hash(frozenset((k, fingerprint(v)) for k, v in data.items()))
+    elif isinstance(data, (list, tuple, set)):
+        return hash(tuple(sorted(fingerprint(e, volatile) for e in data)))
+    return hash(data)
 
 
 def _compare_json(first, second):
@@ -104,21 +95,8 @@ def _compare_json(first, second):
     return ordered(first) == ordered(second)
 
 
-def _filter_data(request, data):
-    filtered = data
-    if request is bma.tx.history:
-        filtered = copy.deepcopy(data)
-        filtered["history"].pop("sending")
-        filtered["history"].pop("receiving")
-        filtered["history"].pop("pending")
-    elif request is bma.wot.requirements:
-        filtered = copy.deepcopy(data)
-        for idty in filtered["identities"]:
-            for c in idty["certifications"]:
-                c.pop("expiresIn")
-            idty.pop('membershipPendingExpiresIn')
-
-    return filtered
+def _return_codes(replies):
+    return [r.result().status for r in replies if not r.exception()]
 
 
 def _merge_lookups(answers_data):
@@ -158,64 +136,83 @@ def _best_answer(answers, answers_data, nb_verification):
 class BmaConnector:
     """
     This class is used to access BMA API.
+    All requests go through a pooled session kept alive between calls.
+    Confirmed blocks are served from the local blocks cache when available.
     """
     _nodes_processor = attr.ib()
     _user_parameters = attr.ib()
+    _session_pool = attr.ib(default=attr.Factory(SessionPool))
+    _blocks_processor = attr.ib(default=None)
     _logger = attr.ib(default=attr.Factory(lambda: logging.getLogger('sakia')))
+    _in_flight = attr.ib(default=attr.Factory(dict), init=False)
+    _single_flight_stats = attr.ib(default=attr.Factory(lambda: {'hits': 0, 'misses': 0}), init=False)
+    _background_broadcasts = attr.ib(default=attr.Factory(set), init=False)
 
     async def verified_get(self, currency, request, req_args):
+        """
+        Get data from the network and verify it against multiple nodes.
+        Responses are evaluated as soon as they arrive, and the requests still
+        running are cancelled as soon as enough nodes agree on the answer.
+
+        :param str currency: the currency requested
+        :param class request: A bma request class calling for data
+        :param dict req_args: Arguments to pass to the request constructor
+        :return: The returned data
+        """
         synced_nodes = self._nodes_processor.synced_members_nodes(currency)
         if not synced_nodes:
             # If no node is known as a member, lookup synced nodes as a fallback
             synced_nodes = self._nodes_processor.synced_nodes(currency)
-        nodes_generator = (n for n in synced_nodes)
+        serving = self._nodes_processor.endpoints_index.serving(currency, request)
+        nodes_generator = iter(self._scheduled_nodes([n for n in synced_nodes if n.pubkey in serving]))
         answers = {}
         answers_data = {}
         nb_verification = min(max(1, 0.66 * len(synced_nodes)), 10)
         # We try to find agreeing nodes from one 1 to 66% of nodes, max 10
-        session = aiohttp.ClientSession()
-        filtered_data = {}
+        session = self._session_pool.session()
+        pending = {}
         try:
-            while max([len(nodes) for nodes in answers.values()] + [0]) <= nb_verification:
-                futures = []
-
-                try:
-                    for i in range(0, int(nb_verification)+1):
-                        node = next(nodes_generator)
-                        endpoints = filter_endpoints(request, [node])
-                        endpoint = random.choice(endpoints)
-                        self._logger.debug(
-                            "Requesting {0} on endpoint {1}".format(str(request.__name__), str(endpoint)))
-                        futures.append(request(next(
-                            endpoint.conn_handler(session, proxy=self._user_parameters.proxy())),
-                            **req_args))
-                except StopIteration:
+            while max([len(nodes) for nodes in answers.values()] + [0]) < nb_verification:
+                # Keep nb_verification+1 requests running until the quorum is reached
+                for node in itertools.islice(nodes_generator, max(0, int(nb_verification) + 1 - len(pending))):
+                    endpoints = serving.get(node.pubkey)
+                    if not endpoints:
+                        continue
+                    endpoint = random.choice(endpoints)
+                    self._logger.debug(
+                        "Requesting {0} on endpoint {1}".format(str(request.__name__), str(endpoint)))
+                    future = asyncio.ensure_future(self._node_request(node, request, next(
+                        endpoint.conn_handler(session, proxy=self._user_parameters.proxy())),
+                        req_args))
+                    pending[future] = node
+
+                if not pending:
                     # When no more node is available, we go out of the while loop
                     break
-                finally:
-                    # Everytime we go out of the while loop, we gather the futures
-                    if futures:
-                        responses = await asyncio.gather(*futures, return_exceptions=True)
-                        for r in responses:
-                            if isinstance(r, errors.DuniterError):
-                                if r.ucode == errors.HTTP_LIMITATION:
-                                    self._logger.debug("Exception in responses : " + r.message)
-                                    continue
-                                else:
-                                    data_hash = hash(r.ucode)
-                            elif isinstance(r, BaseException):
-                                self._logger.debug("Exception in responses : " + str(r))
-                                continue
-                            else:
-                                filtered_data = _filter_data(request, r)
-                                data_hash = make_hash(filtered_data)
-                            answers_data[data_hash] = r
-                            if data_hash not in answers:
-                                answers[data_hash] = [node]
-                            else:
-                                answers[data_hash].append(node)
+
+                done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    node = pending.pop(future)
+                    r = future.exception() if future.exception() else future.result()
+                    if isinstance(r, errors.DuniterError):
+                        if r.ucode == errors.HTTP_LIMITATION:
+                            self._logger.debug("Exception in responses : " + r.message)
+                            continue
+                        else:
+                            data_hash = hash(r.ucode)
+                    elif isinstance(r, BaseException):
+                        self._logger.debug("Exception in responses : " + str(r))
+                        continue
+                    else:
+                        data_hash = fingerprint(r, VOLATILE_FIELDS.get(request))
+                    answers_data[data_hash] = r
+                    if data_hash not in answers:
+                        answers[data_hash] = [node]
+                    else:
+                        answers[data_hash].append(node)
         finally:
-            await session.close()
+            for future in pending:
+                future.cancel()
 
         if len(answers_data) > 0:
             if request is bma.wot.lookup:
@@ -226,16 +223,59 @@ class BmaConnector:
         raise NoPeerAvailable("", len(synced_nodes))
 
     async def simple_get(self, currency, request, req_args):
-        endpoints = filter_endpoints(request, self._nodes_processor.synced_nodes(currency))
+        synced_nodes = self._nodes_processor.synced_nodes(currency)
+        serving = self._nodes_processor.endpoints_index.serving(currency, request)
+        nodes = self._scheduled_nodes([n for n in synced_nodes if n.pubkey in serving])
+        return await self._first_answer(nodes, request, req_args, len(synced_nodes))
+
+    async def spread_get(self, currency, request, req_args_list):
+        """
+        Send a request with different arguments to different synced nodes,
+        so that the load is spread across the network instead of being sent to the best node.
+        A request which fails is sent again to the next nodes.
+
+        :param str currency: the currency requested
+        :param class request: A bma request class calling for data
+        :param List[dict] req_args_list: the arguments of each request
+        :return: the returned data, in the order of the arguments
+        :rtype: list
+        """
+        synced_nodes = self._nodes_processor.synced_nodes(currency)
+        serving = self._nodes_processor.endpoints_index.serving(currency, request)
+        nodes = self._scheduled_nodes([n for n in synced_nodes if n.pubkey in serving])
+        requests = []
+        for i, req_args in enumerate(req_args_list):
+            shift = i % len(nodes) if nodes else 0
+            requests.append(self._first_answer(nodes[shift:] + nodes[:shift], request, req_args,
+                                               len(synced_nodes)))
+        return await asyncio.gather(*requests)
+
+    async def _first_answer(self, nodes, request, req_args, nb_synced_nodes):
+        """
+        Send a request to the nodes one after the other, until one of them answers
+        :param List[sakia.data.entities.Node] nodes: the nodes, in the order they are tried
+        :param class request: A bma request class calling for data
+        :param dict req_args: Arguments to pass to the request constructor
+        :param int nb_synced_nodes: the number of synced nodes, to report an error
+        :return: The returned data
+        """
+        nodes = list(nodes)
         tries = 0
-        while tries < 3 and endpoints:
+        while tries < 3 and nodes:
+            node = nodes.pop(0)
+            endpoints = self._nodes_processor.endpoints_index.endpoints(request, node)
+            if not endpoints:
+                # The node was deleted since it was selected
+                continue
             endpoint = random.choice(endpoints)
-            endpoints.remove(endpoint)
             try:
                 self._logger.debug("Requesting {0} on endpoint {1}".format(str(request.__name__), str(endpoint)))
-                async with aiohttp.ClientSession() as session:
-                    json_data = await request(next(endpoint.conn_handler(session), **req_args))
-                    return json_data
+                session = self._session_pool.session()
+                json_data = await self._node_request(node, request,
+                                                     next(endpoint.conn_handler(session,
+                                                                                proxy=self._user_parameters.proxy())),
+                                                     req_args)
+                return json_data
             except errors.DuniterError as e:
                 if e.ucode == errors.HTTP_LIMITATION:
                     self._logger.debug(str(e))
@@ -246,49 +286,175 @@ class BmaConnector:
                     ValueError, jsonschema.ValidationError) as e:
                 self._logger.debug(str(e))
                 tries += 1
-        raise NoPeerAvailable("", len(endpoints))
+        raise NoPeerAvailable("", nb_synced_nodes)
 
-    async def get(self, currency, request, req_args={}, verify=True):
+    def _scheduled_nodes(self, nodes):
+        """
+        Sort the nodes from the best to the worst, skipping the nodes
+        which must not be requested and moving back the ones which are throttled
+        :param List[sakia.data.entities.Node] nodes: the nodes
+        :rtype: List[sakia.data.entities.Node]
+        """
+        return self._nodes_processor.rate_limiter.schedule(self._nodes_processor.scoreboard.rank(nodes))
+
+    async def _node_request(self, node, request, conn_handler, req_args):
+        """
+        Send a request to a node when its rate limitation allows it,
+        and record how it answered in the nodes scoreboard and rate limiter
+        """
+        scoreboard = self._nodes_processor.scoreboard
+        rate_limiter = self._nodes_processor.rate_limiter
+        await rate_limiter.acquire(node)
+        start = time.monotonic()
+        try:
+            data = await request(conn_handler, **req_args)
+        except errors.DuniterError as e:
+            if e.ucode == errors.HTTP_LIMITATION:
+                scoreboard.record_limitation(node)
+                rate_limiter.record_limitation(node)
+            else:
+                scoreboard.record_success(node, time.monotonic() - start)
+                rate_limiter.record_success(node)
+            raise
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            scoreboard.record_error(node)
+            rate_limiter.record_failure(node)
+            raise
+        scoreboard.record_success(node, time.monotonic() - start)
+        rate_limiter.record_success(node)
+        return data
+
+    async def get(self, currency, request, req_args={}, verify=True, cached=True):
         """
         :param str currency: the currency requested
         :param class request: A bma request class calling for data
         :param dict req_args: Arguments to pass to the request constructor
         :param bool verify: Verify returned value against multiple nodes
+        :param bool cached: Serve the blocks deep enough in the blockchain from the local cache
         :return: The returned data
+
+        .. note:: Identical requests sent while a first one is still running
+        share its result instead of being sent again to the network.
+        The returned data is shared between callers and must not be modified.
         """
+        if request is bma.blockchain.block and self._blocks_processor and cached:
+            current_number = self._nodes_processor.current_buid(currency).number
+            block_data = self._blocks_processor.confirmed_block(currency, req_args['number'], current_number)
+            if block_data:
+                return block_data
+
+        key = (currency, request, tuple(sorted(req_args.items())), verify)
+        try:
+            future = self._in_flight[key]
+            self._single_flight_stats['hits'] += 1
+        except KeyError:
+            self._single_flight_stats['misses'] += 1
+            future = asyncio.ensure_future(self._fetch(currency, request, req_args, verify))
+            self._in_flight[key] = future
+            future.add_done_callback(functools.partial(self._release_in_flight, key))
+        # A cancelled caller must not cancel the request awaited by the others
+        return await asyncio.shield(future)
+
+    async def _fetch(self, currency, request, req_args, verify):
         if verify:
-            return await self.verified_get(currency, request, req_args)
+            data = await self.verified_get(currency, request, req_args)
         else:
-            return await self.simple_get(currency, request, req_args)
+            data = await self.simple_get(currency, request, req_args)
+        if request is bma.blockchain.block and self._blocks_processor and data:
+            current_number = self._nodes_processor.current_buid(currency).number
+            self._blocks_processor.cache_block(currency, data, current_number)
+        return data
+
+    def _release_in_flight(self, key, future):
+        self._in_flight.pop(key, None)
+        if not future.cancelled():
+            # The error is raised to the callers through the shield,
+            # it must not be reported again if they were all cancelled
+            future.exception()
+
+    def single_flight_stats(self):
+        """
+        Get the number of requests which were coalesced with an identical
+        request in flight (hits) and of requests really sent (misses)
+        :rtype: dict
+        """
+        return dict(self._single_flight_stats)
 
-    async def broadcast(self, currency, request, req_args={}):
+    async def broadcast(self, currency, request, req_args={}, on_completed=None):
         """
         Broadcast data to a network.
-        Sends the data to all knew nodes.
+        Sends the data to the best known nodes.
 
         :param str currency: the currency target
         :param request: A duniterpy bma request class
         :param req_args: Arguments to pass to the request constructor
-        :return: All nodes replies
+        :param function on_completed: called with the return codes of all the nodes
+         once they all answered
+        :return: The nodes replies received until a node accepted the data
         :rtype: tuple of aiohttp replies
 
         .. note:: If one node accept the requests (returns 200),
         the broadcast should be considered accepted by the network.
+        The broadcast returns as soon as a node accepts it,
+        the other replies are received in the background.
         """
-        filtered_endpoints = filter_endpoints(request, self._nodes_processor.synced_nodes(currency))
-        endpoints = random.sample(filtered_endpoints, 6) if len(filtered_endpoints) > 6 else filtered_endpoints
+        synced_nodes = self._nodes_processor.synced_nodes(currency)
+        serving = self._nodes_processor.endpoints_index.serving(currency, request)
+        nodes = self._scheduled_nodes([n for n in synced_nodes if n.pubkey in serving])[:6]
         replies = []
 
-        if len(endpoints) > 0:
-            with aiohttp.ClientSession() as session:
-                for endpoint in endpoints:
-                    self._logger.debug("Trying to connect to : " + str(endpoint))
-                    reply = asyncio.ensure_future(request(next(endpoint.conn_handler(session,
-                                                                                proxy=self._user_parameters.proxy())),
-                                                          **req_args))
-                    replies.append(reply)
-
-                result = await asyncio.gather(*replies, return_exceptions=True)
-                return tuple(result)
+        if len(nodes) > 0:
+            session = self._session_pool.session()
+            for node in nodes:
+                endpoint = random.choice(serving[node.pubkey])
+                self._logger.debug("Trying to connect to : " + str(endpoint))
+                reply = asyncio.ensure_future(self._node_request(node, request,
+                                                                 next(endpoint.conn_handler(session,
+                                                                      proxy=self._user_parameters.proxy())),
+                                                                 req_args))
+                replies.append(reply)
+
+            pending = set(replies)
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    if any(not r.exception() and r.result().status == 200 for r in done):
+                        break
+            except asyncio.CancelledError:
+                for reply in replies:
+                    reply.cancel()
+                raise
+
+            if pending:
+                task = asyncio.ensure_future(self._complete_broadcast(request, replies, pending, on_completed))
+                self._background_broadcasts.add(task)
+                task.add_done_callback(self._background_broadcasts.discard)
+            elif on_completed:
+                on_completed(_return_codes(replies))
+            return tuple(r.exception() if r.exception() else r.result() for r in replies if r.done())
         else:
-            raise NoPeerAvailable("", len(endpoints))
+            raise NoPeerAvailable("", len(nodes))
+
+    async def _complete_broadcast(self, request, replies, pending, on_completed):
+        """
+        Wait for the replies of a broadcast already accepted by a node
+        """
+        await asyncio.wait(pending)
+        for reply in pending:
+            if reply.exception():
+                self._logger.debug("Broadcast {0} : {1}".format(request.__name__, str(reply.exception())))
+            else:
+                self._logger.debug("Broadcast {0} : {1}".format(request.__name__, reply.result().status))
+                await reply.result().release()
+        if on_completed:
+            on_completed(_return_codes(replies))
+
+    async def close(self):
+        """
+        Close the pooled session used by this connector
+        """
+        for task in list(self._background_broadcasts):
+            task.cancel()
+        await self._session_pool.close()
@@ -0,0 +1,134 @@
+import attr
+import functools
+from duniterpy.api import bma
+from duniterpy.documents import BMAEndpoint, SecuredBMAEndpoint
+from pkg_resources import parse_version
+
+# The minimal version of duniter serving a request.
+# The requests which are not listed are served by all the versions.
+REQUIRED_VERSIONS = {
+    bma.ud.history: "0.11.0",
+    bma.tx.history: "0.11.0",
+    bma.blockchain.membership: "0.14"
+}
+
+
+@functools.lru_cache(maxsize=128)
+def node_capabilities(version):
+    """
+    Get the requests with a required version served by a version of duniter.
+    A node which version is unknown is considered to serve all the requests.
+
+    :param str version: the version of duniter
+    :rtype: frozenset
+    """
+    if not version:
+        return frozenset(REQUIRED_VERSIONS)
+    capabilities = set()
+    for request, required in REQUIRED_VERSIONS.items():
+        try:
+            if parse_version(version) >= parse_version(required):
+                capabilities.add(request)
+        except TypeError:
+            pass
+    return frozenset(capabilities)
+
+
+def bma_endpoints(node):
+    """
+    Get the BMA endpoints of a node
+    :param sakia.data.entities.Node node: the node
+    :rtype: tuple
+    """
+    return tuple(e for e in node.endpoints if type(e) in (BMAEndpoint, SecuredBMAEndpoint))
+
+
+@attr.s(frozen=True)
+class IndexedNode:
+    """
+    The capabilities and the BMA endpoints of a node,
+    computed from its version and its endpoints
+
+    :param str version: the version of the node
+    :param tuple endpoints: the endpoints of the node
+    :param frozenset capabilities: the requests with a required version served by the node
+    :param tuple bma_endpoints: the BMA endpoints of the node
+    """
+    version = attr.ib()
+    endpoints = attr.ib()
+    capabilities = attr.ib()
+    bma_endpoints = attr.ib()
+
+
+def capability(request):
+    """
+    Get the key of the nodes serving a request in the index:
+    the request itself if it requires a version, None if it is served by all the versions
+    :param class request: the bma request
+    """
+    return request if request in REQUIRED_VERSIONS else None
+
+
+@attr.s()
+class EndpointsIndex:
+    """
+    The BMA endpoints of the nodes, indexed by the requests they serve.
+    The capabilities of a node are computed once when its version is learned,
+    and the node is indexed under each of them, so that selecting the nodes
+    and the endpoints serving a request is a lookup.
+    The index is kept up to date by the nodes processor when the nodes are updated or deleted.
+    """
+    _nodes = attr.ib(default=attr.Factory(dict), init=False)
+    _serving = attr.ib(default=attr.Factory(dict), init=False)
+
+    def update(self, node):
+        """
+        Index the current version and endpoints of a node
+        :param sakia.data.entities.Node node: the node
+        :rtype: IndexedNode
+        """
+        key = (node.currency, node.pubkey)
+        indexed = self._nodes.get(key)
+        if indexed is not None and indexed.version == node.version and indexed.endpoints is node.endpoints:
+            return indexed
+        if indexed is None or indexed.version != node.version:
+            capabilities = node_capabilities(node.version)
+        else:
+            capabilities = indexed.capabilities
+        self.remove(node)
+        indexed = IndexedNode(node.version, node.endpoints, capabilities, bma_endpoints(node))
+        self._nodes[key] = indexed
+        if indexed.bma_endpoints:
+            for c in indexed.capabilities | {None}:
+                self._serving.setdefault((node.currency, c), {})[node.pubkey] = indexed.bma_endpoints
+        return indexed
+
+    def remove(self, node):
+        """
+        Stop indexing a node
+        :param sakia.data.entities.Node node: the node
+        """
+        indexed = self._nodes.pop((node.currency, node.pubkey), None)
+        if indexed is not None:
+            for c in indexed.capabilities | {None}:
+                self._serving.get((node.currency, c), {}).pop(node.pubkey, None)
+
+    def serving(self, currency, request):
+        """
+        Get the nodes serving a request
+        :param str currency: the currency of the nodes
+        :param class request: the bma request
+        :return: the BMA endpoints of the nodes, by pubkey
+        :rtype: dict
+        """
+        return self._serving.get((currency, capability(request)), {})
+
+    def endpoints(self, request, node):
+        """
+        Get the BMA endpoints of a node serving a request
+        :param class request: the bma request
+        :param sakia.data.entities.Node node: the node
+        :return: the endpoints, empty if the node does not serve the request or is not indexed
+        :rtype: tuple
+        """
+        return self.serving(node.currency, request).get(node.pubkey, ())
@@ -0,0 +1,97 @@
+import attr
+from collections import OrderedDict
+from duniterpy.documents import BlockUID
+
+
+@attr.s(frozen=True)
+class BlockHeader:
+    """
+    The header of a block, enough to follow the chain of blocks
+
+    :param int number: the number of the block
+    :param str hash: the hash of the block
+    :param str previous_hash: the hash of the previous block
+    :param int median_time: the median time of the block
+    """
+    number = attr.ib()
+    hash = attr.ib()
+    previous_hash = attr.ib()
+    median_time = attr.ib()
+
+
+@attr.s()
+class BlockHeadersCache:
+    """
+    The headers of the blocks received from the nodes of a currency,
+    shared by the node connectors so that each header is requested once.
+
+    The headers are stored by hash, so that the blocks of different forks never mix up :
+    the ancestor of a block is found by following the previous hashes from this block,
+    and is the one of the node which sent this block.
+
+    :param int max_headers: the maximum number of headers kept in memory
+    """
+    max_headers = attr.ib(default=1000)
+    _headers = attr.ib(default=attr.Factory(OrderedDict), init=False)
+    _ancestors = attr.ib(default=attr.Factory(OrderedDict), init=False)
+    _hits = attr.ib(default=0, init=False)
+    _misses = attr.ib(default=0, init=False)
+
+    @staticmethod
+    def _bounded(cache, key, value, max_size):
+        cache[key] = value
+        if len(cache) > max_size:
+            cache.popitem(last=False)
+
+    def add(self, block_data):
+        """
+        Store the header of a block
+        :param dict block_data: the block data in json format
+        """
+        header = BlockHeader(block_data['number'], block_data['hash'],
+                             block_data.get('previousHash'), block_data.get('medianTime'))
+        self._bounded(self._headers, header.hash, header, self.max_headers)
+
+    def add_ancestor(self, block_hash, ancestor_data):
+        """
+        Store a block requested as the ancestor of another block
+        :param str block_hash: the hash of the descendant block
+        :param dict ancestor_data: the ancestor block data in json format
+        """
+        self.add(ancestor_data)
+        self._bounded(self._ancestors, (block_hash, ancestor_data['number']),
+                      BlockUID(ancestor_data['number'], ancestor_data['hash']), self.max_headers)
+
+    def ancestor(self, block_hash, number):
+        """
+        Find the block of the given number in the chain ending with a block
+        :param str block_hash: the hash of the last block of the chain
+        :param int number: the number of the block to find
+        :return: the block found, None if it is not known
+        :rtype: duniterpy.documents.BlockUID
+        """
+        found = self._ancestors.get((block_hash, number))
+        if not found:
+            header = self._headers.get(block_hash)
+            while header and header.number > number:
+                if header.number == number + 1 and header.previous_hash:
+                    found = BlockUID(number, header.previous_hash)
+                    break
+                header = self._headers.get(header.previous_hash)
+            else:
+                if header and header.number == number:
+                    found = BlockUID(number, header.hash)
+        if found:
+            self._hits += 1
+        else:
+            self._misses += 1
+        return found
+
+    def stats(self):
+        """
+        Get the monitoring data of the cache
+        :rtype: dict
+        """
+        return {'headers': len(self._headers),
+                'hits': self._hits,
+                'misses': self._misses}
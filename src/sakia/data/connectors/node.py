@@ -25,10 +25,23 @@ class NodeConnector(QObject):
     error = pyqtSignal()
     identity_changed = pyqtSignal()
     neighbour_found = pyqtSignal(Peer)
+    max_concurrent_leaves = 8
+    # The block and peer websockets held open on each node
+    websockets_per_node = 2
 
-    def __init__(self, node, user_parameters, session=None):
+    def __init__(self, node, user_parameters, session=None, scoreboard=None, rate_limiter=None, session_pool=None,
+                 headers_cache=None, seen_messages=None):
         """
         Constructor
+
+        :param sakia.data.entities.Node node: the node
+        :param sakia.data.entities.UserParameters user_parameters: the user parameters
+        :param aiohttp.ClientSession session: the session used to request the node
+        :param sakia.data.connectors.NodesScoreboard scoreboard: the scoreboard fed with the requests made
+        :param sakia.data.connectors.NodesRateLimiter rate_limiter: the rate limiter throttling the requests made
+        :param sakia.data.connectors.SessionPool session_pool: the pool of connections shared between connectors
+        :param sakia.data.connectors.BlockHeadersCache headers_cache: the headers of blocks shared between connectors
+        :param sakia.data.connectors.SeenMessages seen_messages: the websocket messages shared between connectors
         """
         super().__init__()
         self.node = node
@@ -38,6 +51,12 @@ class NodeConnector(QObject):
                     'peer': False}
         self._user_parameters = user_parameters
         self.session = session
+        self._scoreboard = scoreboard
+        self._rate_limiter = rate_limiter
+        self._session_pool = session_pool
+        self._headers_cache = headers_cache
+        self._seen_messages = seen_messages
+        self.websockets_enabled = True
         self._logger = logging.getLogger('sakia')
 
     def __del__(self):
@@ -75,12 +94,18 @@ class NodeConnector(QObject):
         return cls(node, user_parameters, session=session)
 
     @classmethod
-    def from_peer(cls, currency, peer, user_parameters):
+    def from_peer(cls, currency, peer, user_parameters, scoreboard=None, rate_limiter=None, session_pool=None,
+                  headers_cache=None, seen_messages=None):
         """
         Factory method to get a node from a peer document.
         :param str currency: The node currency. None if we don't know\
          the currency it should have, for example if its the first one we add
         :param peer: The peer document
+        :param sakia.data.connectors.NodesScoreboard scoreboard: the scoreboard fed with the requests made
+        :param sakia.data.connectors.NodesRateLimiter rate_limiter: the rate limiter throttling the requests made
+        :param sakia.data.connectors.SessionPool session_pool: the pool of connections shared between connectors
+        :param sakia.data.connectors.BlockHeadersCache headers_cache: the headers of blocks shared between connectors
+        :param sakia.data.connectors.SeenMessages seen_messages: the websocket messages shared between connectors
         :return: A new node
         :rtype: sakia.core.net.Node
         """
@@ -90,23 +115,53 @@ class NodeConnector(QObject):
         node = Node(peer.currency, peer.pubkey, peer.endpoints, peer.blockUID)
         logging.getLogger('sakia').debug("Node from peer : {:}".format(str(node)))
 
-        return cls(node, user_parameters, session=None)
+        return cls(node, user_parameters, session=None, scoreboard=scoreboard, rate_limiter=rate_limiter,
+                   session_pool=session_pool, headers_cache=headers_cache, seen_messages=seen_messages)
 
     async def safe_request(self, endpoint, request, proxy, req_args={}):
+        if self._rate_limiter:
+            await self._rate_limiter.acquire(self.node)
+        start = time.monotonic()
         try:
             conn_handler = next(endpoint.conn_handler(self.session, proxy=proxy))
             data = await request(conn_handler, **req_args)
+            self._record_success(start)
             return data
+        except errors.DuniterError as e:
+            if e.ucode == errors.HTTP_LIMITATION:
+                if self._scoreboard:
+                    self._scoreboard.record_limitation(self.node)
+                if self._rate_limiter:
+                    self._rate_limiter.record_limitation(self.node)
+            else:
+                self._record_success(start)
+            raise
         except (ClientError, gaierror, TimeoutError, ConnectionRefusedError, ValueError) as e:
             self._logger.debug("{0} : {1}".format(str(e), self.node.pubkey[:5]))
+            self._record_error()
             self.change_state_and_emit(Node.OFFLINE)
         except jsonschema.ValidationError as e:
             self._logger.debug(str(e))
             self._logger.debug("Validation error : {0}".format(self.node.pubkey[:5]))
+            self._record_error()
             self.change_state_and_emit(Node.CORRUPTED)
 
+    def _record_success(self, start):
+        if self._scoreboard:
+            self._scoreboard.record_success(self.node, time.monotonic() - start)
+        if self._rate_limiter:
+            self._rate_limiter.record_success(self.node)
+
+    def _record_error(self):
+        if self._scoreboard:
+            self._scoreboard.record_error(self.node)
+        if self._rate_limiter:
+            self._rate_limiter.record_failure(self.node)
+
     async def init_session(self):
-        if not self.session:
+        if self._session_pool:
+            self.session = self._session_pool.session()
+        elif not self.session:
             self.session = aiohttp.ClientSession()
 
     async def close_ws(self):
@@ -122,7 +177,9 @@ class NodeConnector(QObject):
             else:
                 closed = True
             await asyncio.sleep(0)
-        await self.session.close()
+        # The shared session is closed by the owner of the pool
+        if self.session and not self._session_pool:
+            await self.session.close()
         await asyncio.sleep(0)
 
     def refresh(self, manual=False):
@@ -130,15 +187,55 @@ class NodeConnector(QObject):
         Refresh all data of this node
         :param bool manual: True if the refresh was manually initiated
         """
-        if not self._ws_tasks['block']:
-            self._ws_tasks['block'] = asyncio.ensure_future(self.connect_current_block())
+        if self.websockets_enabled:
+            if not self._ws_tasks['block']:
+                self._ws_tasks['block'] = asyncio.ensure_future(self.connect_current_block())
 
-        if not self._ws_tasks['peer']:
-            self._ws_tasks['peer'] = asyncio.ensure_future(self.connect_peers())
+            if not self._ws_tasks['peer']:
+                self._ws_tasks['peer'] = asyncio.ensure_future(self.connect_peers())
 
         if manual:
             asyncio.ensure_future(self.request_peers())
 
+    def enable_websockets(self, enabled):
+        """
+        Subscribe to the websockets of this node, or close them
+        to get the node data by polling its HTTP GET interface.
+        :param bool enabled: True to subscribe to the websockets
+        """
+        if self.websockets_enabled == enabled:
+            return
+        self._logger.debug("{0} websockets : {1}".format("Enable" if enabled else "Disable",
+                                                          self.node.pubkey[:5]))
+        self.websockets_enabled = enabled
+        if enabled:
+            if self.session:
+                self.refresh()
+        else:
+            for name, ws in self._ws_tasks.items():
+                if ws:
+                    ws.cancel()
+                    self._ws_tasks[name] = None
+
+    async def poll(self):
+        """
+        Poll this node.
+        When the block websocket is down, the current block is requested on HTTP GET
+        and the websockets are connected again only if the node answered.
+        When the websockets are disabled, the peers are requested on HTTP GET too.
+        """
+        await self.init_session()
+        if self.websockets_enabled and self._ws_tasks['block']:
+            self.refresh()
+            return
+        await self.request_current_block()
+        if self.node.state in (Node.OFFLINE, Node.CORRUPTED):
+            return
+        if self.websockets_enabled:
+            self.refresh()
+        else:
+            await self.request_peers()
+
     async def connect_current_block(self):
         """
         Connects to the websocket entry point of the node
@@ -156,7 +253,7 @@ class NodeConnector(QObject):
                         async for msg in ws:
                             if msg.tp == aiohttp.WSMsgType.TEXT:
                                 self._logger.debug("Received a block : {0}".format(self.node.pubkey[:5]))
-                                block_data = bma.parse_text(msg.data, bma.ws.WS_BLOCk_SCHEMA)
+                                block_data, _ = self.parse_ws_message('block', msg.data, bma.ws.WS_BLOCk_SCHEMA)
                                 await self.refresh_block(block_data)
                             elif msg.tp == aiohttp.WSMsgType.CLOSED:
                                 break
@@ -177,6 +274,20 @@ class NodeConnector(QObject):
                     self._connected['block'] = False
                     self._ws_tasks['block'] = None
 
+    def parse_ws_message(self, kind, text, schema):
+        """
+        Parse a websocket message.
+        The messages already received from other nodes are not validated again.
+        :param str kind: the kind of message, 'block' or 'peer'
+        :param str text: the message
+        :param dict schema: the json schema of the message
+        :return: the json data, and True if it was already received
+        :rtype: Tuple[dict, bool]
+        """
+        if self._seen_messages:
+            return self._seen_messages.parse(kind, text, schema)
+        return bma.parse_text(text, schema), False
+
     async def request_current_block(self):
         """
         Request a node on the HTTP GET interface
@@ -203,10 +314,20 @@ class NodeConnector(QObject):
 
     async def refresh_block(self, block_data):
         """
-        Refresh the blocks of this node
+        Refresh the blocks of this node.
+        The previous block of the node is looked up in the shared headers cache
+        before being requested to the node.
         :param dict block_data: The block data in json format
         """
         if not self.node.current_buid or self.node.current_buid.sha_hash != block_data['hash']:
+            if self._headers_cache and self.node.current_buid:
+                self._headers_cache.add(block_data)
+                previous_buid = self._headers_cache.ancestor(block_data['hash'], self.node.current_buid.number)
+                if previous_buid:
+                    self.node.previous_buid = previous_buid
+                    self._change_current_block(block_data)
+                    return
+
             for endpoint in [e for e in self.node.endpoints if isinstance(e, BMAEndpoint)]:
                 conn_handler = next(endpoint.conn_handler(self.session,
                                                      proxy=self._user_parameters.proxy()))
@@ -218,6 +339,8 @@ class NodeConnector(QObject):
                     if not previous_block:
                         continue
                     self.node.previous_buid = BlockUID(previous_block['number'], previous_block['hash'])
+                    if self._headers_cache:
+                        self._headers_cache.add_ancestor(block_data['hash'], previous_block)
                     break  # Do not try any more endpoint
                 except errors.DuniterError as e:
                     if e.ucode == errors.BLOCK_NOT_FOUND:
@@ -230,18 +353,21 @@ class NodeConnector(QObject):
 
                     self._logger.debug("Error in previous block reply of {0} : {1}".format(self.node.pubkey[:5], str(e)))
                 finally:
-                    if self.node.current_buid != BlockUID(block_data['number'], block_data['hash']):
-                        self.node.current_buid = BlockUID(block_data['number'], block_data['hash'])
-                        self.node.current_ts = block_data['medianTime']
-                        self._logger.debug("Changed block {0} -> {1}".format(self.node.current_buid.number,
-                                                                        block_data['number']))
-                        self.changed.emit()
+                    self._change_current_block(block_data)
             else:
                 self._logger.debug("Could not connect to any BMA endpoint : {0}".format(self.node.pubkey[:5]))
                 self.change_state_and_emit(Node.OFFLINE)
         else:
             self.change_state_and_emit(Node.ONLINE)
 
+    def _change_current_block(self, block_data):
+        if self.node.current_buid != BlockUID(block_data['number'], block_data['hash']):
+            self._logger.debug("Changed block {0} -> {1}".format(self.node.current_buid.number,
+                                                                 block_data['number']))
+            self.node.current_buid = BlockUID(block_data['number'], block_data['hash'])
+            self.node.current_ts = block_data['medianTime']
+            self.changed.emit()
+
     @asyncify
     async def refresh_summary(self):
         """
@@ -282,8 +408,9 @@ class NodeConnector(QObject):
                         async for msg in ws:
                             if msg.tp == aiohttp.WSMsgType.TEXT:
                                 self._logger.debug("Received a peer : {0}".format(self.node.pubkey[:5]))
-                                peer_data = bma.parse_text(msg.data, bma.ws.WS_PEER_SCHEMA)
-                                self.refresh_peer_data(peer_data)
+                                peer_data, seen = self.parse_ws_message('peer', msg.data, bma.ws.WS_PEER_SCHEMA)
+                                if not seen:
+                                    self.refresh_peer_data(peer_data)
                             elif msg.tp == aiohttp.WSMsgType.CLOSED:
                                 break
                             elif msg.tp == aiohttp.WSMsgType.ERROR:
@@ -316,23 +443,9 @@ class NodeConnector(QObject):
                     continue
                 self.node.state = Node.ONLINE
                 if peers_data['root'] != self.node.merkle_peers_root:
-                    leaves = [leaf for leaf in peers_data['leaves']
-                              if leaf not in self.node.merkle_peers_leaves]
-                    for leaf_hash in leaves:
-                        try:
-                            leaf_data = await self.safe_request(endpoint,
-                                                                bma.network.peers,
-                                                                proxy=self._user_parameters.proxy(),
-                                                                req_args={'leaf': leaf_hash})
-                            if not leaf_data:
-                                break
-                            self.refresh_peer_data(leaf_data['leaf']['value'])
-                        except (AttributeError, ValueError, errors.DuniterError) as e:
-                            self._logger.debug("{pubkey} : Incorrect peer data in {leaf}"
-                                          .format(pubkey=self.node.pubkey[:5],
-                                                  leaf=leaf_hash))
-                            self.change_state_and_emit(Node.OFFLINE)
-                    else:
+                    known_leaves = set(self.node.merkle_peers_leaves)
+                    leaves = [leaf for leaf in peers_data['leaves'] if leaf not in known_leaves]
+                    if await self.request_leaves(endpoint, leaves):
                         self.node.merkle_peers_root = peers_data['root']
                         self.node.merkle_peers_leaves = tuple(peers_data['leaves'])
                 return  # Break endpoints loop
@@ -343,6 +456,53 @@ class NodeConnector(QObject):
             self._logger.debug("Could not connect to any BMA endpoint : {0}".format(self.node.pubkey[:5]))
             self.change_state_and_emit(Node.OFFLINE)
 
+    def leaves_concurrency(self):
+        """
+        Get the number of merkle leaves requested at the same time.
+        It is max_concurrent_leaves, within the connections to the node
+        that the shared pool leaves once the websockets are opened.
+        :rtype: int
+        """
+        if self._session_pool:
+            available = self._session_pool.limit_per_host - self.websockets_per_node
+            return max(1, min(self.max_concurrent_leaves, available))
+        return self.max_concurrent_leaves
+
+    async def request_leaves(self, endpoint, leaves):
+        """
+        Request the peers documents of merkle leaves,
+        at most leaves_concurrency() at the same time
+        :param duniterpy.documents.BMAEndpoint endpoint: the endpoint requested
+        :param List[str] leaves: the hashes of the leaves
+        :return: False if the node stopped answering
+        :rtype: bool
+        """
+        semaphore = asyncio.Semaphore(self.leaves_concurrency())
+        reachable = True
+
+        async def request_leaf(leaf_hash):
+            nonlocal reachable
+            async with semaphore:
+                if not reachable:
+                    return
+                try:
+                    leaf_data = await self.safe_request(endpoint,
+                                                        bma.network.peers,
+                                                        proxy=self._user_parameters.proxy(),
+                                                        req_args={'leaf': leaf_hash})
+                    if not leaf_data:
+                        reachable = False
+                        return
+                    self.refresh_peer_data(leaf_data['leaf']['value'])
+                except (AttributeError, ValueError, errors.DuniterError) as e:
+                    self._logger.debug("{pubkey} : Incorrect peer data in {leaf}"
+                                       .format(pubkey=self.node.pubkey[:5],
+                                               leaf=leaf_hash))
+                    self.change_state_and_emit(Node.OFFLINE)
+
+        await asyncio.gather(*[request_leaf(leaf_hash) for leaf_hash in leaves])
+        return reachable
+
     def refresh_peer_data(self, peer_data):
         if "raw" in peer_data:
             try:
@@ -0,0 +1,140 @@
+import asyncio
+import attr
+import logging
+import time
+
+
+@attr.s()
+class NodeThrottle:
+    """
+    The rate limitation state of a node
+
+    :param float tokens: the number of requests which can be sent right now, negative if requests are queued
+    :param float updated: the time the tokens were last computed
+    :param int failures: the number of consecutive failed requests
+    :param int state: the state of the circuit breaker
+    :param float opened_at: the time the circuit breaker was opened, or the time of the probe when half opened
+    """
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+    tokens = attr.ib()
+    updated = attr.ib()
+    failures = attr.ib(default=0)
+    state = attr.ib(default=CLOSED)
+    opened_at = attr.ib(default=0.)
+
+
+@attr.s()
+class NodesRateLimiter:
+    """
+    Spreads the requests over the nodes.
+    Each node has a token bucket limiting the rate of the requests sent to it,
+    and a circuit breaker which stops sending requests to a node after too many failures.
+    After a while, a single request is let through to probe the node again.
+
+    :param float rate: the number of requests per second allowed on a node
+    :param float burst: the number of requests which can be sent at once to a node
+    :param int failures_threshold: the number of consecutive failures opening the circuit breaker
+    :param float reset_timeout: the number of seconds before probing a node again
+    """
+    rate = attr.ib(default=10.)
+    burst = attr.ib(default=20.)
+    failures_threshold = attr.ib(default=5)
+    reset_timeout = attr.ib(default=30.)
+    _throttles = attr.ib(default=attr.Factory(dict), init=False)
+    _logger = attr.ib(default=attr.Factory(lambda: logging.getLogger('sakia')))
+
+    def _throttle(self, node):
+        key = (node.currency, node.pubkey)
+        if key not in self._throttles:
+            self._throttles[key] = NodeThrottle(self.burst, time.monotonic())
+        throttle = self._throttles[key]
+        now = time.monotonic()
+        throttle.tokens = min(self.burst, throttle.tokens + (now - throttle.updated) * self.rate)
+        throttle.updated = now
+        return throttle
+
+    def allows(self, node):
+        """
+        Check if the circuit breaker of a node lets requests through.
+        A node whose circuit breaker is open is allowed a probe after the reset timeout.
+        :param sakia.data.entities.Node node: the node
+        :rtype: bool
+        """
+        throttle = self._throttle(node)
+        if throttle.state == NodeThrottle.CLOSED:
+            return True
+        return throttle.opened_at + self.reset_timeout <= time.monotonic()
+
+    def delay(self, node):
+        """
+        The time to wait before a request can be sent to a node
+        :param sakia.data.entities.Node node: the node
+        :rtype: float
+        """
+        throttle = self._throttle(node)
+        if throttle.tokens >= 1:
+            return 0
+        return (1 - throttle.tokens) / self.rate
+
+    def schedule(self, nodes):
+        """
+        Remove the nodes whose circuit breaker is open, and move the nodes
+        which can be requested right away before the other ones.
+        The order of the nodes is kept otherwise.
+
+        :param List[sakia.data.entities.Node] nodes: the nodes
+        :rtype: List[sakia.data.entities.Node]
+        """
+        return sorted([n for n in nodes if self.allows(n)], key=lambda n: self.delay(n) > 0)
+
+    async def acquire(self, node):
+        """
+        Wait until a request can be sent to a node.
+        The circuit breaker of the node is half opened if the request is its probe.
+        :param sakia.data.entities.Node node: the node
+        """
+        throttle = self._throttle(node)
+        if throttle.state != NodeThrottle.CLOSED and self.allows(node):
+            # The request is the probe of the node, the next one is sent after the reset timeout
+            self._logger.debug("Probing node {0}".format(node.pubkey[:5]))
+            throttle.state = NodeThrottle.HALF_OPEN
+            throttle.opened_at = time.monotonic()
+        delay = self.delay(node)
+        throttle.tokens -= 1
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def record_success(self, node):
+        """
+        Record a request answered by a node
+        :param sakia.data.entities.Node node: the node
+        """
+        throttle = self._throttle(node)
+        throttle.failures = 0
+        throttle.state = NodeThrottle.CLOSED
+
+    def record_failure(self, node):
+        """
+        Record a request which failed on a node
+        :param sakia.data.entities.Node node: the node
+        """
+        throttle = self._throttle(node)
+        throttle.failures += 1
+        if throttle.state == NodeThrottle.HALF_OPEN or throttle.failures >= self.failures_threshold:
+            if throttle.state != NodeThrottle.OPEN:
+                self._logger.debug("Stop requesting node {0}".format(node.pubkey[:5]))
+            throttle.state = NodeThrottle.OPEN
+            throttle.opened_at = time.monotonic()
+
+    def record_limitation(self, node):
+        """
+        Record a request refused by the rate limitation of a node.
+        The requests queued on this node are delayed.
+        :param sakia.data.entities.Node node: the node
+        """
+        throttle = self._throttle(node)
+        throttle.tokens = min(throttle.tokens, 0)
+        self.record_failure(node)
@@ -0,0 +1,114 @@
+import attr
+import random
+
+
+@attr.s()
+class NodeScore:
+    """
+    The measured quality of a node
+
+    :param float latency: the moving average of the latency of the node, in seconds
+    :param float error_rate: the moving average of the rate of failed requests
+    :param int limitations: the number of requests refused because of the node rate limitation
+    """
+    latency = attr.ib(default=0.)
+    error_rate = attr.ib(default=0.)
+    limitations = attr.ib(default=0)
+
+    def known(self):
+        return self.latency > 0 or self.error_rate > 0
+
+
+@attr.s()
+class NodesScoreboard:
+    """
+    Scores the nodes from the requests sent to them,
+    to send the next requests to the fastest and most reliable nodes.
+
+    :param float alpha: the weight of the last measure in the moving averages
+    :param float error_penalty: the latency, in seconds, added to a node always failing
+    :param float exploration: the probability to try a node which is not among the best ones
+    """
+    alpha = attr.ib(default=0.2)
+    error_penalty = attr.ib(default=10.)
+    exploration = attr.ib(default=0.1)
+    _scores = attr.ib(default=attr.Factory(dict), init=False)
+
+    def score(self, node):
+        """
+        Get the score of a node.
+        An unknown node is initialized from the score saved in its entity.
+
+        :param sakia.data.entities.Node node: the node
+        :rtype: NodeScore
+        """
+        key = (node.currency, node.pubkey)
+        if key not in self._scores:
+            self._scores[key] = NodeScore(node.latency, node.error_rate, node.limitations)
+        return self._scores[key]
+
+    def record_success(self, node, latency):
+        """
+        Record a request answered by a node
+        :param sakia.data.entities.Node node: the node
+        :param float latency: the time the node took to answer, in seconds
+        """
+        score = self.score(node)
+        if score.known():
+            score.latency += self.alpha * (latency - score.latency)
+        else:
+            score.latency = latency
+        score.error_rate -= self.alpha * score.error_rate
+
+    def record_error(self, node):
+        """
+        Record a request which failed on a node
+        :param sakia.data.entities.Node node: the node
+        """
+        score = self.score(node)
+        score.error_rate += self.alpha * (1 - score.error_rate)
+
+    def record_limitation(self, node):
+        """
+        Record a request refused by the rate limitation of a node
+        :param sakia.data.entities.Node node: the node
+        """
+        self.score(node).limitations += 1
+        self.record_error(node)
+
+    def cost(self, node):
+        """
+        The expected cost of a request sent to a node.
+        Nodes never requested cost nothing, so that they get tried.
+
+        :param sakia.data.entities.Node node: the node
+        :rtype: float
+        """
+        score = self.score(node)
+        return score.latency + score.error_rate * self.error_penalty
+
+    def rank(self, nodes):
+        """
+        Sort nodes from the best to the worst.
+        From time to time, a node which is not the best one is moved
+        in first position to keep measuring it.
+
+        :param List[sakia.data.entities.Node] nodes: the nodes to rank
+        :rtype: List[sakia.data.entities.Node]
+        """
+        ranked = sorted(nodes, key=self.cost)
+        if len(ranked) > 1 and random.random() < self.exploration:
+            explored = random.choice(ranked[1:])
+            ranked.remove(explored)
+            ranked.insert(0, explored)
+        return ranked
+
+    def store(self, node):
+        """
+        Copy the score of a node in its entity, to save it
+        :param sakia.data.entities.Node node: the node
+        """
+        score = self.score(node)
+        node.latency = score.latency
+        node.error_rate = score.error_rate
+        node.limitations = score.limitations
@@ -0,0 +1,88 @@
+import attr
+import hashlib
+import json
+import jsonschema
+import time
+from collections import Counter, OrderedDict
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+
+@attr.s()
+class SeenMessages:
+    """
+    The websocket messages recently received from the nodes, shared by the node connectors.
+    All the nodes send the same new blocks and peers : a message already received
+    from another node is recognized before being validated against its json schema,
+    and the data validated the first time is reused.
+    The messages are recognized from a digest of their whole content, and remembered
+    only once validated, so that a wrong copy cannot be taken for the right one.
+
+    :param float ttl: the number of seconds a message is remembered
+    :param int max_messages: the maximum number of messages remembered
+    """
+    ttl = attr.ib(default=300.)
+    max_messages = attr.ib(default=10000)
+    _messages = attr.ib(default=attr.Factory(OrderedDict), init=False)
+    _received = attr.ib(default=attr.Factory(Counter), init=False)
+    _duplicates = attr.ib(default=attr.Factory(Counter), init=False)
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._messages:
+            key, (expires, data) = next(iter(self._messages.items()))
+            if expires > now and len(self._messages) <= self.max_messages:
+                break
+            self._messages.popitem(last=False)
+
+    def _remember(self, key, data):
+        self._messages[key] = (time.monotonic() + self.ttl, data)
+
+    def _seen(self, key):
+        if key in self._messages:
+            return self._messages[key][1]
+
+    def parse(self, kind, text, schema):
+        """
+        Parse a websocket message, validating it only if its content was not seen yet
+        :param str kind: the kind of message, 'block' or 'peer'
+        :param str text: the message
+        :param dict schema: the json schema of the message
+        :return: the json data, and True if the content was already received
+        :rtype: Tuple[dict, bool]
+        :raise jsonschema.ValidationError: if the message is not valid
+        """
+        self._received[kind] += 1
+        self._expire()
+        text_key = (kind, _digest(text))
+        data = self._seen(text_key)
+        if data is None:
+            try:
+                data = json.loads(text)
+                # The same content formatted differently by another node
+                content_key = (kind, _digest(json.dumps(data, sort_keys=True, separators=(',', ':'))))
+            except (TypeError, ValueError):
+                raise jsonschema.ValidationError("Could not parse json")
+            seen_data = self._seen(content_key)
+            if seen_data is None:
+                jsonschema.validate(data, schema)
+                self._remember(content_key, data)
+                self._remember(text_key, data)
+                return data, False
+            data = seen_data
+            self._remember(text_key, data)
+        self._duplicates[kind] += 1
+        return data, True
+
+    def stats(self):
+        """
+        Get the monitoring data of the messages received, by kind of message :
+        the number of messages received, of duplicates, and the rate of duplicates
+        :rtype: dict
+        """
+        return {kind: {'received': self._received[kind],
+                       'duplicates': self._duplicates[kind],
+                       'duplicate_rate': self._duplicates[kind] / self._received[kind]}
+                for kind in self._received}
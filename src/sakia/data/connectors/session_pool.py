@@ -0,0 +1,49 @@
+import logging
+
+import aiohttp
+import attr
+
+
+@attr.s()
+class SessionPool:
+    """
+    A long-lived aiohttp session shared between requests.
+
+    The underlying TCP connector keeps connections alive between requests
+    and limits the number of connections opened on each host, so that
+    consecutive BMA requests to the same node reuse the same sockets
+    instead of paying a new TCP/TLS handshake every time.
+
+    :param int limit: the maximum number of simultaneous connections
+    :param int limit_per_host: the maximum number of simultaneous connections to a same host
+    :param int keepalive_timeout: the number of seconds an idle connection is kept open
+    """
+    limit = attr.ib(default=100)
+    limit_per_host = attr.ib(default=4)
+    keepalive_timeout = attr.ib(default=30)
+    _session = attr.ib(default=None, init=False)
+    _logger = attr.ib(default=attr.Factory(lambda: logging.getLogger('sakia')))
+
+    def session(self):
+        """
+        Get the shared session, opening it if needed.
+        Must be called from a coroutine running in the event loop.
+
+        :rtype: aiohttp.ClientSession
+        """
+        if not self._session or self._session.closed:
+            self._logger.debug("Opening pooled session")
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             limit_per_host=self.limit_per_host,
+                                             keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """
+        Close the shared session and all its pooled connections
+        """
+        if self._session and not self._session.closed:
+            self._logger.debug("Closing pooled session")
+            await self._session.close()
+        self._session = None
@@ -10,3 +10,4 @@ from .source import Source
 from .dividend import Dividend
 from .contact import Contact
 from .plugin import Plugin
+from .block_header import BlockHeader
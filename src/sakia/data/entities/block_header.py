@@ -0,0 +1,25 @@
+import attr
+
+
+def _optional_str(value):
+    if value is None:
+        return None
+    return str(value)
+
+
+@attr.s()
+class BlockHeader:
+    """
+    The header of a block of the blockchain.
+    The full json document of the block can be kept along the header
+    to serve the block without requesting the network.
+    """
+    currency = attr.ib(convert=str)
+    number = attr.ib(convert=int)
+    sha_hash = attr.ib(convert=str, cmp=False, hash=False)
+    previous_hash = attr.ib(convert=str, cmp=False, hash=False, default="")
+    median_time = attr.ib(convert=int, cmp=False, hash=False, default=0)
+    # The json document of the block, None if it was evicted
+    data = attr.ib(convert=_optional_str, cmp=False, hash=False, default=None)
+    # The last time the json document was accessed
+    last_access = attr.ib(convert=float, cmp=False, hash=False, default=0)
@@ -68,4 +68,14 @@ class Node:
     member = attr.ib(convert=bool, cmp=False, default=False, hash=False)
     # If this node is a member or not
     last_state_change = attr.ib(convert=int, cmp=False, default=False, hash=False)
+    # The moving average of the latency of the node, in seconds
+    latency = attr.ib(convert=float, cmp=False, default=0, hash=False)
+    # The moving average of the rate of failed requests sent to the node
+    error_rate = attr.ib(convert=float, cmp=False, default=0, hash=False)
+    # The number of requests refused by the rate limitation of the node
+    limitations = attr.ib(convert=int, cmp=False, default=0, hash=False)
+    # The number of consecutive polls which found the node offline or corrupted
+    failures = attr.ib(convert=int, cmp=False, default=0, hash=False)
+    # The time of the next poll of the node, as a timestamp
+    retry_time = attr.ib(convert=int, cmp=False, default=0, hash=False)
 
@@ -19,6 +19,7 @@ class UserParameters:
     proxy_port = attr.ib(convert=int, default=8080)
     proxy_user = attr.ib(convert=str, default="")
     proxy_password = attr.ib(convert=str, default="")
+    blocks_confirmation_depth = attr.ib(convert=int, default=20)
 
     def proxy(self):
         if self.enable_proxy is True:
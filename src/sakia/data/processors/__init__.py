@@ -1,4 +1,6 @@
 from .nodes import NodesProcessor
+from .blocks import BlocksProcessor
+from .documents_parser import DocumentsParser
 from .identities import IdentitiesProcessor
 from .certifications import CertificationsProcessor
 from .blockchain import BlockchainProcessor
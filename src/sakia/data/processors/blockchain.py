@@ -1,20 +1,119 @@
 import attr
+import hashlib
+import re
 import sqlite3
 import logging
 from sakia.errors import NoPeerAvailable
 from ..entities import Blockchain, BlockchainParameters
 from .nodes import NodesProcessor
+from .documents_parser import DocumentsParser
 from ..connectors import BmaConnector
 from duniterpy.api import bma, errors
 from duniterpy.documents import Block, BMAEndpoint
 import asyncio
 
+# The maximum number of wanted blocks downloaded at each step of the synchronization
+MAX_BLOCKS_PER_STEP = 100
+# The wanted blocks separated by this number of blocks or less are downloaded in a single range
+MAX_RANGE_GAP = 10
+# The maximum number of blocks of a range, each range being requested to a different node
+MAX_RANGE_SIZE = 50
+# The maximum number of single blocks requested at the same time
+MAX_BLOCK_REQUESTS = 8
+# The maximum number of new blocks downloaded to update the index of the blocks with identities or money.
+# When more blocks were added to the blockchain, the lists of these blocks are requested to the network.
+MAX_SCANNED_BLOCKS = 200
+# The fields of the block documents with identities or money data
+INDEXED_FIELDS = ('joiners', 'leavers', 'actives', 'excluded', 'identities', 'transactions', 'ud')
+# The fields of the raw block documents chaining the blocks
+RAW_NUMBER = re.compile("^Number: ([0-9]+)$", re.MULTILINE)
+RAW_PREVIOUS_HASH = re.compile("^PreviousHash: ([0-9A-F]+)$", re.MULTILINE)
+
+
+def plan_blocks_requests(numbers, max_gap=MAX_RANGE_GAP, max_size=MAX_RANGE_SIZE):
+    """
+    Group the wanted blocks into the requests to send to the network.
+    The wanted blocks close to each other are requested in ranges, downloading
+    the few blocks between them, and the isolated ones are requested alone.
+
+    :param List[int] numbers: the sorted numbers of the wanted blocks
+    :param int max_gap: the maximum number of unwanted blocks downloaded between two wanted blocks
+    :param int max_size: the maximum number of blocks of a range
+    :return: the number of the first block and the number of blocks of each request
+    :rtype: List[Tuple[int, int]]
+    """
+    requests = []
+    for number in numbers:
+        if requests:
+            first, count = requests[-1]
+            last = first + count - 1
+            if number <= last:
+                continue
+            if number - last - 1 <= max_gap and number - first < max_size:
+                requests[-1] = (first, number - first + 1)
+                continue
+        requests.append((number, 1))
+    return requests
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest().upper()
+
+
+def _block_hash(data):
+    """
+    Compute the hash of a block from its raw document and its signature
+    :param dict data: the block data
+    :return: the hash of the block, None if its inner hash does not match its content
+    :rtype: str
+    """
+    inner_part, found, proof = data['raw'].rpartition("InnerHash: ")
+    if not found or _sha256(inner_part) != proof.split("\n")[0]:
+        return None
+    return _sha256("InnerHash: {0}{1}\n".format(proof, data['signature']))
+
+
+def _verified_range(blocks_data, first, count, last_hash):
+    """
+    Check a range of blocks answered by a single node against the hash of its last block,
+    verified on the network : each block must match its hash and contain the hash of the previous block,
+    so that the whole range is chained to the verified block.
+
+    :param List[dict] blocks_data: the blocks data
+    :param int first: the number of the first block requested
+    :param int count: the number of blocks requested
+    :param str last_hash: the verified hash of the last block requested
+    :rtype: bool
+    """
+    if len(blocks_data) != count:
+        return False
+    previous_hash = None
+    try:
+        for number, data in enumerate(blocks_data, first):
+            raw_number = RAW_NUMBER.search(data['raw'])
+            if data['number'] != number or not raw_number or int(raw_number.group(1)) != number:
+                return False
+            if previous_hash:
+                raw_previous_hash = RAW_PREVIOUS_HASH.search(data['raw'])
+                if not raw_previous_hash or raw_previous_hash.group(1) != previous_hash:
+                    return False
+            previous_hash = _block_hash(data)
+            if not previous_hash:
+                return False
+    except (KeyError, TypeError):
+        return False
+    return previous_hash == last_hash
+
 
 @attr.s
 class BlockchainProcessor:
     _repo = attr.ib()  # :type sakia.data.repositories.CertificationsRepo
     _bma_connector = attr.ib()  # :type sakia.data.connectors.bma.BmaConnector
     _logger = attr.ib(default=attr.Factory(lambda: logging.getLogger('sakia')))
+    _index_repo = attr.ib(default=None)  # :type sakia.data.repositories.BlocksIndexRepo
+    _parser = attr.ib(default=attr.Factory(DocumentsParser.inline))  # :type sakia.data.processors.DocumentsParser
+    _snapshots = attr.ib(default=attr.Factory(dict))  # :type Dict[str, sakia.data.entities.Blockchain]
+    _scanned_blocks = attr.ib(default=attr.Factory(dict), init=False)  # :type Dict[str, Dict[int, Block]]
 
     @classmethod
     def instanciate(cls, app):
@@ -24,10 +123,43 @@ class BlockchainProcessor:
         :rtype: sakia.data.processors.BlockchainProcessor
         """
         return cls(app.db.blockchains_repo,
-                   BmaConnector(NodesProcessor(app.db.nodes_repo), app.parameters))
+                   app.bma_connector,
+                   index_repo=app.db.blocks_index_repo,
+                   parser=app.documents_parser,
+                   snapshots=app.blockchain_snapshots)
+
+    def _blockchain(self, currency):
+        """
+        Get the snapshot of the local blockchain, read from the database the first time only.
+        The snapshots are shared by the processors and replaced each time the blockchain is written.
+
+        :param str currency:
+        :rtype: sakia.data.entities.Blockchain
+        """
+        blockchain = self._snapshots.get(currency)
+        if blockchain is None:
+            blockchain = self._repo.get_one(currency=currency)
+            if blockchain:
+                self._snapshots[currency] = blockchain
+        return blockchain
+
+    def _save(self, blockchain, insert=False):
+        """
+        Write the local blockchain to the database and replace its snapshot
+        :param sakia.data.entities.Blockchain blockchain: the blockchain
+        :param bool insert: True to insert the blockchain if it is not in the database yet
+        """
+        if insert:
+            try:
+                self._repo.insert(blockchain)
+            except sqlite3.IntegrityError:
+                self._repo.update(blockchain)
+        else:
+            self._repo.update(blockchain)
+        self._snapshots[blockchain.currency] = blockchain
 
     def initialized(self, currency):
-        return self._repo.get_one(currency=currency) is not None
+        return self._blockchain(currency) is not None
 
     async def ud_before(self, currency, block_number):
         try:
@@ -70,7 +202,7 @@ class BlockchainProcessor:
         Get the local current blockuid
         :rtype: duniterpy.documents.BlockUID
         """
-        blockchain = self._repo.get_one(currency=currency)
+        blockchain = self._blockchain(currency)
         return blockchain.current_buid
 
     def time(self, currency):
@@ -78,42 +210,42 @@ class BlockchainProcessor:
         Get the local current median time
         :rtype: int
         """
-        return self._repo.get_one(currency=currency).median_time
+        return self._blockchain(currency).median_time
 
     def parameters(self, currency):
         """
         Get the parameters of the blockchain
         :rtype: sakia.data.entities.BlockchainParameters
         """
-        return self._repo.get_one(currency=currency).parameters
+        return self._blockchain(currency).parameters
 
     def current_mass(self, currency):
         """
         Get the local current monetary mass
         :rtype: int
         """
-        return self._repo.get_one(currency=currency).current_mass
+        return self._blockchain(currency).current_mass
 
     def current_members_count(self, currency):
         """
         Get the number of members in the blockchain
         :rtype: int
         """
-        return self._repo.get_one(currency=currency).current_members_count
+        return self._blockchain(currency).current_members_count
 
     def last_members_count(self, currency):
         """
         Get the last ud value and base
         :rtype: int, int
         """
-        return self._repo.get_one(currency=currency).last_members_count
+        return self._blockchain(currency).last_members_count
 
     def last_ud(self, currency):
         """
         Get the last ud value and base
         :rtype: int, int
         """
-        blockchain = self._repo.get_one(currency=currency)
+        blockchain = self._blockchain(currency)
         try:
             return blockchain.last_ud, blockchain.last_ud_base
         except AttributeError:
@@ -124,7 +256,7 @@ class BlockchainProcessor:
         Get the last ud time
         :rtype: int
         """
-        blockchain = self._repo.get_one(currency=currency)
+        blockchain = self._blockchain(currency)
         return blockchain.last_ud_time
 
     def previous_monetary_mass(self, currency):
@@ -132,21 +264,21 @@ class BlockchainProcessor:
         Get the local current monetary mass
         :rtype: int
         """
-        return self._repo.get_one(currency=currency).previous_mass
+        return self._blockchain(currency).previous_mass
 
     def previous_members_count(self, currency):
         """
         Get the local current monetary mass
         :rtype: int
         """
-        return self._repo.get_one(currency=currency).previous_members_count
+        return self._blockchain(currency).previous_members_count
 
     def previous_ud(self, currency):
         """
         Get the previous ud value and base
         :rtype: int, int
         """
-        blockchain = self._repo.get_one(currency=currency)
+        blockchain = self._blockchain(currency)
         return blockchain.previous_ud, blockchain.previous_ud_base
 
     def previous_ud_time(self, currency):
@@ -154,20 +286,21 @@ class BlockchainProcessor:
         Get the previous ud time
         :rtype: int
         """
-        blockchain = self._repo.get_one(currency=currency)
+        blockchain = self._blockchain(currency)
         return blockchain.previous_ud_time
 
-    async def get_block(self, currency, number):
+    async def get_block(self, currency, number, cached=True):
         """
         Get block documen at a given number
         :param str currency:
         :param int number:
+        :param bool cached: False to request the block to the network even if it is in the local cache
         :rtype: duniterpy.documents.Block
         """
-        block = await self._bma_connector.get(currency, bma.blockchain.block, req_args={'number': number})
+        block = await self._bma_connector.get(currency, bma.blockchain.block, req_args={'number': number},
+                                              cached=cached)
         if block:
-            block_doc = Block.from_signed_raw("{0}{1}\n".format(block['raw'], block['signature']))
-            return block_doc
+            return Block.from_signed_raw("{0}{1}\n".format(block['raw'], block['signature']))
 
     async def new_blocks_with_identities(self, currency):
         """
@@ -207,21 +340,134 @@ class BlockchainProcessor:
         local_current_buid = self.current_buid(currency)
         return sorted([b for b in with_money if b > local_current_buid.number])
 
+    async def _scan_blocks(self, currency, start, end):
+        """
+        Download blocks and find the ones with identities or money data.
+        The documents of these blocks are kept to be handled next, instead of being downloaded again.
+
+        :param str currency:
+        :param int start: the number of the first block
+        :param int end: the number of the last block
+        :return: the numbers of the blocks with identities or money data
+        :rtype: List[int]
+        """
+        ranges = [(first, min(MAX_RANGE_SIZE, end - first + 1)) for first in range(start, end + 1, MAX_RANGE_SIZE)]
+        ranges_data = await self._get_ranges(currency, ranges)
+        blocks = await self._parser.blocks([data["raw"] + data["signature"] + "\n"
+                                            for range_data in ranges_data for data in range_data])
+        scanned_blocks = self._scanned_blocks.setdefault(currency, {})
+        numbers = []
+        for block in blocks:
+            if any(getattr(block, f) for f in INDEXED_FIELDS):
+                scanned_blocks[block.number] = block
+                numbers.append(block.number)
+        return numbers
+
+    async def indexed_new_blocks(self, currency, network_number):
+        """
+        Get blocks more recent than local block uid with identities or money data,
+        from the local index of these blocks.
+        The index is updated from the blocks added to the blockchain since its last update only :
+        a few new blocks are downloaded and scanned, and the lists of the network are requested
+        only when too many blocks were added.
+
+        :param str currency:
+        :param int network_number: the number of the current block of the network
+        :rtype: List[int]
+        """
+        if not self._index_repo:
+            with_identities = await self.new_blocks_with_identities(currency)
+            with_money = await self.new_blocks_with_money(currency)
+            return sorted(with_identities + with_money)
+        local_number = self.current_buid(currency).number
+        height = self._index_repo.height(currency)
+        if height is None or height < local_number:
+            height = local_number
+        if network_number > height:
+            if network_number - height <= MAX_SCANNED_BLOCKS:
+                numbers = await self._scan_blocks(currency, height + 1, network_number)
+            else:
+                with_identities = await self.new_blocks_with_identities(currency)
+                with_money = await self.new_blocks_with_money(currency)
+                numbers = [n for n in with_identities + with_money if height < n <= network_number]
+            self._logger.debug("Indexed {0} blocks from {1} to {2}".format(len(numbers), height + 1,
+                                                                           network_number))
+            self._index_repo.insert_all(currency, numbers)
+            self._index_repo.set_height(currency, network_number)
+        # The blocks handled are not needed anymore
+        self._index_repo.drop_until(currency, local_number)
+        scanned_blocks = self._scanned_blocks.get(currency, {})
+        for number in [n for n in scanned_blocks if n <= local_number]:
+            del scanned_blocks[number]
+        return self._index_repo.get_after(currency, local_number)
+
+    async def _get_ranges(self, currency, ranges):
+        """
+        Download ranges of blocks, each range from a different synced node.
+        A range answered by a single node is trusted only if it is chained to the hash of its last block
+        verified on the network, else it is downloaded again with the verified requests.
+
+        :param str currency:
+        :param List[Tuple[int, int]] ranges: the number of the first block and the number of blocks of each range
+        :return: the blocks data of each range
+        :rtype: List[List[dict]]
+        """
+        if not ranges:
+            return []
+        ranges_data, last_blocks = await asyncio.gather(
+            self._bma_connector.spread_get(currency, bma.blockchain.blocks,
+                                           [{'count': count, 'start': first} for first, count in ranges]),
+            asyncio.gather(*[self._bma_connector.get(currency, bma.blockchain.block,
+                                                     req_args={'number': first + count - 1})
+                             for first, count in ranges]))
+        for i, (first, count) in enumerate(ranges):
+            if not _verified_range(ranges_data[i], first, count, last_blocks[i]['hash']):
+                self._logger.debug("Unverified blocks from {0} to {1}, requesting them to several nodes"
+                                   .format(first, first + count - 1))
+                ranges_data[i] = await self._bma_connector.get(currency, bma.blockchain.blocks,
+                                                               req_args={'count': count, 'start': first})
+        return ranges_data
+
     async def next_blocks(self, start, filter, currency):
         """
-        Get blocks from the network
-        :param List[int] numbers: list of blocks numbers to get
+        Get the next wanted blocks from the network.
+        The requests are planned from the density of the wanted blocks :
+        the dense ones are downloaded in ranges spread across the synced nodes
+        and verified against the network, and the sparse ones are requested alone.
+        The blocks already downloaded when the new blocks were scanned are not requested again.
+
+        :param int start: the number of the last block handled
+        :param List[int] filter: the numbers of the wanted blocks
+        :param str currency:
         :return: the list of block documents
         :rtype: List[duniterpy.documents.Block]
         """
-        blocks = []
-        blocks_data = await self._bma_connector.get(currency, bma.blockchain.blocks, req_args={'count': 100,
-                                                                                 'start': start})
-        for data in blocks_data:
-            if data['number'] in filter or data['number'] == start+99:
-                blocks.append(Block.from_signed_raw(data["raw"] + data["signature"] + "\n"))
-
-        return blocks
+        numbers = sorted(set(n for n in filter if n > start))[:MAX_BLOCKS_PER_STEP]
+        scanned_blocks = self._scanned_blocks.get(currency, {})
+        requested = [n for n in numbers if n not in scanned_blocks]
+        scanned = [scanned_blocks.pop(n) for n in numbers if n in scanned_blocks]
+        requests = plan_blocks_requests(requested)
+        ranges = [(first, count) for first, count in requests if count > 1]
+        singles = [first for first, count in requests if count == 1]
+        semaphore = asyncio.Semaphore(MAX_BLOCK_REQUESTS)
+
+        async def get_single(number):
+            async with semaphore:
+                return [await self._bma_connector.get(currency, bma.blockchain.block, req_args={'number': number})]
+
+        async def get_ranges():
+            ranges_data = await self._get_ranges(currency, ranges)
+            return [data for range_data in ranges_data for data in range_data]
+
+        self._logger.debug("Requesting {0} blocks in {1} ranges and {2} single blocks"
+                           .format(len(requested), len(ranges), len(singles)))
+        results = await asyncio.gather(get_ranges(), *[get_single(n) for n in singles])
+
+        wanted = set(requested)
+        blocks_data = sorted((data for result in results for data in result if data['number'] in wanted),
+                             key=lambda data: data['number'])
+        blocks = await self._parser.blocks([data["raw"] + data["signature"] + "\n" for data in blocks_data])
+        return sorted(blocks + scanned, key=lambda block: block.number)
 
     async def initialize_blockchain(self, currency, log_stream):
         """
@@ -268,9 +514,21 @@ class BlockchainProcessor:
             if e.ucode != errors.NO_CURRENT_BLOCK:
                 raise
 
+        await self._load_dividends(currency, blockchain, log_stream)
+
+        self._save(blockchain, insert=True)
+
+    async def _load_dividends(self, currency, blockchain, log_stream, before=None):
+        """
+        Load the data of the last two dividends of the blockchain
+        :param str currency:
+        :param sakia.data.entities.Blockchain blockchain: the blockchain to update
+        :param function log_stream: the logging function
+        :param int before: the number of the last block to look for dividends, None to look in the whole blockchain
+        """
         log_stream("Requesting blocks with dividend")
         with_ud = await self._bma_connector.get(currency, bma.blockchain.ud)
-        blocks_with_ud = with_ud['result']['blocks']
+        blocks_with_ud = [b for b in with_ud['result']['blocks'] if before is None or b <= before]
 
         if len(blocks_with_ud) > 0:
             log_stream("Requesting last block with dividend")
@@ -304,11 +562,6 @@ class BlockchainProcessor:
                 if e.ucode != errors.NO_CURRENT_BLOCK:
                     raise
 
-        try:
-            self._repo.insert(blockchain)
-        except sqlite3.IntegrityError:
-            self._repo.update(blockchain)
-
     def handle_new_blocks(self, currency, blocks):
         """
         Initialize blockchain for a given currency if no source exists locally
@@ -331,8 +584,28 @@ class BlockchainProcessor:
                     blockchain.last_ud = block.ud
                     blockchain.last_ud_base = block.unit_base
                     blockchain.last_ud_time = block.mediantime
-        self._repo.update(blockchain)
+        self._save(blockchain)
+
+    async def rollback(self, currency, block):
+        """
+        Set the local blockchain back to a block of the network
+        :param str currency:
+        :param duniterpy.documents.Block block: the last block kept
+        """
+        blockchain = self._repo.get_one(currency=currency)
+        if blockchain.last_ud_time > block.mediantime:
+            await self._load_dividends(currency, blockchain, self._logger.debug, before=block.number)
+        blockchain.current_buid = block.blockUID
+        blockchain.median_time = block.mediantime
+        blockchain.current_members_count = block.members_count
+        self._save(blockchain)
+        self._scanned_blocks.pop(currency, None)
+        if self._index_repo:
+            # The blocks of the new branch are indexed again
+            self._index_repo.drop_after(currency, block.number)
+            self._index_repo.set_height(currency, block.number)
 
     def remove_blockchain(self, currency):
+        self._snapshots.pop(currency, None)
         self._repo.drop(self._repo.get_one(currency=currency))
 
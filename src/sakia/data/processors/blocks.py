@@ -0,0 +1,143 @@
+import attr
+import json
+import logging
+import sqlite3
+import time
+from ..entities import BlockHeader
+
+
+@attr.s
+class BlocksProcessor:
+    """
+    Keeps the blocks headers locally, and the json documents of the
+    blocks which are deep enough in the blockchain not to change anymore.
+
+    :param sakia.data.repositories.BlocksRepo _repo: the blocks repository
+    :param int confirmation_depth: the number of blocks on top of a block before it is served from the cache
+    :param int max_documents: the maximum number of json documents kept in the cache
+    """
+    _repo = attr.ib()  # :type sakia.data.repositories.BlocksRepo
+    confirmation_depth = attr.ib(default=20)
+    max_documents = attr.ib(default=2000)
+    _accesses = attr.ib(default=attr.Factory(dict), init=False)
+    _logger = attr.ib(default=attr.Factory(lambda: logging.getLogger('sakia')))
+
+    @classmethod
+    def instanciate(cls, app):
+        """
+        Instanciate a blocks processor
+        :param sakia.app.Application app: the app
+        :rtype: sakia.data.processors.BlocksProcessor
+        """
+        return cls(app.db.blocks_repo, confirmation_depth=app.parameters.blocks_confirmation_depth)
+
+    def confirmed_block(self, currency, number, current_number):
+        """
+        Get the json document of a block from the cache
+        if it is deep enough in the blockchain
+
+        :param str currency: the currency of the block
+        :param int number: the number of the block
+        :param int current_number: the number of the current block of the network
+        :return: the json document of the block, None if it is not available
+        :rtype: dict
+        """
+        if number > current_number - self.confirmation_depth:
+            return None
+        header = self._repo.get_one(currency=currency, number=number)
+        if header and header.data:
+            # The access time is written when the least recently accessed documents are evicted
+            self._accesses.setdefault(currency, {})[number] = time.time()
+            return json.loads(header.data)
+
+    def cache_block(self, currency, block_data, current_number):
+        """
+        Save a block received from the network.
+        Its json document is kept only if the block is deep enough in the blockchain.
+
+        :param str currency: the currency of the block
+        :param dict block_data: the json document of the block
+        :param int current_number: the number of the current block of the network
+        """
+        if block_data['number'] > current_number - self.confirmation_depth:
+            return
+        header = BlockHeader(currency=currency,
+                             number=block_data['number'],
+                             sha_hash=block_data['hash'],
+                             previous_hash=block_data.get('previousHash', ""),
+                             median_time=block_data['medianTime'],
+                             data=json.dumps(block_data),
+                             last_access=time.time())
+        try:
+            self._repo.insert(header)
+        except sqlite3.IntegrityError:
+            self._repo.update(header)
+
+        exceeding = self._repo.count_documents(currency) - self.max_documents
+        if exceeding > 0:
+            self._logger.debug("Evicting {0} blocks documents".format(exceeding))
+            self.flush_accesses(currency)
+            self._repo.evict_documents(currency, exceeding)
+
+    def flush_accesses(self, currency):
+        """
+        Write the access times of the blocks documents served from the cache since the last flush
+        :param str currency: the currency of the blocks
+        """
+        accesses = self._accesses.pop(currency, None)
+        if accesses:
+            self._repo.touch(currency, accesses)
+
+    def _record(self, header):
+        known = self._repo.get_one(currency=header.currency, number=header.number)
+        if not known:
+            self._repo.insert(header)
+        elif known.sha_hash != header.sha_hash:
+            self._repo.update(header)
+
+    def record_headers(self, currency, blocks):
+        """
+        Keep the headers of the blocks handled locally,
+        to find the last block shared with the network after a fork.
+
+        :param str currency: the currency of the blocks
+        :param List[duniterpy.documents.Block] blocks: the blocks handled
+        """
+        for block in blocks:
+            self._record(BlockHeader(currency=currency,
+                                     number=block.number,
+                                     sha_hash=block.blockUID.sha_hash,
+                                     previous_hash=block.prev_hash or "",
+                                     median_time=block.mediantime,
+                                     data=None,
+                                     last_access=time.time()))
+
+    def record_blockstamp(self, currency, blockstamp):
+        """
+        Keep the number and the hash of a block handled locally
+        :param str currency: the currency of the block
+        :param duniterpy.documents.BlockUID blockstamp: the block
+        """
+        self._record(BlockHeader(currency=currency,
+                                 number=blockstamp.number,
+                                 sha_hash=blockstamp.sha_hash,
+                                 last_access=time.time()))
+
+    def local_headers(self, currency, number, limit=100):
+        """
+        Get the headers of the blocks handled locally below a given block, the most recent first
+        :param str currency: the currency of the blocks
+        :param int number: the number of the block
+        :param int limit: the maximum number of headers
+        :rtype: List[sakia.data.entities.BlockHeader]
+        """
+        return self._repo.get_before(currency, number, limit)
+
+    def rollback(self, currency, number):
+        """
+        Drop the headers and the documents of the blocks above a given block
+        :param str currency: the currency of the blocks
+        :param int number: the number of the last block kept
+        """
+        self._accesses.pop(currency, None)
+        self._repo.drop_after(currency, number)
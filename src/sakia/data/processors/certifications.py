@@ -24,7 +24,7 @@ class CertificationsProcessor:
         :param sakia.app.Application app: the app
         """
         return cls(app.db.certifications_repo, app.db.identities_repo,
-                   BmaConnector(NodesProcessor(app.db.nodes_repo), app.parameters))
+                   app.bma_connector)
 
     def drop_expired(self, identity, current_ts, sig_validity, sig_window):
         """
@@ -107,6 +107,20 @@ class CertificationsProcessor:
         except sqlite3.IntegrityError:
             self._certifications_repo.update(cert)
 
+    def rollback(self, currency, block_number):
+        """
+        Set back the certifications written after a given block as pending
+        :param str currency: the currency of the certifications
+        :param int block_number: the number of the last block kept
+        :return: the certifications which are pending again
+        :rtype: List[sakia.data.entities.Certification]
+        """
+        certifications = self._certifications_repo.get_written_after(currency, block_number)
+        for cert in certifications:
+            cert.written_on = -1
+            self._certifications_repo.update(cert)
+        return certifications
+
     def cleanup_connection(self, connection, connections_pubkeys):
         """
         Cleanup connections data after removal
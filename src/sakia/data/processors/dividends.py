@@ -2,9 +2,9 @@ import attr
 import logging
 from ..entities import Dividend
 from .nodes import NodesProcessor
+from .documents_parser import DocumentsParser
 from ..connectors import BmaConnector
 from duniterpy.api import bma
-from duniterpy.documents import Transaction
 import sqlite3
 import asyncio
 
@@ -18,6 +18,7 @@ class DividendsProcessor:
     _repo = attr.ib()
     _bma_connector = attr.ib()
     _logger = attr.ib(default=attr.Factory(lambda: logging.getLogger('sakia')))
+    _parser = attr.ib(default=attr.Factory(DocumentsParser.inline))  # :type sakia.data.processors.DocumentsParser
 
     @classmethod
     def instanciate(cls, app):
@@ -26,7 +27,8 @@ class DividendsProcessor:
         :param sakia.app.Application app: the app
         """
         return cls(app.db.dividends_repo,
-                   BmaConnector(NodesProcessor(app.db.nodes_repo), app.parameters))
+                   app.bma_connector,
+                   parser=app.documents_parser)
 
     def commit(self, dividend):
         try:
@@ -63,8 +65,7 @@ class DividendsProcessor:
             except sqlite3.IntegrityError:
                 log_stream("Dividend already registered in database")
 
-        for tx in transactions:
-            txdoc = Transaction.from_signed_raw(tx.raw)
+        for txdoc in await self._parser.transactions([tx.raw for tx in transactions]):
             for input in txdoc.inputs:
                 if input.source == "D" and input.origin_id == connection.pubkey and input.index not in block_numbers:
                     block = await self._bma_connector.get(connection.currency,
@@ -83,6 +84,19 @@ class DividendsProcessor:
                         log_stream("Dividend already registered in database")
         return dividends
 
+    def rollback(self, currency, block_number):
+        """
+        Drop the dividends created after a given block
+        :param str currency: the currency of the dividends
+        :param int block_number: the number of the last block kept
+        :return: the dividends dropped
+        :rtype: List[sakia.data.entities.Dividend]
+        """
+        dividends = self._repo.get_after(currency, block_number)
+        for dividend in dividends:
+            self._repo.drop(dividend)
+        return dividends
+
     def dividends(self, currency, pubkey):
         return self._repo.get_all(currency=currency, pubkey=pubkey)
 
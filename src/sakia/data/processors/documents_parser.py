@@ -0,0 +1,100 @@
+import asyncio
+import attr
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from duniterpy.documents import Block, Transaction
+
+
+def parse_blocks(signed_raws):
+    """
+    Parse signed raw blocks
+    :param List[str] signed_raws: the signed raw documents
+    :rtype: List[duniterpy.documents.Block]
+    """
+    return [Block.from_signed_raw(raw) for raw in signed_raws]
+
+
+def parse_transactions(signed_raws):
+    """
+    Parse signed raw transactions
+    :param List[str] signed_raws: the signed raw documents
+    :rtype: List[duniterpy.documents.Transaction]
+    """
+    return [Transaction.from_signed_raw(raw) for raw in signed_raws]
+
+
+@attr.s()
+class DocumentsParser:
+    """
+    Parses the signed raw documents received from the network.
+    Large batches are parsed in worker processes, so that the event loop
+    and the user interface are not blocked while the blockchain is synchronized.
+    Small batches are parsed inline, sending them to a worker costing more than parsing them.
+
+    :param int max_workers: the number of worker processes, 0 to always parse inline
+    :param int min_batch: the minimum number of documents of a batch parsed by the workers
+    :param int chunk_size: the number of documents sent to a worker at once
+    """
+    max_workers = attr.ib(default=attr.Factory(lambda: min(4, os.cpu_count() or 1)))
+    min_batch = attr.ib(default=20)
+    chunk_size = attr.ib(default=25)
+    _executor = attr.ib(default=None, init=False)
+    _logger = attr.ib(default=attr.Factory(lambda: logging.getLogger('sakia')))
+
+    @classmethod
+    def inline(cls):
+        """
+        Get a parser without worker processes, used by default by the objects
+        not given the parser of the application, so that no pool is left unclosed
+        :rtype: DocumentsParser
+        """
+        return cls(max_workers=0)
+
+    def _pool(self):
+        if self._executor is None and self.max_workers:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def _parse(self, parse, signed_raws):
+        signed_raws = list(signed_raws)
+        if len(signed_raws) < self.min_batch or not self._pool():
+            return parse(signed_raws)
+        loop = asyncio.get_event_loop()
+        chunks = [signed_raws[i:i + self.chunk_size] for i in range(0, len(signed_raws), self.chunk_size)]
+        try:
+            results = await asyncio.gather(*[loop.run_in_executor(self._executor, parse, chunk)
+                                             for chunk in chunks])
+        except (BrokenProcessPool, OSError) as e:
+            self._logger.warning("Parsing documents inline, the workers failed : {0}".format(str(e)))
+            self.close()
+            self.max_workers = 0
+            return parse(signed_raws)
+        return [document for result in results for document in result]
+
+    async def blocks(self, signed_raws):
+        """
+        Parse signed raw blocks
+        :param List[str] signed_raws: the signed raw documents
+        :return: the blocks, in the order of the documents
+        :rtype: List[duniterpy.documents.Block]
+        """
+        return await self._parse(parse_blocks, signed_raws)
+
+    async def transactions(self, signed_raws):
+        """
+        Parse signed raw transactions
+        :param List[str] signed_raws: the signed raw documents
+        :return: the transactions, in the order of the documents
+        :rtype: List[duniterpy.documents.Transaction]
+        """
+        return await self._parse(parse_transactions, signed_raws)
+
+    def close(self):
+        """
+        Stop the worker processes. They are started again by the next large batch.
+        """
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
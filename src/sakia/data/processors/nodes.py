@@ -1,7 +1,12 @@
 import attr
-import sqlite3
 from sakia.constants import ROOT_SERVERS
 from ..entities import Node
+from ..connectors.scoreboard import NodesScoreboard
+from ..connectors.rate_limiter import NodesRateLimiter
+from ..connectors.headers_cache import BlockHeadersCache
+from ..connectors.seen_messages import SeenMessages
+from ..connectors.endpoints_index import EndpointsIndex
+from .nodes_store import NodesStore
 from duniterpy.documents import BlockUID, endpoint
 import logging
 
@@ -9,6 +14,13 @@ import logging
 @attr.s
 class NodesProcessor:
     _repo = attr.ib()  # :type sakia.data.repositories.NodesRepo
+    scoreboard = attr.ib(default=attr.Factory(NodesScoreboard))  # :type sakia.data.connectors.NodesScoreboard
+    rate_limiter = attr.ib(default=attr.Factory(NodesRateLimiter))  # :type sakia.data.connectors.NodesRateLimiter
+    headers_cache = attr.ib(default=attr.Factory(BlockHeadersCache))  # :type sakia.data.connectors.BlockHeadersCache
+    seen_messages = attr.ib(default=attr.Factory(SeenMessages))  # :type sakia.data.connectors.SeenMessages
+    endpoints_index = attr.ib(default=attr.Factory(EndpointsIndex))  # :type sakia.data.connectors.EndpointsIndex
+    _stores = attr.ib(default=attr.Factory(dict), init=False)
+    _removed_retries = attr.ib(default=attr.Factory(dict), init=False)
 
     @classmethod
     def instanciate(cls, app):
@@ -22,102 +34,154 @@ class NodesProcessor:
                             endpoints=ROOT_SERVERS[currency]["nodes"][pubkey],
                             peer_blockstamp=BlockUID.empty(),
                             state=Node.ONLINE)
-                self._repo.insert(node)
+                self.endpoints_index.update(node)
+                self._store(currency).put(node)
+            self.flush(currency)
 
-    def current_buid(self, currency):
+    def _store(self, currency):
+        """
+        Get the nodes of a currency held in memory,
+        loaded from the repository and indexed the first time
+        :param str currency:
+        :rtype: sakia.data.processors.nodes_store.NodesStore
+        """
+        if currency not in self._stores:
+            self._stores[currency] = NodesStore.load(self._repo, currency)
+            for node in self._stores[currency].all():
+                self.endpoints_index.update(node)
+        return self._stores[currency]
+
+    def flush(self, currency):
+        """
+        Write the nodes changed since the last flush to the repository
+        :param str currency:
+        :return: the number of rows written
+        :rtype: int
         """
-        Get current buid
+        if currency in self._stores:
+            return self._stores[currency].flush()
+        return 0
+
+    def stats(self, currency):
+        """
+        Get the monitoring data of the nodes held in memory
         :param str currency:
+        :rtype: dict
         """
-        current_buid = self._repo.current_buid(currency=currency)
-        return current_buid
+        return self._store(currency).stats()
 
     def synced_nodes(self, currency):
         """
-        Get nodes which are in the ONLINE state.
+        Get nodes which are in the ONLINE state and synced on the consensus block.
         """
-        current_buid = self._repo.current_buid(currency=currency)
-        return self._repo.get_all(currency=currency, state=Node.ONLINE, current_buid=current_buid)
+        return self._store(currency).consensus.synced_nodes()
 
     def synced_members_nodes(self, currency):
         """
-        Get nodes which are in the ONLINE state.
+        Get members nodes which are in the ONLINE state and synced on the consensus block.
         """
-        current_buid = self._repo.current_buid(currency=currency)
-        return self._repo.get_all(currency=currency, state=Node.ONLINE, member=True, current_buid=current_buid)
+        return self._store(currency).consensus.synced_members_nodes()
 
     def online_nodes(self, currency):
         """
         Get nodes which are in the ONLINE state.
         """
-        return self._repo.get_all(currency=currency, state=Node.ONLINE)
+        return [n for n in self._store(currency).all() if n.state == Node.ONLINE]
 
     def delete_node(self, node):
-        self._repo.drop(node)
+        """
+        Delete a node.
+        The retry state of a failing node is kept, to be given back to it if it is found again.
+
+        :param sakia.data.entities.Node node: the node to delete
+        """
+        if node.failures:
+            self._removed_retries[(node.currency, node.pubkey)] = (node.failures, node.retry_time)
+        self.endpoints_index.remove(node)
+        self._store(node.currency).remove(node)
+
+    def restore_retries(self, node):
+        """
+        Give back its retry state to a node found again after it was deleted for failing,
+        so that its backoff goes on instead of starting again
+        :param sakia.data.entities.Node node: the node found
+        :return: True if the node was failing when it was deleted
+        :rtype: bool
+        """
+        retries = self._removed_retries.pop((node.currency, node.pubkey), None)
+        if retries:
+            node.failures, node.retry_time = retries
+        return retries is not None
 
     def update_node(self, node):
         """
-        Update node in the repository.
-        First involves basic checks about pubkey and primary key constraints.
+        Update node in memory.
+        It is written to the repository on the next flush.
 
         :param sakia.data.entities.Node node: the node to update
         """
-        other_node = self._repo.get_one(currency=node.currency, pubkey=node.pubkey)
-        if other_node:
-            self._repo.update(node)
-        else:
-            self._repo.insert(node)
+        self.scoreboard.store(node)
+        self.endpoints_index.update(node)
+        self._store(node.currency).put(node)
         return node
 
     def insert_node(self, node):
         """
-        Update node in the repository.
-        First involves basic checks about pubkey and primary key constraints.
+        Insert node in memory.
+        It is written to the repository on the next flush.
 
-        :param sakia.data.entities.Node node: the node to update
+        :param sakia.data.entities.Node node: the node to insert
+        """
+        self.update_node(node)
+
+    def insert_nodes(self, nodes):
         """
-        self._repo.insert(node)
+        Insert new nodes in memory
+        :param List[sakia.data.entities.Node] nodes: the nodes to insert
+        """
+        for node in nodes:
+            self.update_node(node)
+
+    def update_nodes(self, nodes):
+        """
+        Update existing nodes in memory
+        :param List[sakia.data.entities.Node] nodes: the nodes to update
+        """
+        for node in nodes:
+            self.update_node(node)
 
     def commit_node(self, node):
         """
-        Saves a node state in the db
+        Saves a node state
         :param sakia.data.entities.Node node: the node updated
         """
-        try:
-            self._repo.insert(node)
-        except sqlite3.IntegrityError:
-            self._repo.update(node)
+        self.update_node(node)
 
     def unknown_node(self, currency, pubkey):
         """
-        Search for pubkey in the repository.
+        Search for pubkey in the known nodes.
         :param str pubkey: the pubkey to lookup
         """
-        other_node = self._repo.get_one(currency=currency, pubkey=pubkey)
-        return other_node is None
+        return self._store(currency).get(pubkey) is None
 
     def nodes(self, currency):
         """
         Get all knew nodes.
         """
-        return self._repo.get_all(currency=currency)
+        return self._store(currency).all()
 
     def root_nodes(self, currency):
         """
         Get root nodes.
         """
-        return self._repo.get_all(currency=currency, root=True)
+        return [n for n in self._store(currency).all() if n.root]
 
     def current_buid(self, currency):
         """
         Get the latest block considered valid
         It is the most frequent last block of every known nodes
         """
-        blocks_uids = [n.current_buid for n in self.synced_nodes(currency)]
-        if len(blocks_uids) > 0:
-            return blocks_uids[0]
-        else:
-            return BlockUID.empty()
+        return self._store(currency).consensus.current_buid()
 
     def quality(self, currency):
         """
@@ -131,24 +195,41 @@ class NodesProcessor:
             ratio_synced = synced / total
         return ratio_synced
 
-    def update_peer(self, currency, peer):
-        """
-        Update the peer of a node
-        :param str currency: the currency of the peer
-        :param peer:
-        :return:
-        """
-        node = self._repo.get_one(pubkey=peer.pubkey, currency=currency)
-        if node and node.peer_blockstamp < peer.blockUID:
-            logging.debug("Update node : {0}".format(peer.pubkey[:5]))
-            node.endpoints = tuple(peer.endpoints)
-            node.peer_blockstamp = peer.blockUID
-            self._repo.update(node)
-            return node, True
-        return node, False
+    def update_peers(self, currency, peers):
+        """
+        Update the peers of a batch of nodes
+        :param str currency: the currency of the peers
+        :param List[duniterpy.documents.Peer] peers: the peer documents
+        :return: the peer documents of unknown nodes, and the nodes updated
+        :rtype: Tuple[List[duniterpy.documents.Peer], List[sakia.data.entities.Node]]
+        """
+        latest_peers = {}
+        for peer in peers:
+            if peer.pubkey not in latest_peers or latest_peers[peer.pubkey].blockUID < peer.blockUID:
+                latest_peers[peer.pubkey] = peer
+
+        store = self._store(currency)
+        unknown_peers = []
+        updated_nodes = []
+        for pubkey, peer in latest_peers.items():
+            node = store.get(pubkey)
+            if not node:
+                unknown_peers.append(peer)
+            elif node.peer_blockstamp < peer.blockUID:
+                logging.debug("Update node : {0}".format(peer.pubkey[:5]))
+                node.endpoints = tuple(peer.endpoints)
+                node.peer_blockstamp = peer.blockUID
+                updated_nodes.append(node)
+        self.update_nodes(updated_nodes)
+        return unknown_peers, updated_nodes
 
     def drop_all(self, currency):
+        self.flush(currency)
         nodes = self._repo.get_all()
         for n in nodes:
             if n.pubkey not in ROOT_SERVERS[currency].keys():
-                self._repo.drop(n)
\ No newline at end of file
+                self._repo.drop(n)
+        store = self._stores.pop(currency, None)
+        if store:
+            for node in store.all():
+                self.endpoints_index.remove(node)
\ No newline at end of file
@@ -0,0 +1,96 @@
+import attr
+from collections import Counter
+from duniterpy.documents import BlockUID
+from ..entities import Node
+
+
+@attr.s()
+class NodesConsensus:
+    """
+    Tracks the current blocks of the nodes of a currency in memory,
+    to know the block of the network consensus and the nodes synced on it
+    without querying the database.
+
+    The consensus is the most frequent current block of the online members nodes,
+    or of all the online nodes if no member node is online.
+    """
+    _nodes = attr.ib(default=attr.Factory(dict), init=False)
+    _tracked = attr.ib(default=attr.Factory(dict), init=False)
+    _heads = attr.ib(default=attr.Factory(Counter), init=False)
+    _members_heads = attr.ib(default=attr.Factory(Counter), init=False)
+    _current_buid = attr.ib(default=None, init=False)
+    _synced_nodes = attr.ib(default=None, init=False)
+    _synced_members_nodes = attr.ib(default=None, init=False)
+
+    def update(self, node):
+        """
+        Track the current state of a node
+        :param sakia.data.entities.Node node: the node
+        """
+        self.remove(node)
+        online = node.state == Node.ONLINE
+        self._nodes[node.pubkey] = node
+        self._tracked[node.pubkey] = (online, node.member, node.current_buid)
+        if online:
+            self._heads[node.current_buid] += 1
+            if node.member:
+                self._members_heads[node.current_buid] += 1
+
+    def remove(self, node):
+        """
+        Stop tracking a node
+        :param sakia.data.entities.Node node: the node
+        """
+        self._invalidate()
+        self._nodes.pop(node.pubkey, None)
+        tracked = self._tracked.pop(node.pubkey, None)
+        if tracked:
+            online, member, current_buid = tracked
+            if online:
+                self._decrement(self._heads, current_buid)
+                if member:
+                    self._decrement(self._members_heads, current_buid)
+
+    @staticmethod
+    def _decrement(heads, current_buid):
+        heads[current_buid] -= 1
+        if heads[current_buid] <= 0:
+            del heads[current_buid]
+
+    def _invalidate(self):
+        self._current_buid = None
+        self._synced_nodes = None
+        self._synced_members_nodes = None
+
+    def current_buid(self):
+        """
+        Get the block of the network consensus
+        :rtype: duniterpy.documents.BlockUID
+        """
+        if self._current_buid is None:
+            heads = self._members_heads if self._members_heads else self._heads
+            if heads:
+                self._current_buid = max(heads.items(), key=lambda h: (h[1], h[0]))[0]
+            else:
+                self._current_buid = BlockUID.empty()
+        return self._current_buid
+
+    def synced_nodes(self):
+        """
+        Get the online nodes whose current block is the block of the consensus
+        :rtype: List[sakia.data.entities.Node]
+        """
+        if self._synced_nodes is None:
+            current_buid = self.current_buid()
+            self._synced_nodes = [self._nodes[pubkey] for pubkey, (online, member, buid) in self._tracked.items()
+                                  if online and buid == current_buid]
+        return self._synced_nodes
+
+    def synced_members_nodes(self):
+        """
+        Get the online members nodes whose current block is the block of the consensus
+        :rtype: List[sakia.data.entities.Node]
+        """
+        if self._synced_members_nodes is None:
+            self._synced_members_nodes = [n for n in self.synced_nodes() if self._tracked[n.pubkey][1]]
+        return self._synced_members_nodes
@@ -0,0 +1,121 @@
+import attr
+import logging
+from .nodes_consensus import NodesConsensus
+
+
+@attr.s()
+class NodesStore:
+    """
+    Holds the nodes of a currency in memory.
+    The nodes changed since the last flush are tracked,
+    and written to the repository in batches when the store is flushed.
+
+    :param sakia.data.repositories.NodesRepo repo: the repository of the nodes
+    :param str currency: the currency of the nodes
+    """
+    _repo = attr.ib()
+    currency = attr.ib()
+    consensus = attr.ib(default=attr.Factory(NodesConsensus), init=False)
+    _nodes = attr.ib(default=attr.Factory(dict), init=False)
+    _persisted = attr.ib(default=attr.Factory(set), init=False)
+    _dirty = attr.ib(default=attr.Factory(set), init=False)
+    _deleted = attr.ib(default=attr.Factory(dict), init=False)
+    _updates = attr.ib(default=0, init=False)
+    _writes = attr.ib(default=0, init=False)
+    _logger = attr.ib(default=attr.Factory(lambda: logging.getLogger('sakia')), init=False)
+
+    @classmethod
+    def load(cls, repo, currency):
+        """
+        Load the nodes of a currency from the repository
+        :param sakia.data.repositories.NodesRepo repo: the repository of the nodes
+        :param str currency: the currency of the nodes
+        :rtype: NodesStore
+        """
+        store = cls(repo, currency)
+        for node in repo.get_all(currency=currency):
+            store._nodes[node.pubkey] = node
+            store._persisted.add(node.pubkey)
+            store.consensus.update(node)
+        return store
+
+    def get(self, pubkey):
+        """
+        Get a node
+        :param str pubkey: the pubkey of the node
+        :return: the node, None if it is unknown
+        :rtype: sakia.data.entities.Node
+        """
+        return self._nodes.get(pubkey)
+
+    def all(self):
+        """
+        Get all the nodes
+        :rtype: List[sakia.data.entities.Node]
+        """
+        return list(self._nodes.values())
+
+    def put(self, node):
+        """
+        Store the new state of a node, written to the repository on the next flush
+        :param sakia.data.entities.Node node: the node
+        """
+        self._nodes[node.pubkey] = node
+        self._deleted.pop(node.pubkey, None)
+        self._dirty.add(node.pubkey)
+        self._updates += 1
+        self.consensus.update(node)
+
+    def remove(self, node):
+        """
+        Remove a node, dropped from the repository on the next flush
+        :param sakia.data.entities.Node node: the node
+        """
+        self._nodes.pop(node.pubkey, None)
+        self._dirty.discard(node.pubkey)
+        if node.pubkey in self._persisted:
+            self._deleted[node.pubkey] = node
+        self.consensus.remove(node)
+
+    def pending(self):
+        """
+        The number of nodes changes waiting to be written
+        :rtype: int
+        """
+        return len(self._dirty) + len(self._deleted)
+
+    def stats(self):
+        """
+        Get the monitoring data of the store :
+        the number of nodes updates received, of rows written and of changes waiting to be written
+        :rtype: dict
+        """
+        return {'nodes': len(self._nodes),
+                'updates': self._updates,
+                'writes': self._writes,
+                'pending': self.pending()}
+
+    def flush(self):
+        """
+        Write the changed nodes to the repository.
+        The nodes updated many times since the last flush are written once.
+        :return: the number of rows written
+        :rtype: int
+        """
+        inserted = [self._nodes[p] for p in self._dirty if p not in self._persisted]
+        updated = [self._nodes[p] for p in self._dirty if p in self._persisted]
+        deleted = list(self._deleted.values())
+        for node in deleted:
+            self._repo.drop(node)
+        self._repo.insert_all(inserted)
+        self._repo.update_all(updated)
+
+        self._persisted.update(self._dirty)
+        self._persisted.difference_update(self._deleted.keys())
+        self._dirty.clear()
+        self._deleted.clear()
+        written = len(inserted) + len(updated) + len(deleted)
+        self._writes += written
+        if written:
+            self._logger.debug("Wrote {0} nodes of {1}".format(written, self.currency))
+        return written
@@ -24,7 +24,7 @@ class SourcesProcessor:
         :param sakia.app.Application app: the app
         """
         return cls(app.db.sources_repo,
-                   BmaConnector(NodesProcessor(app.db.nodes_repo), app.parameters))
+                   app.bma_connector)
 
     def commit(self, source):
         try:
@@ -25,7 +25,7 @@ class TransactionsProcessor:
         :param sakia.app.Application app: the app
         """
         return cls(app.db.transactions_repo,
-                   BmaConnector(NodesProcessor(app.db.nodes_repo), app.parameters))
+                   app.bma_connector)
 
     def next_txid(self, currency, block_number):
         """
@@ -103,6 +103,31 @@ class TransactionsProcessor:
                 return True
         return False
 
+    def rollback(self, currency, block_number):
+        """
+        Revert the transactions written in the blockchain after a given block.
+        The transactions sent locally wait again to be written,
+        the other ones are dropped until they are found again in the blockchain.
+
+        :param str currency: the currency of the transactions
+        :param int block_number: the number of the last block kept
+        :return: the transactions sent locally which wait again, and the transactions dropped
+        :rtype: Tuple[List[sakia.data.entities.Transaction], List[sakia.data.entities.Transaction]]
+        """
+        awaiting = []
+        dropped = []
+        for tx in self._repo.get_written_after(currency, block_number):
+            if tx.local and tx.raw:
+                tx.state = Transaction.AWAITING
+                tx.written_block = tx.blockstamp.number if tx.blockstamp else 0
+                self._repo.update(tx)
+                awaiting.append(tx)
+            else:
+                self._repo.drop(tx)
+                tx.state = Transaction.DROPPED
+                dropped.append(tx)
+        return awaiting, dropped
+
     def cancel(self, tx):
         """
         Cancel a local transaction
@@ -115,6 +140,9 @@ class TransactionsProcessor:
         Send a transaction and update the transfer state to AWAITING if accepted.
         If the transaction was refused (return code != 200), state becomes REFUSED
         The txdoc is saved as the transfer txdoc.
+        The state is updated as soon as a node accepts the transaction :
+        the broadcast returns on the first acceptance, and the answers of the other nodes
+        are only recorded in the nodes scoreboard in the background.
 
         :param sakia.data.entities.Transaction tx: the transaction
         :param currency: The community target of the transaction
@@ -0,0 +1,15 @@
+BEGIN TRANSACTION ;
+
+-- BLOCKS TABLE
+CREATE TABLE IF NOT EXISTS blocks(
+   currency       VARCHAR(30),
+   number         INT,
+   sha_hash       VARCHAR(100),
+   previous_hash  VARCHAR(100),
+   median_time    INT,
+   data           TEXT,
+   last_access    REAL,
+   PRIMARY KEY (currency, number)
+);
+
+COMMIT;
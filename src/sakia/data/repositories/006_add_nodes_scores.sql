@@ -0,0 +1,7 @@
+BEGIN TRANSACTION ;
+
+ALTER TABLE nodes ADD COLUMN latency REAL DEFAULT 0;
+ALTER TABLE nodes ADD COLUMN error_rate REAL DEFAULT 0;
+ALTER TABLE nodes ADD COLUMN limitations INTEGER DEFAULT 0;
+
+COMMIT;
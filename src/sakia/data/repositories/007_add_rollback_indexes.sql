@@ -0,0 +1,7 @@
+BEGIN TRANSACTION ;
+
+CREATE INDEX IF NOT EXISTS transactions_written_on ON transactions(currency, written_on);
+CREATE INDEX IF NOT EXISTS dividends_block_number ON dividends(currency, block_number);
+CREATE INDEX IF NOT EXISTS certifications_written_on ON certifications(currency, written_on);
+
+COMMIT;
@@ -0,0 +1,6 @@
+BEGIN TRANSACTION ;
+
+ALTER TABLE nodes ADD COLUMN failures INTEGER DEFAULT 0;
+ALTER TABLE nodes ADD COLUMN retry_time INTEGER DEFAULT 0;
+
+COMMIT;
@@ -0,0 +1,17 @@
+BEGIN TRANSACTION ;
+
+-- The numbers of the blocks with identities or money data
+CREATE TABLE IF NOT EXISTS blocks_index(
+   currency       VARCHAR(30),
+   number         INT,
+   PRIMARY KEY (currency, number)
+);
+
+-- The last block of the blockchain scanned to build the index
+CREATE TABLE IF NOT EXISTS blocks_index_heights(
+   currency       VARCHAR(30),
+   number         INT,
+   PRIMARY KEY (currency)
+);
+
+COMMIT;
@@ -8,3 +8,5 @@ from .connections import ConnectionsRepo
 from .sources import SourcesRepo
 from .dividends import DividendsRepo
 from .contacts import ContactsRepo
+from .blocks import BlocksRepo
+from .blocks_index import BlocksIndexRepo
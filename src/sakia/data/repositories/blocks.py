@@ -0,0 +1,139 @@
+import attr
+
+from ..entities import BlockHeader
+
+
+@attr.s(frozen=True)
+class BlocksRepo:
+    """The repository for BlockHeader entities.
+    """
+    _conn = attr.ib()  # :type sqlite3.Connection
+    _primary_keys = (BlockHeader.currency, BlockHeader.number)
+
+    def insert(self, header):
+        """
+        Commit a block header to the database
+        :param sakia.data.entities.BlockHeader header: the header to commit
+        """
+        header_tuple = attr.astuple(header)
+        values = ",".join(['?'] * len(header_tuple))
+        self._conn.execute("INSERT INTO blocks VALUES ({0})".format(values), header_tuple)
+
+    def update(self, header):
+        """
+        Update an existing block header in the database
+        :param sakia.data.entities.BlockHeader header: the header to update
+        """
+        updated_fields = attr.astuple(header, filter=attr.filters.exclude(*BlocksRepo._primary_keys))
+        where_fields = attr.astuple(header, filter=attr.filters.include(*BlocksRepo._primary_keys))
+        self._conn.execute("""UPDATE blocks SET
+                              sha_hash=?,
+                              previous_hash=?,
+                              median_time=?,
+                              data=?,
+                              last_access=?
+                              WHERE
+                              currency=? AND
+                              number=?""",
+                           updated_fields + where_fields)
+
+    def touch(self, currency, accesses):
+        """
+        Update the last access time of block headers
+        :param str currency: the currency of the blocks
+        :param dict accesses: the last access times, by number of block
+        """
+        self._conn.executemany("UPDATE blocks SET last_access=? WHERE currency=? AND number=?",
+                               [(last_access, currency, number) for number, last_access in accesses.items()])
+
+    def get_one(self, **search):
+        """
+        Get an existing block header in the database
+        :param dict search: the criterions of the lookup
+        :rtype: sakia.data.entities.BlockHeader
+        """
+        filters = []
+        values = []
+        for k, v in search.items():
+            filters.append("{k}=?".format(k=k))
+            values.append(v)
+
+        request = "SELECT * FROM blocks WHERE {filters}".format(filters=" AND ".join(filters))
+
+        c = self._conn.execute(request, tuple(values))
+        data = c.fetchone()
+        if data:
+            return BlockHeader(*data)
+
+    def get_all(self, **search):
+        """
+        Get all existing block headers in the database corresponding to the search
+        :param dict search: the criterions of the lookup
+        :rtype: List[sakia.data.entities.BlockHeader]
+        """
+        filters = []
+        values = []
+        for k, v in search.items():
+            filters.append("{key} = ?".format(key=k))
+            values.append(v)
+
+        request = "SELECT * FROM blocks WHERE {filters} ORDER BY number".format(filters=" AND ".join(filters))
+
+        c = self._conn.execute(request, tuple(values))
+        datas = c.fetchall()
+        if datas:
+            return [BlockHeader(*data) for data in datas]
+        return []
+
+    def get_before(self, currency, number, limit):
+        """
+        Get the block headers below a given block, the most recent first
+        :param str currency: the currency of the blocks
+        :param int number: the number of the block
+        :param int limit: the maximum number of headers
+        :rtype: List[sakia.data.entities.BlockHeader]
+        """
+        c = self._conn.execute("""SELECT * FROM blocks
+                                  WHERE currency=? AND number<?
+                                  ORDER BY number DESC
+                                  LIMIT ?""", (currency, number, limit))
+        return [BlockHeader(*data) for data in c.fetchall()]
+
+    def count_documents(self, currency):
+        """
+        Count the block headers keeping their full json document
+        :param str currency: the currency of the blocks
+        :rtype: int
+        """
+        c = self._conn.execute("SELECT COUNT(*) FROM blocks WHERE currency=? AND data IS NOT NULL", (currency,))
+        return c.fetchone()[0]
+
+    def evict_documents(self, currency, count):
+        """
+        Drop the json documents of the least recently accessed blocks.
+        The headers are kept.
+        :param str currency: the currency of the blocks
+        :param int count: the number of documents to drop
+        """
+        self._conn.execute("""UPDATE blocks SET data=NULL
+                              WHERE currency=? AND number IN (
+                                SELECT number FROM blocks
+                                WHERE currency=? AND data IS NOT NULL
+                                ORDER BY last_access ASC
+                                LIMIT ?)""", (currency, currency, count))
+
+    def drop(self, header):
+        """
+        Drop an existing block header from the database
+        :param sakia.data.entities.BlockHeader header: the header to drop
+        """
+        where_fields = attr.astuple(header, filter=attr.filters.include(*BlocksRepo._primary_keys))
+        self._conn.execute("DELETE FROM blocks WHERE currency=? AND number=?", where_fields)
+
+    def drop_after(self, currency, number):
+        """
+        Drop the block headers above a given block
+        :param str currency: the currency of the blocks
+        :param int number: the number of the block
+        """
+        self._conn.execute("DELETE FROM blocks WHERE currency=? AND number>?", (currency, number))
@@ -0,0 +1,65 @@
+import attr
+
+
+@attr.s(frozen=True)
+class BlocksIndexRepo:
+    """The repository of the numbers of the blocks with identities or money data.
+    """
+    _conn = attr.ib()  # :type sqlite3.Connection
+
+    def height(self, currency):
+        """
+        Get the number of the last block scanned to build the index
+        :param str currency: the currency of the blocks
+        :return: the number of the block, None if no block was scanned
+        :rtype: int
+        """
+        c = self._conn.execute("SELECT number FROM blocks_index_heights WHERE currency=?", (currency,))
+        data = c.fetchone()
+        if data:
+            return data[0]
+
+    def set_height(self, currency, number):
+        """
+        Set the number of the last block scanned to build the index
+        :param str currency: the currency of the blocks
+        :param int number: the number of the block
+        """
+        self._conn.execute("INSERT OR REPLACE INTO blocks_index_heights VALUES (?, ?)", (currency, number))
+
+    def insert_all(self, currency, numbers):
+        """
+        Add blocks numbers to the index
+        :param str currency: the currency of the blocks
+        :param List[int] numbers: the numbers of the blocks
+        """
+        self._conn.executemany("INSERT OR IGNORE INTO blocks_index VALUES (?, ?)",
+                               [(currency, n) for n in numbers])
+
+    def get_after(self, currency, number):
+        """
+        Get the numbers of the blocks indexed above a given block
+        :param str currency: the currency of the blocks
+        :param int number: the number of the block
+        :rtype: List[int]
+        """
+        c = self._conn.execute("""SELECT number FROM blocks_index
+                                  WHERE currency=? AND number>?
+                                  ORDER BY number""", (currency, number))
+        return [data[0] for data in c.fetchall()]
+
+    def drop_until(self, currency, number):
+        """
+        Drop the blocks numbers up to a given block
+        :param str currency: the currency of the blocks
+        :param int number: the number of the block
+        """
+        self._conn.execute("DELETE FROM blocks_index WHERE currency=? AND number<=?", (currency, number))
+
+    def drop_after(self, currency, number):
+        """
+        Drop the blocks numbers above a given block
+        :param str currency: the currency of the blocks
+        :param int number: the number of the block
+        """
+        self._conn.execute("DELETE FROM blocks_index WHERE currency=? AND number>?", (currency, number))
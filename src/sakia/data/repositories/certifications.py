@@ -118,6 +118,17 @@ class CertificationsRepo:
         if data:
             return Certification(*data)
 
+    def get_written_after(self, currency, block_number):
+        """
+        Get the certifications written in the blockchain after a given block
+        :param str currency: the currency of the certifications
+        :param int block_number: the number of the block
+        :rtype: List[sakia.data.entities.Certification]
+        """
+        c = self._conn.execute("SELECT * FROM certifications WHERE currency=? AND written_on>?",
+                               (currency, block_number))
+        return [Certification(*data) for data in c.fetchall()]
+
     def drop(self, certification):
         """
         Drop an existing certification from the database
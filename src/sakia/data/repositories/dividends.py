@@ -81,6 +81,18 @@ class DividendsRepo:
             return [Dividend(*data) for data in datas]
         return []
 
+    def get_after(self, currency, block_number):
+        """
+        Get the dividends created after a given block
+        :param str currency: the currency of the dividends
+        :param int block_number: the number of the block
+        :rtype: List[sakia.data.entities.Dividend]
+        """
+        c = self._conn.execute("""SELECT * FROM dividends
+                                  WHERE currency=? AND block_number>?
+                                  ORDER BY block_number DESC""", (currency, block_number))
+        return [Dividend(*data) for data in c.fetchall()]
+
     def drop(self, dividend):
         """
         Drop an existing dividend from the database
@@ -12,6 +12,8 @@ from .dividends import DividendsRepo
 from .nodes import NodesRepo
 from .sources import SourcesRepo
 from .contacts import ContactsRepo
+from .blocks import BlocksRepo
+from .blocks_index import BlocksIndexRepo
 
 
 @attr.s(frozen=True)
@@ -29,6 +31,8 @@ class SakiaDatabase:
     sources_repo = attr.ib(default=None)
     dividends_repo = attr.ib(default=None)
     contacts_repo = attr.ib(default=None)
+    blocks_repo = attr.ib(default=None)
+    blocks_index_repo = attr.ib(default=None)
     _logger = attr.ib(default=attr.Factory(lambda: logging.getLogger('sakia')))
 
     @classmethod
@@ -40,7 +44,8 @@ class SakiaDatabase:
         con = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
         meta = SakiaDatabase(con, ConnectionsRepo(con), IdentitiesRepo(con),
                              BlockchainsRepo(con), CertificationsRepo(con), TransactionsRepo(con),
-                             NodesRepo(con), SourcesRepo(con), DividendsRepo(con), ContactsRepo(con))
+                             NodesRepo(con), SourcesRepo(con), DividendsRepo(con), ContactsRepo(con),
+                             BlocksRepo(con), BlocksIndexRepo(con))
 
         meta.prepare()
         meta.upgrade_database()
@@ -68,7 +73,12 @@ class SakiaDatabase:
             self.add_contacts,
             self.add_sentry_property,
             self.add_last_state_change_property,
-            self.refactor_transactions
+            self.refactor_transactions,
+            self.add_blocks,
+            self.add_nodes_scores,
+            self.add_rollback_indexes,
+            self.add_nodes_retries,
+            self.add_blocks_index
         ]
 
     def upgrade_database(self, to=0):
@@ -146,6 +156,56 @@ class SakiaDatabase:
         with self.conn:
             self.conn.executescript(sql_file.read())
 
+    def add_blocks(self):
+        """
+        Init the blocks table
+        :return:
+        """
+        self._logger.debug("Add blocks table")
+        sql_file = open(os.path.join(os.path.dirname(__file__), '005_add_blocks.sql'), 'r')
+        with self.conn:
+            self.conn.executescript(sql_file.read())
+
+    def add_nodes_scores(self):
+        """
+        Add the scores of the nodes
+        :return:
+        """
+        self._logger.debug("Add nodes scores")
+        sql_file = open(os.path.join(os.path.dirname(__file__), '006_add_nodes_scores.sql'), 'r')
+        with self.conn:
+            self.conn.executescript(sql_file.read())
+
+    def add_rollback_indexes(self):
+        """
+        Index the rows by block number to revert them quickly
+        :return:
+        """
+        self._logger.debug("Add rollback indexes")
+        sql_file = open(os.path.join(os.path.dirname(__file__), '007_add_rollback_indexes.sql'), 'r')
+        with self.conn:
+            self.conn.executescript(sql_file.read())
+
+    def add_nodes_retries(self):
+        """
+        Add the retry state of the nodes
+        :return:
+        """
+        self._logger.debug("Add nodes retries")
+        sql_file = open(os.path.join(os.path.dirname(__file__), '008_add_nodes_retries.sql'), 'r')
+        with self.conn:
+            self.conn.executescript(sql_file.read())
+
+    def add_blocks_index(self):
+        """
+        Add the index of the blocks with identities or money data
+        :return:
+        """
+        self._logger.debug("Add blocks index")
+        sql_file = open(os.path.join(os.path.dirname(__file__), '009_add_blocks_index.sql'), 'r')
+        with self.conn:
+            self.conn.executescript(sql_file.read())
+
     def version(self):
         with self.conn:
             c = self.conn.execute("SELECT * FROM meta WHERE id=1")
@@ -11,29 +11,53 @@ class NodesRepo:
     _conn = attr.ib()  # :type sqlite3.Connection
     _primary_keys = (Node.currency, Node.pubkey)
 
+    @staticmethod
+    def _insert_values(node):
+        node_tuple = attr.astuple(node, tuple_factory=list)
+        node_tuple[2] = "\n".join([str(n) for n in node_tuple[2]])
+        node_tuple[12] = "\n".join([str(n) for n in node_tuple[12]])
+        return node_tuple
+
+    @staticmethod
+    def _update_values(node):
+        updated_fields = attr.astuple(node, tuple_factory=list,
+                                      filter=attr.filters.exclude(*NodesRepo._primary_keys))
+        updated_fields[0] = "\n".join([str(n) for n in updated_fields[0]])
+        updated_fields[10] = "\n".join([str(n) for n in updated_fields[10]])
+        where_fields = attr.astuple(node, tuple_factory=list,
+                                    filter=attr.filters.include(*NodesRepo._primary_keys))
+        return updated_fields + where_fields
+
     def insert(self, node):
         """
         Commit a node to the database
         :param sakia.data.entities.Node node: the node to commit
         """
-        node_tuple = attr.astuple(node, tuple_factory=list)
-        node_tuple[2] = "\n".join([str(n) for n in node_tuple[2]])
-        node_tuple[12] = "\n".join([str(n) for n in node_tuple[12]])
-        values = ",".join(['?'] * len(node_tuple))
-        self._conn.execute("INSERT INTO nodes VALUES ({0})".format(values), node_tuple)
+        self.insert_all([node])
+
+    def insert_all(self, nodes):
+        """
+        Commit nodes to the database in a single statement
+        :param List[sakia.data.entities.Node] nodes: the nodes to commit
+        """
+        rows = [NodesRepo._insert_values(n) for n in nodes]
+        if rows:
+            values = ",".join(['?'] * len(rows[0]))
+            self._conn.executemany("INSERT INTO nodes VALUES ({0})".format(values), rows)
 
     def update(self, node):
         """
         Update an existing node in the database
         :param sakia.data.entities.Node node: the node to update
         """
-        updated_fields = attr.astuple(node, tuple_factory=list,
-                                      filter=attr.filters.exclude(*NodesRepo._primary_keys))
-        updated_fields[0] = "\n".join([str(n) for n in updated_fields[0]])
-        updated_fields[10] = "\n".join([str(n) for n in updated_fields[9]])
-        where_fields = attr.astuple(node, tuple_factory=list,
-                                    filter=attr.filters.include(*NodesRepo._primary_keys))
-        self._conn.execute("""UPDATE nodes SET
+        self.update_all([node])
+
+    def update_all(self, nodes):
+        """
+        Update existing nodes in the database in a single statement
+        :param List[sakia.data.entities.Node] nodes: the nodes to update
+        """
+        self._conn.executemany("""UPDATE nodes SET
                                     endpoints=?,
                                     peer_buid=?,
                                     uid=?,
@@ -47,11 +71,16 @@ class NodesRepo:
                                     merkle_peers_leaves=?,
                                     root=?,
                                     member=?,
-                                    last_state_change=?
+                                    last_state_change=?,
+                                    latency=?,
+                                    error_rate=?,
+                                    limitations=?,
+                                    failures=?,
+                                    retry_time=?
                                    WHERE
                                    currency=? AND
                                    pubkey=?""",
-                                   updated_fields + where_fields)
+                               [NodesRepo._update_values(n) for n in nodes])
 
     def get_one(self, **search):
         """
@@ -101,6 +130,26 @@ class NodesRepo:
             return [Node(*data) for data in datas]
         return []
 
+    def get_by_pubkeys(self, currency, pubkeys):
+        """
+        Get the existing nodes of the given pubkeys
+        :param str currency: the currency of the nodes
+        :param List[str] pubkeys: the pubkeys of the nodes
+        :return: the nodes found, by pubkey
+        :rtype: Dict[str, sakia.data.entities.Node]
+        """
+        nodes = {}
+        pubkeys = list(pubkeys)
+        # Stay below the maximum number of variables of a sqlite statement
+        for i in range(0, len(pubkeys), 500):
+            chunk = pubkeys[i:i + 500]
+            c = self._conn.execute("SELECT * FROM nodes WHERE currency=? AND pubkey IN ({0})"
+                                   .format(",".join(['?'] * len(chunk))), [currency] + chunk)
+            for data in c.fetchall():
+                node = Node(*data)
+                nodes[node.pubkey] = node
+        return nodes
+
     def drop(self, node):
         """
         Drop an existing node from the database
@@ -119,6 +119,18 @@ class TransactionsRepo:
             return [Transaction(*data) for data in datas]
         return []
 
+    def get_written_after(self, currency, block_number):
+        """
+        Get the transactions written in the blockchain after a given block
+        :param str currency: the currency of the transactions
+        :param int block_number: the number of the block
+        :rtype: List[sakia.data.entities.Transaction]
+        """
+        c = self._conn.execute("""SELECT * FROM transactions
+                                  WHERE currency=? AND written_on>?
+                                  ORDER BY written_on DESC""", (currency, block_number))
+        return [Transaction(*data) for data in c.fetchall()]
+
     def drop(self, transaction):
         """
         Drop an existing transaction from the database
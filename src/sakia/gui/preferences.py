@@ -64,7 +64,8 @@ class PreferencesDialog(QDialog, Ui_PreferencesDialog):
                                     proxy_address=self.edit_proxy_address.text(),
                                     proxy_port=self.spinbox_proxy_port.value(),
                                     proxy_user=self.edit_proxy_username.text(),
-                                    proxy_password=self.edit_proxy_password.text())
+                                    proxy_password=self.edit_proxy_password.text(),
+                                    blocks_confirmation_depth=self.app.parameters.blocks_confirmation_depth)
         self.app.save_parameters(parameters)
       # change UI translation
         self.app.switch_language()
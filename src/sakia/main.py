@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import multiprocessing
 import signal
 import sys
 import traceback
@@ -74,6 +75,8 @@ def exception_message(log_lines, exc_info):
     mb.exec()
 
 if __name__ == '__main__':
+    # The documents are parsed in worker processes, which must not start sakia again when frozen
+    multiprocessing.freeze_support()
     # activate ctrl-c interrupt
     signal.signal(signal.SIGINT, signal.SIG_DFL)
     sakia = QApplication(sys.argv)
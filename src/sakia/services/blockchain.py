@@ -2,9 +2,14 @@ import asyncio
 from PyQt5.QtCore import QObject
 import math
 import logging
+from duniterpy.api import errors
 from duniterpy.api.errors import DuniterError
+from duniterpy.documents import BlockUID
 from sakia.errors import NoPeerAvailable
 
+# The number of blocks batches downloaded in advance while a batch is handled
+PREFETCH_BATCHES = 2
+
 
 class BlockchainService(QObject):
     """
@@ -12,7 +17,7 @@ class BlockchainService(QObject):
     to update data locally
     """
     def __init__(self, app, currency, blockchain_processor, bma_connector,
-                 identities_service, transactions_service, sources_service):
+                 identities_service, transactions_service, sources_service, blocks_processor=None):
         """
         Constructor the identities service
 
@@ -23,6 +28,7 @@ class BlockchainService(QObject):
         :param sakia.services.IdentitiesService identities_service: The identities service
         :param sakia.services.TransactionsService transactions_service: The transactions service
         :param sakia.services.SourcesService sources_service: The sources service
+        :param sakia.data.processors.BlocksProcessor blocks_processor: the processor of the blocks kept locally
         """
         super().__init__()
         self.app = app
@@ -32,63 +38,170 @@ class BlockchainService(QObject):
         self._identities_service = identities_service
         self._transactions_service = transactions_service
         self._sources_service = sources_service
+        self._blocks_processor = blocks_processor
         self._logger = logging.getLogger('sakia')
-        self._update_lock = False
+        self._update_lock = asyncio.Lock()
 
     def initialized(self):
         return self._blockchain_processor.initialized(self.app.currency)
 
     def handle_new_blocks(self, blocks):
+        if self._blocks_processor:
+            self._blocks_processor.record_blockstamp(self.currency, self.current_buid())
+            self._blocks_processor.record_headers(self.currency, blocks)
         self._blockchain_processor.handle_new_blocks(self.currency, blocks)
 
     async def new_blocks(self, network_blockstamp):
-        with_identities = await self._blockchain_processor.new_blocks_with_identities(self.currency)
-        with_money = await self._blockchain_processor.new_blocks_with_money(self.currency)
-        block_numbers = with_identities + with_money
+        block_numbers = await self._blockchain_processor.indexed_new_blocks(self.currency,
+                                                                            network_blockstamp.number)
         if network_blockstamp > self.current_buid():
             block_numbers += [network_blockstamp.number]
         return block_numbers
 
+    async def fetch_blocks(self, network_blockstamp, queue):
+        """
+        Download the new blocks batch after batch, ahead of the batches being handled.
+        The list of the wanted blocks is requested again when all of them were downloaded.
+        A None batch is put in the queue when there is no more block to download.
+
+        :param duniterpy.documents.BlockUID network_blockstamp: the current block of the network
+        :param asyncio.Queue queue: the queue of the downloaded batches
+        """
+        try:
+            start = self.current_buid().number
+            block_numbers = await self.new_blocks(network_blockstamp)
+            while block_numbers:
+                self._logger.debug("Downloading from {0}".format(start))
+                blocks = await self._blockchain_processor.next_blocks(start, block_numbers, self.currency)
+                if not blocks:
+                    break
+                await queue.put(blocks)
+                start = blocks[-1].number
+                block_numbers = [n for n in block_numbers if n > start]
+                if not block_numbers:
+                    block_numbers = [n for n in await self.new_blocks(network_blockstamp) if n > start]
+            await queue.put(None)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The batches already downloaded are handled before the error is raised
+            await queue.put(None)
+            raise
+
+    async def apply_blocks(self, blocks):
+        """
+        Update the local data from a batch of new blocks, and notify the changes
+
+        :param List[duniterpy.documents.Block] blocks: the blocks
+        """
+        self._logger.debug("Parsing from {0}".format(blocks[0].number))
+        identities = await self._identities_service.handle_new_blocks(blocks)
+        changed_tx, new_tx, new_dividends = await self._transactions_service.handle_new_blocks(blocks)
+        destructions = await self._sources_service.refresh_sources(new_tx, new_dividends)
+        self.handle_new_blocks(blocks)
+        self.app.db.commit()
+        for tx in changed_tx:
+            self.app.transaction_state_changed.emit(tx)
+        for conn in new_tx:
+            for tx in new_tx[conn]:
+                self.app.new_transfer.emit(conn, tx)
+        for conn in destructions:
+            for tx in destructions[conn]:
+                self.app.new_transfer.emit(conn, tx)
+        for conn in new_dividends:
+            for ud in new_dividends[conn]:
+                self.app.new_dividend.emit(conn, ud)
+        for idty in identities:
+            self.app.identity_changed.emit(idty)
+        self.app.new_blocks_handled.emit()
+
     async def handle_blockchain_progress(self, network_blockstamp):
         """
-        Handle a new current block uid
+        Handle a new current block uid.
+        The next batch of blocks is downloaded while the current one is handled.
 
         :param duniterpy.documents.BlockUID network_blockstamp:
         """
-        if self._blockchain_processor.initialized(self.currency) and not self._update_lock:
+        if self._blockchain_processor.initialized(self.currency) and not self._update_lock.locked():
+            async with self._update_lock:
+                try:
+                    queue = asyncio.Queue(maxsize=PREFETCH_BATCHES)
+                    download = asyncio.ensure_future(self.fetch_blocks(network_blockstamp, queue))
+                    try:
+                        blocks = await queue.get()
+                        while blocks:
+                            await self.apply_blocks(blocks)
+                            blocks = await queue.get()
+                        # Raise the errors of the download
+                        await download
+                    finally:
+                        download.cancel()
+                    self.app.sources_refreshed.emit()
+                except (NoPeerAvailable, DuniterError) as e:
+                    self._logger.debug(str(e))
+
+    async def common_ancestor(self):
+        """
+        Find the last block handled locally which is still in the blockchain of the network.
+        The blocks handled locally are checked from the most recent one,
+        so the number of requests grows with the depth of the fork.
+        The blocks are requested to the network : the local cache may still hold the blocks of the dead branch.
+
+        :return: the block of the network, None if no block handled locally is in the blockchain
+        :rtype: duniterpy.documents.Block
+        """
+        current_buid = self.current_buid()
+        candidates = [current_buid]
+        if self._blocks_processor:
+            candidates += [BlockUID(h.number, h.sha_hash)
+                           for h in self._blocks_processor.local_headers(self.currency, current_buid.number)]
+        for blockstamp in candidates:
+            try:
+                block = await self._blockchain_processor.get_block(self.currency, blockstamp.number, cached=False)
+                if block and block.blockUID == blockstamp:
+                    return block
+            except DuniterError as e:
+                if e.ucode != errors.BLOCK_NOT_FOUND:
+                    raise
+            self._logger.debug("Block {0} is not in the blockchain anymore".format(blockstamp))
+
+    async def rollback(self, network_blockstamp):
+        """
+        Revert the data written after the last block shared with the network,
+        then handle the blocks of the new branch of the blockchain.
+
+        :param duniterpy.documents.BlockUID network_blockstamp: the current block of the network
+        """
+        if not self._blockchain_processor.initialized(self.currency):
+            return
+        # Let the blocks being handled be written before looking for the fork
+        async with self._update_lock:
             try:
-                self._update_lock = True
-                block_numbers = await self.new_blocks(network_blockstamp)
-                while block_numbers:
-                    start = self.current_buid().number
-                    self._logger.debug("Parsing from {0}".format(start))
-                    blocks = await self._blockchain_processor.next_blocks(start, block_numbers, self.currency)
-                    if len(blocks) > 0:
-                        identities = await self._identities_service.handle_new_blocks(blocks)
-                        changed_tx, new_tx, new_dividends = await self._transactions_service.handle_new_blocks(blocks)
-                        destructions = await self._sources_service.refresh_sources(new_tx, new_dividends)
-                        self.handle_new_blocks(blocks)
-                        self.app.db.commit()
-                        for tx in changed_tx:
-                            self.app.transaction_state_changed.emit(tx)
-                        for conn in new_tx:
-                            for tx in new_tx[conn]:
-                                self.app.new_transfer.emit(conn, tx)
-                        for conn in destructions:
-                            for tx in destructions[conn]:
-                                self.app.new_transfer.emit(conn, tx)
-                        for conn in new_dividends:
-                            for ud in new_dividends[conn]:
-                                self.app.new_dividend.emit(conn, ud)
-                        for idty in identities:
-                            self.app.identity_changed.emit(idty)
-                        self.app.new_blocks_handled.emit()
-                        block_numbers = await self.new_blocks(network_blockstamp)
-                self.app.sources_refreshed.emit()
+                ancestor = await self.common_ancestor()
+                if not ancestor:
+                    self._logger.warning("No block in common with the network, "
+                                         "the profile must be synchronized again")
+                    return
+                if ancestor.blockUID == self.current_buid():
+                    self._logger.debug("No local block to revert")
+                else:
+                    self._logger.debug("Rollback to block {0}".format(ancestor.blockUID))
+                    number = ancestor.number
+                    await self._blockchain_processor.rollback(self.currency, ancestor)
+                    awaiting, dropped, dividends = self._transactions_service.rollback(number)
+                    self._sources_service.rollback(dropped, dividends)
+                    certifications = self._identities_service.rollback(number)
+                    if self._blocks_processor:
+                        self._blocks_processor.rollback(self.currency, number)
+                    self.app.db.commit()
+                    self._logger.debug("Reverted {0} transactions, {1} dividends and {2} certifications"
+                                       .format(len(awaiting) + len(dropped), len(dividends), len(certifications)))
+                    for tx in awaiting + dropped:
+                        self.app.transaction_state_changed.emit(tx)
             except (NoPeerAvailable, DuniterError) as e:
                 self._logger.debug(str(e))
-            finally:
-                self._update_lock = False
+                return
+        await self.handle_blockchain_progress(network_blockstamp)
 
     def current_buid(self):
         return self._blockchain_processor.current_buid(self.currency)
@@ -419,6 +419,15 @@ class IdentitiesService(QObject):
         need_refresh += await self._parse_certifications(block)
         return set(need_refresh)
 
+    def rollback(self, block_number):
+        """
+        Set back the certifications written after a given block as pending
+        :param int block_number: the number of the last block kept
+        :return: the certifications which are pending again
+        :rtype: List[sakia.data.entities.Certification]
+        """
+        return self._certs_processor.rollback(self.currency, block_number)
+
     async def handle_new_blocks(self, blocks):
         """
         Handle new block received and refresh local data
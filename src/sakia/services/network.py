@@ -1,6 +1,7 @@
 import asyncio
+import hashlib
 import logging
-import time
+from concurrent.futures import ThreadPoolExecutor
 
 from PyQt5.QtCore import pyqtSignal, pyqtSlot, QObject, Qt
 from duniterpy.api import errors
@@ -9,7 +10,30 @@ from duniterpy.key import VerifyingKey
 from sakia.data.connectors import NodeConnector
 from sakia.data.entities import Node
 from sakia.decorators import asyncify
-from sakia.errors import InvalidNodeCurrency
+from sakia.errors import InvalidNodeCurrency, NoPeerAvailable
+from .polling import NodesPollingScheduler
+
+# The number of peer documents verified at once on a worker thread
+PEERS_VERIFICATION_BATCH = 50
+PEERS_VERIFICATION_WORKERS = 2
+# The number of peer documents signatures remembered to drop the duplicates
+MAX_SEEN_PEERS = 10000
+# The number of peer documents discovered at once
+DISCOVERY_BATCH = 100
+# The number of nodes identities requested at the same time
+MAX_IDENTITIES_REQUESTS = 8
+# The interval between two writes of the changed nodes to the database, in seconds
+NODES_FLUSH_INTERVAL = 10
+
+
+def verify_peers(peers):
+    """
+    Verify the signatures of peer documents
+    :param List[duniterpy.documents.Peer] peers: the peer documents
+    :return: True for each peer document correctly signed
+    :rtype: List[bool]
+    """
+    return [VerifyingKey(peer.pubkey).verify_document(peer) for peer in peers]
 
 
 class NetworkService(QObject):
@@ -23,7 +47,8 @@ class NetworkService(QObject):
     latest_block_changed = pyqtSignal(BlockUID)
     root_nodes_changed = pyqtSignal()
 
-    def __init__(self, app, currency, node_processor, connectors, blockchain_service, identities_service):
+    def __init__(self, app, currency, node_processor, connectors, blockchain_service, identities_service,
+                 session_pool=None, max_concurrent_polls=8, max_websockets=10):
         """
         Constructor of a network
 
@@ -33,18 +58,31 @@ class NetworkService(QObject):
         :param list connectors: The connectors to nodes of the network
         :param sakia.services.BlockchainService blockchain_service: the blockchain service
         :param sakia.services.IdentitiesService identities_service: the identities service
+        :param sakia.data.connectors.SessionPool session_pool: the pool of connections shared by the connectors
+        :param int max_concurrent_polls: the maximum number of nodes polled at the same time
+        :param int max_websockets: the maximum number of nodes followed with websockets
         """
         super().__init__()
         self._app = app
         self._logger = logging.getLogger('sakia')
         self._processor = node_processor
+        self._session_pool = session_pool
+        self._scheduler = NodesPollingScheduler(max_concurrency=max_concurrent_polls,
+                                                max_websockets=max_websockets,
+                                                store_node=self._processor.update_node)
         self._connectors = []
+        # The online state and member flag of the nodes, which decide which ones are followed with websockets
+        self._websockets_ranks = {}
         for c in connectors:
             self.add_connector(c)
         self.currency = currency
         self._must_crawl = False
         self._block_found = self._processor.current_buid(self.currency)
         self._discovery_stack = []
+        self._peers_queue = []
+        self._seen_peers = set()
+        self._peers_verification_task = None
+        self._verifier = None
         self._blockchain_service = blockchain_service
         self._identities_service = identities_service
         self._discovery_loop_task = None
@@ -66,20 +104,28 @@ class NetworkService(QObject):
         return network
 
     @classmethod
-    def load(cls, app, currency, node_processor, blockchain_service, identities_service):
+    def load(cls, app, currency, node_processor, blockchain_service, identities_service, session_pool=None):
         """
         Create a new network with all known nodes
 
         :param sakia.app.Application app: Sakia application
         :param str currency: The currency of this service
         :param sakia.data.processors.NodeProcessor node_processor: The nodes processor
+        :param sakia.data.connectors.SessionPool session_pool: the pool of connections shared by the connectors
         :return:
         """
 
         connectors = []
         for node in node_processor.nodes(currency):
-            connectors.append(NodeConnector(node, app.parameters))
-        network = cls(app, currency, node_processor, connectors, blockchain_service, identities_service)
+            connectors.append(NodeConnector(node, app.parameters,
+                                            scoreboard=node_processor.scoreboard,
+                                            rate_limiter=node_processor.rate_limiter,
+                                            session_pool=session_pool,
+                                            headers_cache=node_processor.headers_cache,
+                                            seen_messages=node_processor.seen_messages))
+        network = cls(app, currency, node_processor, connectors, blockchain_service, identities_service,
+                      session_pool)
+        network.select_websockets()
         return network
 
     def start_coroutines(self):
@@ -103,6 +149,56 @@ class NetworkService(QObject):
     def current_buid(self):
         return self._processor.current_buid(self.currency)
 
+    def select_websockets(self):
+        """
+        Follow the best nodes with websockets, and poll the other ones
+        """
+        self._scheduler.select_websockets(self._processor.scoreboard)
+
+    def refresh_websockets(self, node_connector):
+        """
+        Select the nodes followed with websockets again if a node went online or offline,
+        or if its member flag changed. The other changes, like a new head, do not move a node
+        in the selection, and the changes of costs are taken into account by the flush loop.
+        :param sakia.data.connectors.NodeConnector node_connector: the connector of the node changed
+        """
+        node = node_connector.node
+        rank = (node.state == Node.ONLINE, node.member)
+        if self._websockets_ranks.get(node.pubkey) != rank:
+            self._websockets_ranks[node.pubkey] = rank
+            self.select_websockets()
+
+    def polling_stats(self):
+        """
+        Get the monitoring data of the nodes polling :
+        the number of nodes waiting to be polled, and the time of the last polling cycle
+        :rtype: dict
+        """
+        return self._scheduler.stats()
+
+    def nodes_stats(self):
+        """
+        Get the monitoring data of the nodes held in memory :
+        the number of nodes updates, of rows written to the database and of changes waiting to be written
+        :rtype: dict
+        """
+        return self._processor.stats(self.currency)
+
+    def websockets_stats(self):
+        """
+        Get the monitoring data of the websocket messages received from the nodes :
+        the number of messages and of duplicates, by kind of message
+        :rtype: dict
+        """
+        return self._processor.seen_messages.stats()
+
+    def flush_nodes(self):
+        """
+        Write the nodes changed since the last flush to the database, in a single transaction
+        """
+        if self._processor.flush(self.currency):
+            self._app.db.commit()
+
     async def stop_coroutines(self, closing=False):
         """
         Stop network nodes crawling.
@@ -115,6 +211,13 @@ class NetworkService(QObject):
         self._logger.debug("Closing {0} websockets".format(len(close_tasks)))
         if len(close_tasks) > 0:
             await asyncio.wait(close_tasks, timeout=15)
+        if self._verifier:
+            self._verifier.shutdown(wait=False)
+            self._verifier = None
+        # Save the nodes scores measured during this session
+        for connector in self._connectors:
+            self._processor.update_node(connector.node)
+        self.flush_nodes()
         self._logger.debug("Closed")
 
     def continue_crawling(self):
@@ -125,6 +228,9 @@ class NetworkService(QObject):
         Add a nod to the network.
         """
         self._connectors.append(node_connector)
+        self._scheduler.add(node_connector)
+        self._websockets_ranks[node_connector.node.pubkey] = (node_connector.node.state == Node.ONLINE,
+                                                              node_connector.node.member)
         node_connector.changed.connect(self.handle_change, type=Qt.UniqueConnection|Qt.QueuedConnection)
         node_connector.error.connect(self.handle_error, type=Qt.UniqueConnection|Qt.QueuedConnection)
         node_connector.identity_changed.connect(self.handle_identity_change, type=Qt.UniqueConnection|Qt.QueuedConnection)
@@ -142,95 +248,189 @@ class NetworkService(QObject):
         """
         Start crawling which never stops.
         To stop this crawling, call "stop_crawling" method.
+        The nodes are polled concurrently by the polling scheduler.
         """
         self._must_crawl = True
-        first_loop = True
         asyncio.ensure_future(self.discovery_loop())
-        while self.continue_crawling():
-            for connector in self._connectors:
-                if self.continue_crawling():
-                    await connector.init_session()
-                    connector.refresh()
-                    if not first_loop:
-                        await asyncio.sleep(15)
-            first_loop = False
-            await asyncio.sleep(15)
+        asyncio.ensure_future(self.flush_loop())
+        await self._scheduler.run(self.continue_crawling)
 
         self._logger.debug("End of network discovery")
 
     async def discovery_loop(self):
         """
-        Handle poping of nodes in discovery stack
+        Handle poping of nodes in discovery stack.
+        The stack is drained by batches of peers.
         :return:
         """
         while self.continue_crawling():
-            try:
+            if not self._discovery_stack:
                 await asyncio.sleep(1)
-                peer = self._discovery_stack.pop()
-            except IndexError:
-                await asyncio.sleep(2)
+                continue
+            peers = self._discovery_stack[-DISCOVERY_BATCH:]
+            del self._discovery_stack[-DISCOVERY_BATCH:]
+            await self.discover_peers(peers)
+            await asyncio.sleep(0)
+
+    async def flush_loop(self):
+        """
+        Write the changed nodes to the database every NODES_FLUSH_INTERVAL seconds
+        """
+        loop = asyncio.get_event_loop()
+        last_flush = loop.time()
+        last_updates = self.nodes_stats()['updates']
+        while self.continue_crawling():
+            await asyncio.sleep(1)
+            if loop.time() - last_flush >= NODES_FLUSH_INTERVAL:
+                self.flush_nodes()
+                # The costs of the nodes changed since the last flush
+                self.select_websockets()
+                updates = self.nodes_stats()['updates']
+                self._logger.debug("{0:.1f} nodes updates/s".format((updates - last_updates)
+                                                                      / (loop.time() - last_flush)))
+                last_flush = loop.time()
+                last_updates = updates
+
+    async def discover_peers(self, peers):
+        """
+        Add the unknown nodes of a batch of peers to the network,
+        and update the known ones.
+        :param List[duniterpy.documents.Peer] peers: the peer documents
+        """
+        unknown_peers, updated_nodes = self._processor.update_peers(self.currency, peers)
+        new_connectors = []
+        for peer in unknown_peers:
+            self._logger.debug("New node found : {0}".format(peer.pubkey[:5]))
+            try:
+                new_connectors.append(NodeConnector.from_peer(self.currency, peer, self._app.parameters,
+                                                              scoreboard=self._processor.scoreboard,
+                                                              rate_limiter=self._processor.rate_limiter,
+                                                              session_pool=self._session_pool,
+                                                              headers_cache=self._processor.headers_cache,
+                                                              seen_messages=self._processor.seen_messages))
+            except InvalidNodeCurrency as e:
+                self._logger.debug(str(e))
+        failing = [c for c in new_connectors if self._processor.restore_retries(c.node)]
+        self._processor.insert_nodes([c.node for c in new_connectors])
+        for connector in new_connectors:
+            self.add_connector(connector)
+        if new_connectors:
+            self.select_websockets()
+        for connector in new_connectors:
+            await connector.init_session()
+            # The nodes deleted for failing are polled again when their backoff ends
+            if connector not in failing:
+                connector.refresh(manual=True)
+            self.new_node_found.emit(connector.node)
+
+        connectors = {c.node.pubkey: c for c in self._connectors}
+        for node in updated_nodes:
+            connector = connectors.get(node.pubkey)
+            if connector:
+                connector.node.endpoints = node.endpoints
+                connector.node.peer_blockstamp = node.peer_blockstamp
+                if self._blockchain_service.initialized():
+                    connector.refresh_summary()
             else:
-                node, updated = self._processor.update_peer(self.currency, peer)
-                if not node:
-                    self._logger.debug("New node found : {0}".format(peer.pubkey[:5]))
-                    try:
-                        connector = NodeConnector.from_peer(self.currency, peer, self._app.parameters)
-                        node = connector.node
-                        self._processor.insert_node(connector.node)
-                        await connector.init_session()
-                        connector.refresh(manual=True)
-                        self.add_connector(connector)
-                        self.new_node_found.emit(node)
-                    except InvalidNodeCurrency as e:
-                        self._logger.debug(str(e))
-                if node and updated and self._blockchain_service.initialized():
-                    try:
-                        connector = next(conn for conn in self._connectors if conn.node == node)
-                    except StopIteration:
-                        self._logger.warning("A node not associated to"
-                                             " a connector was encoutered : {:}"
-                                             .format(node.pubkey[:7]))
-                    else:
-                        connector.refresh_summary()
-                        try:
-                            identity = await self._identities_service.find_from_pubkey(node.pubkey)
-                            identity = await self._identities_service.load_requirements(identity)
-                            node.member = identity.member
-                            node.uid = identity.uid
-                            self._processor.update_node(node)
-                            self.node_changed.emit(node)
-                        except errors.DuniterError as e:
-                            self._logger.error(e.message)
+                self._logger.warning("A node not associated to"
+                                     " a connector was encoutered : {:}"
+                                     .format(node.pubkey[:7]))
+
+        if self._blockchain_service.initialized():
+            await self.refresh_nodes_identities([c.node for c in new_connectors]
+                                                + [connectors[n.pubkey].node for n in updated_nodes
+                                                   if n.pubkey in connectors])
+
+    async def refresh_nodes_identities(self, nodes):
+        """
+        Refresh the uid and the membership of the identities of nodes,
+        requesting at most MAX_IDENTITIES_REQUESTS identities at the same time
+        :param List[sakia.data.entities.Node] nodes: the nodes
+        """
+        semaphore = asyncio.Semaphore(MAX_IDENTITIES_REQUESTS)
+
+        async def refresh_identity(node):
+            async with semaphore:
+                try:
+                    identity = await self._identities_service.find_from_pubkey(node.pubkey)
+                    identity = await self._identities_service.load_requirements(identity)
+                    node.member = identity.member
+                    node.uid = identity.uid
+                    return node
+                except errors.DuniterError as e:
+                    self._logger.error(e.message)
+                except NoPeerAvailable as e:
+                    self._logger.debug(str(e))
+
+        refreshed = [n for n in await asyncio.gather(*[refresh_identity(n) for n in nodes]) if n]
+        self._processor.update_nodes(refreshed)
+        for node in refreshed:
+            self.node_changed.emit(node)
 
     def handle_new_node(self, peer):
-        key = VerifyingKey(peer.pubkey)
-        if key.verify_document(peer):
-            if len(self._discovery_stack) < 1000 \
-               and peer.signatures[0] not in [p.signatures[0] for p in self._discovery_stack]:
-                self._logger.debug("Stacking new peer document : {0}".format(peer.pubkey))
-                self._discovery_stack.append(peer)
-        else:
-            self._logger.debug("Wrong document received : {0}".format(peer.signed_raw()))
+        """
+        Queue a peer document received from a node.
+        The documents already received are dropped before verifying their signature,
+        the new ones are verified in batches outside of the event loop.
+        The documents are recognized from their whole signed content, so that a forged document
+        with a copied signature does not hide the genuine one.
+        :param duniterpy.documents.Peer peer: the peer document
+        """
+        digest = hashlib.sha256(peer.signed_raw().encode('utf-8')).digest()
+        if digest in self._seen_peers:
+            return
+        if len(self._seen_peers) >= MAX_SEEN_PEERS:
+            self._seen_peers.clear()
+        self._seen_peers.add(digest)
+        self._peers_queue.append(peer)
+        if not self._peers_verification_task:
+            self._peers_verification_task = asyncio.ensure_future(self.verify_queued_peers())
+
+    async def verify_queued_peers(self):
+        """
+        Verify the queued peer documents on a worker thread,
+        and stack the valid ones to be discovered
+        """
+        if not self._verifier:
+            self._verifier = ThreadPoolExecutor(max_workers=PEERS_VERIFICATION_WORKERS)
+        try:
+            while self._peers_queue:
+                batch = self._peers_queue[:PEERS_VERIFICATION_BATCH]
+                del self._peers_queue[:PEERS_VERIFICATION_BATCH]
+                verified = await asyncio.get_event_loop().run_in_executor(self._verifier, verify_peers, batch)
+                for peer, valid in zip(batch, verified):
+                    if not valid:
+                        self._logger.debug("Wrong document received : {0}".format(peer.signed_raw()))
+                    elif len(self._discovery_stack) < 1000:
+                        self._logger.debug("Stacking new peer document : {0}".format(peer.pubkey))
+                        self._discovery_stack.append(peer)
+        finally:
+            self._peers_verification_task = None
 
     @pyqtSlot()
     def handle_identity_change(self):
         connector = self.sender()
         self._processor.update_node(connector.node)
         self.node_changed.emit(connector.node)
+        self.refresh_websockets(connector)
 
     def handle_error(self):
         node_connector = self.sender()
         if node_connector.node.state in (Node.OFFLINE, Node.CORRUPTED) \
-                and node_connector.node.last_state_change + 3600 < time.time():
+                and self._scheduler.given_up(node_connector):
             node_connector.disconnect()
             self._processor.delete_node(node_connector.node)
             self._connectors.remove(node_connector)
+            self._scheduler.remove(node_connector)
+            self._websockets_ranks.pop(node_connector.node.pubkey, None)
+            self.select_websockets()
             self.node_removed.emit(node_connector.node)
 
     def handle_change(self):
         node_connector = self.sender()
         self._processor.update_node(node_connector.node)
         self.node_changed.emit(node_connector.node)
+        self.refresh_websockets(node_connector)
 
         if node_connector.node.state == Node.ONLINE:
             current_buid = self._processor.current_buid(self.currency)
@@ -245,7 +445,7 @@ class NetworkService(QObject):
                    or node_connector.node.previous_buid != self._block_found:
                     self._logger.debug("Start rollback")
                     self._block_found = current_buid
-                    #TODO: self._blockchain_service.rollback()
+                    asyncio.ensure_future(self._blockchain_service.rollback(self._block_found))
                 else:
                     self._logger.debug("Start refresh")
                     self._block_found = current_buid
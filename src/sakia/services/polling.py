@@ -0,0 +1,222 @@
+import asyncio
+import attr
+import heapq
+import itertools
+import logging
+import random
+import time
+from sakia.data.entities import Node
+
+
+@attr.s()
+class NodesPollingScheduler:
+    """
+    Polls the nodes connectors concurrently, each one at its own pace.
+    Online members nodes are polled often, and the nodes which are offline
+    or corrupted are polled less and less often, after a jittered exponential backoff
+    so that the dead nodes are not all retried at the same time.
+    The number of failed polls and the time of the next poll are saved in the nodes,
+    so that the backoff goes on after a restart, and the nodes failing too many polls in a row are given up.
+    Only the best nodes are followed with websockets, the other ones are polled on HTTP GET.
+
+    :param int max_concurrency: the maximum number of nodes polled at the same time
+    :param int max_websockets: the maximum number of nodes followed with websockets
+    :param float member_interval: the interval between two polls of an online member node, in seconds
+    :param float online_interval: the interval between two polls of an online node, in seconds
+    :param float backoff_interval: the interval after a first failed poll, doubled after each new failure
+    :param float max_interval: the maximum interval between two polls, in seconds
+    :param float jitter: the maximum part of the backoff interval removed at random
+    :param int max_failures: the number of failed polls in a row after which a node is given up
+    :param float websockets_margin: the part of its cost a node must save to replace a node followed with websockets
+    :param function store_node: called with the node of a connector when its retry state changed
+    """
+    max_concurrency = attr.ib(default=8)
+    max_websockets = attr.ib(default=10)
+    member_interval = attr.ib(default=15.)
+    online_interval = attr.ib(default=60.)
+    backoff_interval = attr.ib(default=30.)
+    max_interval = attr.ib(default=3600.)
+    jitter = attr.ib(default=0.5)
+    max_failures = attr.ib(default=24)
+    websockets_margin = attr.ib(default=0.25)
+    store_node = attr.ib(default=None)
+    _queue = attr.ib(default=attr.Factory(list), init=False)
+    _scheduled = attr.ib(default=attr.Factory(dict), init=False)
+    _running = attr.ib(default=attr.Factory(set), init=False)
+    _polled = attr.ib(default=attr.Factory(set), init=False)
+    _counter = attr.ib(default=attr.Factory(itertools.count), init=False)
+    _wakeup = attr.ib(default=None, init=False)
+    _cycle_start = attr.ib(default=None, init=False)
+    _cycle_time = attr.ib(default=None, init=False)
+    _logger = attr.ib(default=attr.Factory(lambda: logging.getLogger('sakia')))
+
+    def add(self, connector, delay=None):
+        """
+        Schedule the polling of a connector
+        :param sakia.data.connectors.NodeConnector connector: the connector
+        :param float delay: the time to wait before the first poll, in seconds,
+        by default until the retry time saved in the node
+        """
+        if delay is None:
+            delay = max(0, min(self.max_interval, connector.node.retry_time - time.time()))
+        due = asyncio.get_event_loop().time() + delay
+        self._scheduled[connector] = due
+        heapq.heappush(self._queue, (due, next(self._counter), connector))
+        if self._wakeup:
+            self._wakeup.set()
+
+    def remove(self, connector):
+        """
+        Stop polling a connector
+        :param sakia.data.connectors.NodeConnector connector: the connector
+        """
+        self._scheduled.pop(connector, None)
+        self._polled.discard(connector)
+
+    def interval(self, connector):
+        """
+        The time to wait before polling a connector again
+        :param sakia.data.connectors.NodeConnector connector: the connector
+        :rtype: float
+        """
+        failures = connector.node.failures
+        if failures:
+            return min(self.max_interval, self.backoff_interval * 2 ** (failures - 1))
+        elif connector.node.member:
+            return self.member_interval
+        return self.online_interval
+
+    def retry_delay(self, connector):
+        """
+        The time to wait before polling a connector again,
+        with a random part removed from the backoff interval of the failing nodes
+        :param sakia.data.connectors.NodeConnector connector: the connector
+        :rtype: float
+        """
+        interval = self.interval(connector)
+        if connector.node.failures:
+            interval *= 1 - self.jitter * random.random()
+        return interval
+
+    def given_up(self, connector):
+        """
+        Check if a node failed too many polls in a row to be polled anymore
+        :param sakia.data.connectors.NodeConnector connector: the connector
+        :rtype: bool
+        """
+        return connector.node.failures >= self.max_failures
+
+    def select_websockets(self, scoreboard):
+        """
+        Enable the websockets of the best online nodes, members first,
+        and disable the websockets of all the other nodes.
+        A node already followed is replaced only by a node clearly better than it,
+        so that the websockets of the nodes with close costs are not opened and closed over and over.
+        :param sakia.data.connectors.NodesScoreboard scoreboard: the scoreboard of the nodes
+        """
+        def rank(connector):
+            return not connector.node.member, scoreboard.cost(connector.node)
+
+        online = sorted([c for c in self._scheduled if c.node.state == Node.ONLINE], key=rank)
+        best = [c for c in online if c.websockets_enabled][:self.max_websockets]
+        for candidate in online:
+            if candidate in best:
+                continue
+            if len(best) < self.max_websockets:
+                best.append(candidate)
+                continue
+            worst = max(best, key=rank)
+            candidate_not_member, candidate_cost = rank(candidate)
+            worst_not_member, worst_cost = rank(worst)
+            if candidate_not_member < worst_not_member or (candidate_not_member == worst_not_member and
+                                                           candidate_cost < worst_cost * (1 - self.websockets_margin)):
+                best.remove(worst)
+                best.append(candidate)
+        for connector in self._scheduled:
+            connector.enable_websockets(connector in best)
+
+    def queue_depth(self):
+        """
+        The number of connectors which should be polled now but wait for a free slot
+        :rtype: int
+        """
+        now = asyncio.get_event_loop().time()
+        return len([c for c, due in self._scheduled.items() if due <= now and c not in self._running])
+
+    def cycle_time(self):
+        """
+        The time it took to poll every connector once during the last cycle
+        :return: the time in seconds, None if no cycle was completed yet
+        :rtype: float
+        """
+        return self._cycle_time
+
+    def stats(self):
+        """
+        Get the monitoring data of the scheduler
+        :rtype: dict
+        """
+        return {'connectors': len(self._scheduled),
+                'queue_depth': self.queue_depth(),
+                'running': len(self._running),
+                'cycle_time': self._cycle_time}
+
+    async def run(self, continue_polling):
+        """
+        Poll the connectors until continue_polling returns False
+        :param function continue_polling: returns False when the polling must stop
+        """
+        loop = asyncio.get_event_loop()
+        self._wakeup = asyncio.Event()
+        self._cycle_start = loop.time()
+        while continue_polling():
+            self._wakeup.clear()
+            now = loop.time()
+            while self._queue and self._queue[0][0] <= now and len(self._running) < self.max_concurrency:
+                due, _, connector = heapq.heappop(self._queue)
+                if self._scheduled.get(connector) != due:
+                    # The connector was removed or rescheduled
+                    continue
+                self._running.add(connector)
+                asyncio.ensure_future(self._poll(connector))
+
+            # Wake up at least every second to check if the polling must stop
+            timeout = 1 if not self._queue else min(1, max(0, self._queue[0][0] - now))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, connector):
+        try:
+            await connector.poll()
+        except Exception as e:
+            self._logger.debug("Poll {0} : {1}".format(connector.node.pubkey[:5], str(e)))
+        finally:
+            self._running.discard(connector)
+
+        if connector not in self._scheduled:
+            return
+        node = connector.node
+        previous_failures = node.failures
+        if node.state in (Node.OFFLINE, Node.CORRUPTED):
+            node.failures += 1
+        else:
+            node.failures = 0
+        delay = self.retry_delay(connector)
+        if node.failures or previous_failures:
+            # The retry state of the healthy nodes does not change
+            node.retry_time = time.time() + delay if node.failures else 0
+            if self.store_node:
+                self.store_node(node)
+        self.add(connector, delay)
+        self._end_of_cycle(connector)
+
+    def _end_of_cycle(self, connector):
+        self._polled.add(connector)
+        if self._polled.issuperset(self._scheduled.keys()):
+            now = asyncio.get_event_loop().time()
+            self._cycle_time = now - self._cycle_start
+            self._logger.debug("Polled {0} nodes in {1:.1f}s".format(len(self._polled), self._cycle_time))
+            self._cycle_start = now
+            self._polled.clear()
@@ -4,6 +4,7 @@ from duniterpy.documents import Transaction as TransactionDoc
 from duniterpy.documents import BlockUID
 import logging
 from sakia.data.entities import Source, Transaction
+from sakia.data.processors import DocumentsParser
 import hashlib
 
 
@@ -13,7 +14,7 @@ class SourcesServices(QObject):
     to update data locally
     """
     def __init__(self, currency, sources_processor, connections_processor,
-                 transactions_processor, blockchain_processor, bma_connector):
+                 transactions_processor, blockchain_processor, bma_connector, documents_parser=None):
         """
         Constructor the identities service
 
@@ -23,6 +24,8 @@ class SourcesServices(QObject):
         :param sakia.data.processors.TransactionsProcessor transactions_processor: the transactions processor
         :param sakia.data.processors.BlockchainProcessor blockchain_processor: the blockchain processor
         :param sakia.data.connectors.BmaConnector bma_connector: The connector to BMA API
+        :param sakia.data.processors.DocumentsParser documents_parser: the parser of the documents of the app,
+         the documents are parsed inline by default
         """
         super().__init__()
         self._sources_processor = sources_processor
@@ -30,18 +33,21 @@ class SourcesServices(QObject):
         self._transactions_processor = transactions_processor
         self._blockchain_processor = blockchain_processor
         self._bma_connector = bma_connector
+        self._documents_parser = documents_parser or DocumentsParser.inline()
         self.currency = currency
         self._logger = logging.getLogger('sakia')
 
     def amount(self, pubkey):
         return self._sources_processor.amount(self.currency, pubkey)
 
-    def parse_transaction(self, pubkey, transaction):
+    def parse_transaction(self, pubkey, transaction, txdoc=None):
         """
         Parse a transaction
         :param sakia.data.entities.Transaction transaction:
+        :param duniterpy.documents.Transaction txdoc: the document of the transaction, if it was already parsed
         """
-        txdoc = TransactionDoc.from_signed_raw(transaction.raw)
+        if not txdoc:
+            txdoc = TransactionDoc.from_signed_raw(transaction.raw)
         for offset, output in enumerate(txdoc.outputs):
             if output.conditions.left.pubkey == pubkey:
                 source = Source(currency=self.currency,
@@ -114,10 +120,12 @@ class SourcesServices(QObject):
         :param int unit_base: the unit base of the destruction. None to look for the past uds
         :return: the destruction of sources
         """
-        sorted_tx = (s for s in sorted(transactions, key=lambda t: t.written_block))
+        transactions = sorted(transactions, key=lambda t: t.written_block)
+        txdocs = await self._documents_parser.transactions([t.raw for t in transactions])
+        sorted_tx = zip(transactions, txdocs)
         sorted_ud = (u for u in sorted(dividends, key=lambda d: d.block_number))
         try:
-            tx = next(sorted_tx)
+            tx, txdoc = next(sorted_tx)
             block_number = max(tx.written_block, 0)
         except StopIteration:
             tx = None
@@ -133,9 +141,9 @@ class SourcesServices(QObject):
             if log_stream:
                 log_stream("Parsing info ud/tx of {:}".format(block_number))
             if tx and tx.written_block == block_number:
-                self.parse_transaction(pubkey, tx)
+                self.parse_transaction(pubkey, tx, txdoc)
                 try:
-                    tx = next(sorted_tx)
+                    tx, txdoc = next(sorted_tx)
                 except StopIteration:
                     tx = None
             if ud and ud.block_number == block_number:
@@ -179,6 +187,25 @@ class SourcesServices(QObject):
 
         return destructions
 
+    def rollback(self, transactions, dividends):
+        """
+        Revert the sources of transactions and dividends which are not in the blockchain anymore
+        :param list[sakia.data.entities.Transaction] transactions: the transactions dropped
+        :param list[sakia.data.entities.Dividend] dividends: the dividends dropped
+        """
+        for tx in sorted(transactions, key=lambda t: t.written_block, reverse=True):
+            # The destructions of sources have no document to restore from
+            if tx.raw:
+                self.restore_sources(tx.pubkey, tx)
+        for dividend in dividends:
+            self._sources_processor.drop(Source(currency=self.currency,
+                                                pubkey=dividend.pubkey,
+                                                identifier=dividend.pubkey,
+                                                type='D',
+                                                noffset=dividend.block_number,
+                                                amount=dividend.amount,
+                                                base=dividend.base))
+
     def restore_sources(self, pubkey, tx):
         """
         Restore the sources of a cancelled tx
@@ -1,8 +1,8 @@
 from PyQt5.QtCore import QObject
 from sakia.data.entities.transaction import parse_transaction_doc, Transaction
-from duniterpy.documents import Transaction as TransactionDoc
 from duniterpy.documents import SimpleTransaction, Block
 from sakia.data.entities import Dividend
+from sakia.data.processors import DocumentsParser
 from duniterpy.api import bma
 import logging
 import sqlite3
@@ -14,7 +14,7 @@ class TransactionsService(QObject):
     to update data locally
     """
     def __init__(self, currency, transactions_processor, dividends_processor,
-                 identities_processor, connections_processor, bma_connector):
+                 identities_processor, connections_processor, bma_connector, documents_parser=None):
         """
         Constructor the identities service
 
@@ -24,6 +24,8 @@ class TransactionsService(QObject):
         :param sakia.data.processors.DividendsProcessor dividends_processor: the dividends processor for given currency
         :param sakia.data.processors.ConnectionsProcessor connections_processor: the connections processor for given currency
         :param sakia.data.connectors.BmaConnector bma_connector: The connector to BMA API
+        :param sakia.data.processors.DocumentsParser documents_parser: the parser of the documents of the app,
+         the documents are parsed inline by default
         """
         super().__init__()
         self._transactions_processor = transactions_processor
@@ -31,6 +33,7 @@ class TransactionsService(QObject):
         self._identities_processor = identities_processor
         self._connections_processor = connections_processor
         self._bma_connector = bma_connector
+        self._documents_parser = documents_parser or DocumentsParser.inline()
         self.currency = currency
         self._logger = logging.getLogger('sakia')
 
@@ -103,6 +106,19 @@ class TransactionsService(QObject):
         new_dividends = await self.parse_dividends_history(blocks, new_transfers)
         return transfers_changed, new_transfers, new_dividends
 
+    def rollback(self, block_number):
+        """
+        Revert the transactions and the dividends written after a given block
+
+        :param int block_number: the number of the last block kept
+        :return: the transactions sent locally which wait again, the transactions dropped and the dividends dropped
+        :rtype: Tuple[List[sakia.data.entities.Transaction], List[sakia.data.entities.Transaction],
+         List[sakia.data.entities.Dividend]]
+        """
+        awaiting, dropped = self._transactions_processor.rollback(self.currency, block_number)
+        dividends = self._dividends_processor.rollback(self.currency, block_number)
+        return awaiting, dropped, dividends
+
     async def parse_dividends_history(self, blocks, transactions):
         """
         Request transactions from the network to initialize data for a given pubkey
@@ -131,8 +147,7 @@ class TransactionsService(QObject):
                     if self._dividends_processor.commit(dividend):
                         dividends[connection].append(dividend)
 
-            for tx in transactions[connection]:
-                txdoc = TransactionDoc.from_signed_raw(tx.raw)
+            for txdoc in await self._documents_parser.transactions([tx.raw for tx in transactions[connection]]):
                 for input in txdoc.inputs:
                     # For each dividends inputs, if it is consumed (not present in ud history)
                     if input.source == "D" and input.origin_id == connection.pubkey and input.index not in block_numbers:
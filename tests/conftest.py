@@ -9,13 +9,14 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 
 from sakia.constants import ROOT_SERVERS
-from duniterpy.documents import BlockUID
+from duniterpy.documents import BlockUID, BMAEndpoint
 from duniterpy.key import ScryptParams
 from sakia.app import Application
 from sakia.options import SakiaOptions
 from sakia.data.files import *
 from sakia.data.entities import *
 from sakia.data.repositories import *
+from sakia.data.connectors import NodesScoreboard, NodesRateLimiter, EndpointsIndex
 from sakia.services import DocumentsService
 
 _application_ = []
@@ -47,12 +48,82 @@ def meta_repo(version=0):
                               ConnectionsRepo(con), IdentitiesRepo(con),
                               BlockchainsRepo(con), CertificationsRepo(con), TransactionsRepo(con),
                               NodesRepo(con), SourcesRepo(con), DividendsRepo(con),
-                              ContactsRepo(con))
+                              ContactsRepo(con), BlocksRepo(con), BlocksIndexRepo(con))
     meta_repo.prepare()
     meta_repo.upgrade_database(version)
     return meta_repo
 
 
+@pytest.fixture
+def make_node():
+    """
+    Build the nodes of the tests, online and without endpoints unless told otherwise
+    """
+    def make_node(pubkey, **kwargs):
+        fields = dict(currency="test_currency", endpoints=[], peer_blockstamp=BlockUID.empty(), state=Node.ONLINE)
+        fields.update(kwargs)
+        return Node(pubkey=pubkey, **fields)
+    return make_node
+
+
+class FakeNodesProcessor:
+    """
+    A nodes processor of synced nodes, with the objects shared by the connectors
+    """
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.scoreboard = NodesScoreboard(exploration=0)
+        self.rate_limiter = NodesRateLimiter()
+        self.endpoints_index = EndpointsIndex()
+        for node in nodes:
+            self.endpoints_index.update(node)
+
+    def synced_members_nodes(self, currency):
+        return self.nodes
+
+    def synced_nodes(self, currency):
+        return self.nodes
+
+
+@pytest.fixture
+def fake_nodes_processor(make_node):
+    """
+    Build a nodes processor of synced nodes with a BMA endpoint each, node0.test to nodeN.test
+    """
+    def fake_nodes_processor(count):
+        return FakeNodesProcessor([make_node("pubkey{0}".format(i),
+                                             endpoints=[BMAEndpoint("node{0}.test".format(i), None, None, 80)])
+                                   for i in range(0, count)])
+    return fake_nodes_processor
+
+
+class FakeNodeConnector:
+    """
+    A node connector whose polls take 50ms
+    """
+    def __init__(self, node):
+        self.node = node
+        self.polls = 0
+        self.websockets_enabled = True
+
+    def enable_websockets(self, enabled):
+        self.websockets_enabled = enabled
+
+    async def poll(self):
+        self.polls += 1
+        await asyncio.sleep(0.05)
+
+
+@pytest.fixture
+def fake_connector(make_node):
+    """
+    Build a node connector of an online node, see make_node for the fields of the node
+    """
+    def fake_connector(pubkey, **kwargs):
+        return FakeNodeConnector(make_node(pubkey, **kwargs))
+    return fake_connector
+
+
 @pytest.fixture
 def sakia_options(tmpdir):
     return SakiaOptions(tmpdir.dirname)
@@ -16,4 +16,37 @@ async def test_new_block_with_ud(application_with_one_connection, fake_server_wi
         new_blocks)
     previous_ud_after_parse = application_with_one_connection.blockchain_service.previous_ud()
     assert previous_ud_after_parse > previous_ud
-    await fake_server_with_blockchain.close()
\ No newline at end of file
+    await fake_server_with_blockchain.close()
+
+@pytest.mark.asyncio
+async def test_rollback_to_common_ancestor(application_with_one_connection, fake_server_with_blockchain, bob, alice):
+    blockchain_service = application_with_one_connection.blockchain_service
+    transactions_service = application_with_one_connection.transactions_service
+    forge = fake_server_with_blockchain.forge
+    tx_before_fork = transactions_service.transfers(bob.key.pubkey)
+    ancestor = forge.blocks[-1]
+    forge.push(alice.send_money(10, forge.user_identities[alice.key.pubkey].sources, bob,
+                                ancestor.blockUID, "Forked"))
+    for i in range(0, 3):
+        forge.forge_block()
+    forked_blocks = forge.blocks[-3:]
+    await transactions_service.handle_new_blocks(forked_blocks)
+    blockchain_service.handle_new_blocks(forked_blocks)
+    assert len(transactions_service.transfers(bob.key.pubkey)) == len(tx_before_fork) + 1
+    assert blockchain_service.current_buid() == forked_blocks[-1].blockUID
+
+    # The network switches to a branch without the transaction
+    del forge.blocks[-3:]
+    for i in range(0, 4):
+        forge.forge_block()
+    replayed = []
+
+    async def handle_blockchain_progress(network_blockstamp):
+        replayed.append(network_blockstamp)
+
+    blockchain_service.handle_blockchain_progress = handle_blockchain_progress
+    await blockchain_service.rollback(forge.blocks[-1].blockUID)
+    assert blockchain_service.current_buid() == ancestor.blockUID
+    assert len(transactions_service.transfers(bob.key.pubkey)) == len(tx_before_fork)
+    assert replayed == [forge.blocks[-1].blockUID]
+    await fake_server_with_blockchain.close()
@@ -1,6 +1,63 @@
 import pytest
 import os
-from duniterpy.documents import block_uid
+from duniterpy.documents import block_uid, BlockUID, Peer
 from sakia.data.entities import Node
 from sakia.data.processors import NodesProcessor
 
+
+
+@pytest.mark.asyncio
+async def test_peers_are_deduped_then_verified(application, fake_server, alice):
+    network_service = application.network_service
+    peer = fake_server.peer_doc()
+    wrong_peer = Peer(2, peer.currency, peer.pubkey, BlockUID.empty(), peer.endpoints, None)
+    wrong_peer.sign([alice.key])
+    # A forged document with the signature of the genuine one, received first
+    forged_peer = Peer(2, peer.currency, peer.pubkey, BlockUID(12, "A" * 64), peer.endpoints, None)
+    forged_peer.signatures = peer.signatures
+    for doc in (forged_peer, peer, fake_server.peer_doc(), wrong_peer):
+        network_service.handle_new_node(doc)
+    assert len(network_service._peers_queue) == 3
+
+    await network_service.verify_queued_peers()
+    assert network_service._discovery_stack == [peer]
+    await fake_server.close()
+
+
+@pytest.mark.asyncio
+async def test_discover_peers_batch(application, fake_server, alice, bob):
+    network_service = application.network_service
+    peers = []
+    for user in (alice, bob):
+        peer = Peer(2, "test_currency", user.key.pubkey, BlockUID.empty(), fake_server.peer_doc().endpoints, None)
+        peer.sign([user.key])
+        peers.append(peer)
+    await network_service.discover_peers(peers)
+    assert len(network_service.nodes()) == 3
+    assert len(network_service._connectors) == 3
+
+    await network_service.stop_coroutines()
+    await fake_server.close()
+
+
+@pytest.mark.asyncio
+async def test_websockets_are_selected_when_nodes_state_changes(application, fake_server):
+    network_service = application.network_service
+    selections = []
+    network_service.select_websockets = lambda: selections.append(True)
+    connector = network_service._connectors[0]
+
+    # A new head does not move the node in the selection
+    connector.node.current_buid = block_uid("15-76543400E78B56CC21FB1DDC6CBAB24E0FACC9A798F5ED8736EA007F38617D67")
+    network_service.refresh_websockets(connector)
+    assert selections == []
+
+    connector.node.state = Node.OFFLINE
+    network_service.refresh_websockets(connector)
+    assert len(selections) == 1
+    connector.node.member = not connector.node.member
+    network_service.refresh_websockets(connector)
+    network_service.refresh_websockets(connector)
+    assert len(selections) == 2
+
+    await fake_server.close()
@@ -0,0 +1,173 @@
+import hashlib
+import pytest
+from types import SimpleNamespace
+from duniterpy.api import bma
+from duniterpy.documents import BlockUID
+from sakia.data.entities import Blockchain
+from sakia.data.processors import BlockchainProcessor, DocumentsParser
+from sakia.data.repositories import BlocksIndexRepo, BlockchainsRepo
+from sakia.data.processors.blockchain import plan_blocks_requests, _verified_range
+
+
+def test_plan_blocks_requests():
+    assert plan_blocks_requests([]) == []
+    # Sparse blocks are requested alone
+    assert plan_blocks_requests([5, 300, 1200]) == [(5, 1), (300, 1), (1200, 1)]
+    # Dense blocks are requested in ranges
+    assert plan_blocks_requests([5, 6, 10, 20, 32]) == [(5, 16), (32, 1)]
+    assert plan_blocks_requests(list(range(0, 120, 2)), max_size=50) == [(0, 49), (50, 49), (100, 19)]
+
+
+def sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest().upper()
+
+
+def forge_block(number, previous_hash, transactions=()):
+    inner_part = "Number: {0}\nPreviousHash: {1}\nTransactions:\n{2}".format(number, previous_hash,
+                                                                            "".join(t + "\n" for t in transactions))
+    raw = "{0}InnerHash: {1}\nNonce: 1\n".format(inner_part, sha256(inner_part))
+    return {'number': number, 'hash': sha256(raw[len(inner_part):] + "SIG\n"), 'previousHash': previous_hash,
+            'raw': raw, 'signature': "SIG", 'transactions': list(transactions)}
+
+
+def parse_forged_block(signed_raw):
+    lines = signed_raw.split("\n")
+    transactions = lines[lines.index("Transactions:") + 1:-4]
+    return SimpleNamespace(number=int(lines[0].split(": ")[1]), signed_raw=signed_raw, transactions=transactions,
+                           joiners=[], leavers=[], actives=[], excluded=[], identities=[], ud=None)
+
+
+def forge_chain(length, forged_from=None):
+    """
+    Forge a chain of blocks, the blocks after forged_from being rewritten with a new transaction
+    """
+    chain = []
+    previous_hash = ""
+    for number in range(length):
+        transactions = ["tx"] if number % 7 == 0 else []
+        if forged_from is not None and number >= forged_from:
+            transactions.append("forged tx")
+        chain.append(forge_block(number, previous_hash, transactions))
+        previous_hash = chain[-1]['hash']
+    return chain
+
+
+class FakeBmaConnector:
+    def __init__(self, forged_range=None, listed=()):
+        self.requests = []
+        self.forged_range = forged_range
+        self.listed = list(listed)
+        self.chain = forge_chain(5100)
+        self.forged_chain = forge_chain(5100, forged_from=forged_range)
+
+    async def get(self, currency, request, req_args={}, verify=True):
+        self.requests.append((request, req_args, verify))
+        if request is bma.blockchain.block:
+            return self.chain[req_args['number']]
+        elif request is not bma.blockchain.blocks:
+            return {'result': {'blocks': self.listed}}
+        return self.chain[req_args['start']:req_args['start'] + req_args['count']]
+
+    async def spread_get(self, currency, request, req_args_list):
+        self.requests.extend((request, req_args, False) for req_args in req_args_list)
+        return [(self.forged_chain if req_args['start'] == self.forged_range else self.chain)
+                [req_args['start']:req_args['start'] + req_args['count']]
+                for req_args in req_args_list]
+
+
+def test_verified_range():
+    chain = forge_chain(20)
+    assert _verified_range(chain[5:10], 5, 5, chain[9]['hash'])
+    # Incomplete range
+    assert not _verified_range(chain[5:9], 5, 5, chain[9]['hash'])
+    # A block was modified without being hashed again
+    tampered = dict(chain[7], raw=chain[7]['raw'].replace("Transactions:\n", "Transactions:\nforged tx\n"))
+    assert not _verified_range(chain[5:7] + [tampered] + chain[8:10], 5, 5, chain[9]['hash'])
+    # A block was replaced by a block of another chain
+    assert not _verified_range(chain[5:7] + [forge_block(7, "AB")] + chain[8:10], 5, 5, chain[9]['hash'])
+    # The whole chain was rewritten from a block
+    forged_chain = forge_chain(20, forged_from=7)
+    assert _verified_range(forged_chain[5:10], 5, 5, forged_chain[9]['hash'])
+    assert not _verified_range(forged_chain[5:10], 5, 5, chain[9]['hash'])
+
+
+@pytest.mark.asyncio
+async def test_next_blocks_requests(monkeypatch):
+    bma_connector = FakeBmaConnector(forged_range=100)
+    processor = BlockchainProcessor(None, bma_connector, parser=DocumentsParser(max_workers=0))
+    monkeypatch.setattr("sakia.data.processors.blockchain.Block.from_signed_raw", parse_forged_block)
+    blocks = await processor.next_blocks(3, [2, 4, 5, 8, 300, 100, 103, 5000], "test_currency")
+    assert [b.signed_raw for b in blocks] == ["{0}SIG\n".format(bma_connector.chain[n]['raw'])
+                                             for n in (4, 5, 8, 100, 103, 300, 5000)]
+    assert sorted((r.__name__, tuple(sorted(a.items())), v) for r, a, v in bma_connector.requests) == [
+        # The last block of each range is verified
+        ("block", (('number', 8),), True),
+        ("block", (('number', 103),), True),
+        ("block", (('number', 300),), True),
+        ("block", (('number', 5000),), True),
+        # The range forged by a node is requested again to several nodes
+        ("blocks", (('count', 4), ('start', 100)), False),
+        ("blocks", (('count', 4), ('start', 100)), True),
+        ("blocks", (('count', 5), ('start', 4)), False)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_new_blocks_are_indexed_from_the_tail(meta_repo, monkeypatch):
+    bma_connector = FakeBmaConnector(forged_range=11, listed=[7, 28, 500, 999, 1200])
+    processor = BlockchainProcessor(None, bma_connector, index_repo=BlocksIndexRepo(meta_repo.conn),
+                                    parser=DocumentsParser(max_workers=0))
+    monkeypatch.setattr("sakia.data.processors.blockchain.Block.from_signed_raw", parse_forged_block)
+    current = BlockUID(10, "0" * 64)
+    monkeypatch.setattr(processor, "current_buid", lambda currency: current)
+
+    # The few new blocks are scanned, the range forged by a node being requested again to several nodes
+    assert await processor.indexed_new_blocks("test_currency", 30) == [14, 21, 28]
+    assert sorted((r.__name__, a, v) for r, a, v in bma_connector.requests) == [
+        ("block", {'number': 30}, True),
+        ("blocks", {'count': 20, 'start': 11}, False),
+        ("blocks", {'count': 20, 'start': 11}, True)]
+    # The blocks already scanned are not requested again
+    assert await processor.indexed_new_blocks("test_currency", 30) == [14, 21, 28]
+    blocks = await processor.next_blocks(10, [14, 21, 28], "test_currency")
+    assert [b.number for b in blocks] == [14, 21, 28]
+    current = BlockUID(21, "0" * 64)
+    assert await processor.indexed_new_blocks("test_currency", 30) == [28]
+    assert len(bma_connector.requests) == 3
+
+    # Many new blocks are found in the lists of the network
+    assert await processor.indexed_new_blocks("test_currency", 1000) == [28, 500, 999]
+    assert len(bma_connector.requests) == 10
+
+
+def test_blockchain_is_read_from_the_snapshot(meta_repo, monkeypatch):
+    meta_repo.blockchains_repo.insert(Blockchain(currency="test_currency", current_mass=1000,
+                                                 last_ud=10, last_ud_base=0))
+    selects = []
+    get_one = BlockchainsRepo.get_one
+    monkeypatch.setattr(BlockchainsRepo, "get_one",
+                        lambda repo, **search: selects.append(search) or get_one(repo, **search))
+    snapshots = {}
+    processor = BlockchainProcessor(meta_repo.blockchains_repo, None, snapshots=snapshots)
+    other_processor = BlockchainProcessor(meta_repo.blockchains_repo, None, snapshots=snapshots)
+
+    for _ in range(100):
+        assert processor.current_mass("test_currency") == 1000
+        assert other_processor.last_ud("test_currency") == (10, 0)
+    assert len(selects) == 1
+
+    class FakeBlock:
+        blockUID = BlockUID(12, "A" * 64)
+        mediantime = 1500000000
+        members_count = 10
+        ud = 12
+        unit_base = 0
+
+    processor.handle_new_blocks("test_currency", [FakeBlock()])
+    assert other_processor.current_mass("test_currency") == 1120
+    assert other_processor.last_ud("test_currency") == (12, 0)
+    assert other_processor.previous_ud("test_currency") == (10, 0)
+    assert meta_repo.blockchains_repo.get_one(currency="test_currency").current_mass == 1120
+
+    processor.remove_blockchain("test_currency")
+    assert not other_processor.initialized("test_currency")
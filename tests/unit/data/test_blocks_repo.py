@@ -0,0 +1,59 @@
+from sakia.data.repositories import BlocksRepo
+from sakia.data.processors import BlocksProcessor
+from sakia.data.entities import BlockHeader
+
+
+def test_add_get_drop_block(meta_repo):
+    blocks_repo = BlocksRepo(meta_repo.conn)
+    blocks_repo.insert(BlockHeader("testcurrency", 12,
+                                   "76543400E78B56CC21FB1DDC6CBAB24E0FACC9A798F5ED8736EA007F38617D67",
+                                   "AEFFCB00E78B56CC21FB1DDC6CBAB24E0FACC9A798F5ED8736EA007F38617D67",
+                                   1346543453, '{"number": 12}', 10))
+    header = blocks_repo.get_one(currency="testcurrency", number=12)
+    assert header.sha_hash == "76543400E78B56CC21FB1DDC6CBAB24E0FACC9A798F5ED8736EA007F38617D67"
+    assert header.previous_hash == "AEFFCB00E78B56CC21FB1DDC6CBAB24E0FACC9A798F5ED8736EA007F38617D67"
+    assert header.median_time == 1346543453
+    assert header.data == '{"number": 12}'
+    blocks_repo.drop(header)
+    assert blocks_repo.get_one(currency="testcurrency", number=12) is None
+
+
+def test_cache_confirmed_blocks_with_eviction(meta_repo):
+    blocks_processor = BlocksProcessor(BlocksRepo(meta_repo.conn), confirmation_depth=10, max_documents=2)
+    for number in range(0, 4):
+        blocks_processor.cache_block("testcurrency", {'number': number,
+                                                      'hash': "H{0}".format(number),
+                                                      'previousHash': "H{0}".format(number - 1),
+                                                      'medianTime': 1000 + number}, 12)
+    # Block 3 is not deep enough to be cached
+    assert blocks_processor.confirmed_block("testcurrency", 3, 100) is None
+    # Oldest documents were evicted but their headers are kept
+    assert blocks_processor.confirmed_block("testcurrency", 0, 100) is None
+    assert BlocksRepo(meta_repo.conn).get_one(currency="testcurrency", number=0).sha_hash == "H0"
+    assert blocks_processor.confirmed_block("testcurrency", 2, 100)['hash'] == "H2"
+    # Not served while not confirmed by the network
+    assert blocks_processor.confirmed_block("testcurrency", 2, 5) is None
+
+
+def test_accesses_are_written_on_eviction(meta_repo):
+    blocks_repo = BlocksRepo(meta_repo.conn)
+    blocks_processor = BlocksProcessor(blocks_repo, confirmation_depth=10, max_documents=2)
+
+    def cache(number):
+        blocks_processor.cache_block("testcurrency", {'number': number,
+                                                      'hash': "H{0}".format(number),
+                                                      'previousHash': "H{0}".format(number - 1),
+                                                      'medianTime': 1000 + number}, 100)
+
+    cache(0)
+    cache(1)
+    last_access = blocks_repo.get_one(currency="testcurrency", number=0).last_access
+    assert blocks_processor.confirmed_block("testcurrency", 0, 100)['hash'] == "H0"
+    # The cache hit is kept in memory
+    assert blocks_repo.get_one(currency="testcurrency", number=0).last_access == last_access
+
+    # The least recently accessed document is evicted
+    cache(2)
+    assert blocks_processor.confirmed_block("testcurrency", 0, 100)['hash'] == "H0"
+    assert blocks_processor.confirmed_block("testcurrency", 1, 100) is None
+    assert blocks_repo.get_one(currency="testcurrency", number=0).last_access > last_access
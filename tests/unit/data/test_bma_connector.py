@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+from duniterpy.api import bma
+from sakia.data.entities import UserParameters
+from sakia.data.connectors import BmaConnector
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_are_coalesced():
+    connector = BmaConnector(None, None)
+    calls = []
+
+    async def verified_get(currency, request, req_args):
+        calls.append(req_args)
+        await asyncio.sleep(0.1)
+        return {'number': req_args['number']}
+
+    connector.verified_get = verified_get
+    results = await asyncio.gather(connector.get("test_currency", bma.blockchain.block, {'number': 1}),
+                                   connector.get("test_currency", bma.blockchain.block, {'number': 1}),
+                                   connector.get("test_currency", bma.blockchain.block, {'number': 2}))
+    assert results == [{'number': 1}, {'number': 1}, {'number': 2}]
+    assert len(calls) == 2
+    assert connector.single_flight_stats() == {'hits': 1, 'misses': 2}
+
+    await connector.get("test_currency", bma.blockchain.block, {'number': 1})
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_verified_get_stops_at_quorum(fake_nodes_processor):
+    cancelled = []
+
+    async def request(conn_handler):
+        try:
+            if conn_handler.server == "node1.test":
+                await asyncio.sleep(10)
+            return {'block': 42}
+        except asyncio.CancelledError:
+            cancelled.append(conn_handler.server)
+            raise
+
+    request.__name__ = "request"
+    connector = BmaConnector(fake_nodes_processor(3), UserParameters())
+    result = await asyncio.wait_for(connector.verified_get("test_currency", request, {}), 2)
+    assert result == {'block': 42}
+    await asyncio.sleep(0)
+    assert cancelled == ["node1.test"]
+    await connector.close()
+
+
+@pytest.mark.asyncio
+async def test_broadcast_returns_on_first_success(fake_nodes_processor):
+    class Reply:
+        def __init__(self, status):
+            self.status = status
+
+        async def release(self):
+            pass
+
+    slow_node = asyncio.Event()
+
+    async def request(conn_handler):
+        if conn_handler.server == "node0.test":
+            return Reply(400)
+        elif conn_handler.server == "node1.test":
+            await slow_node.wait()
+        return Reply(200)
+
+    request.__name__ = "request"
+    completed = []
+    connector = BmaConnector(fake_nodes_processor(3), UserParameters())
+    replies = await asyncio.wait_for(connector.broadcast("test_currency", request, {},
+                                                         on_completed=completed.append), 2)
+    assert sorted(r.status for r in replies) == [200, 400]
+    assert completed == []
+
+    slow_node.set()
+    await asyncio.sleep(0.1)
+    assert completed == [[400, 200, 200]]
+    await connector.close()
+
+
+@pytest.mark.asyncio
+async def test_spread_get_sends_each_request_to_another_node(fake_nodes_processor):
+    servers = {}
+
+    async def request(conn_handler, start):
+        servers[start] = conn_handler.server
+        if conn_handler.server == "node0.test" and start == 0:
+            raise ValueError("Invalid answer")
+        return {'start': start}
+
+    request.__name__ = "request"
+    connector = BmaConnector(fake_nodes_processor(3), UserParameters())
+    results = await asyncio.wait_for(connector.spread_get("test_currency", request,
+                                                          [{'start': i} for i in range(0, 3)]), 2)
+    assert results == [{'start': i} for i in range(0, 3)]
+    # The failed request was sent again to the next node
+    assert sorted(servers.values()) == ["node1.test", "node1.test", "node2.test"]
+    await connector.close()
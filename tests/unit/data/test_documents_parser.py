@@ -0,0 +1,24 @@
+import pytest
+from sakia.data.processors import DocumentsParser
+
+
+@pytest.mark.asyncio
+async def test_parse_in_workers(simple_blockchain_forge):
+    signed_raws = [b.signed_raw() for b in simple_blockchain_forge.blocks]
+    parser = DocumentsParser(max_workers=1, min_batch=5, chunk_size=4)
+    blocks = await parser.blocks(signed_raws)
+    assert [b.signed_raw() for b in blocks] == signed_raws
+    assert parser._executor is not None
+
+    # Small batches are parsed inline
+    inline_parser = DocumentsParser(min_batch=5)
+    blocks = await inline_parser.blocks(signed_raws[:2])
+    assert [b.signed_raw() for b in blocks] == signed_raws[:2]
+    assert inline_parser._executor is None
+    parser.close()
+
+    # The default parsers of the objects not given the parser of the application never start workers
+    default_parser = DocumentsParser.inline()
+    blocks = await default_parser.blocks(signed_raws)
+    assert [b.signed_raw() for b in blocks] == signed_raws
+    assert default_parser._executor is None
@@ -0,0 +1,61 @@
+from duniterpy.api import bma
+from duniterpy.documents import BMAEndpoint
+from sakia.data.connectors import EndpointsIndex
+from sakia.data.connectors.endpoints_index import node_capabilities
+from sakia.data.processors import NodesProcessor
+
+ENDPOINTS = ["BASIC_MERKLED_API node.test 80", "WS2P 90ab78cd node.test 20901"]
+
+
+def test_capabilities_of_versions():
+    assert node_capabilities("") == frozenset((bma.ud.history, bma.tx.history, bma.blockchain.membership))
+    assert node_capabilities("0.12.0") == frozenset((bma.ud.history, bma.tx.history))
+    assert node_capabilities("0.10.3") == frozenset()
+
+
+def test_endpoints_index(make_node):
+    index = EndpointsIndex()
+    old_node = make_node("old", version="0.12.0", endpoints=ENDPOINTS)
+    ws2p_node = make_node("ws2p", version="1.6.0", endpoints=ENDPOINTS[1:])
+    index.update(old_node)
+    index.update(ws2p_node)
+    endpoints = index.endpoints(bma.blockchain.current, old_node)
+    assert [type(e) for e in endpoints] == [BMAEndpoint]
+    assert index.serving("test_currency", bma.blockchain.current) == {"old": endpoints}
+    assert index.serving("test_currency", bma.tx.history) == {"old": endpoints}
+    assert index.serving("test_currency", bma.blockchain.membership) == {}
+    assert index.serving("other_currency", bma.blockchain.current) == {}
+
+    # The node is indexed under its new capabilities when it is updated
+    old_node.version = "1.6.0"
+    index.update(old_node)
+    assert index.serving("test_currency", bma.blockchain.membership) == {"old": endpoints}
+
+    old_node.endpoints = (BMAEndpoint("other.test", None, None, 80),)
+    index.update(old_node)
+    assert index.endpoints(bma.blockchain.membership, old_node) == old_node.endpoints
+
+    old_node.version = "0.10.0"
+    index.update(old_node)
+    assert index.serving("test_currency", bma.ud.history) == {}
+    assert index.serving("test_currency", bma.blockchain.current) == {"old": old_node.endpoints}
+
+    index.remove(old_node)
+    assert index.serving("test_currency", bma.blockchain.current) == {}
+    assert index.endpoints(bma.blockchain.current, old_node) == ()
+
+
+def test_nodes_processor_maintains_the_index(meta_repo, make_node):
+    meta_repo.nodes_repo.insert(make_node("saved", endpoints=ENDPOINTS))
+    processor = NodesProcessor(meta_repo.nodes_repo)
+    # The saved nodes are indexed when they are loaded
+    assert len(processor.synced_nodes("test_currency")) == 1
+    assert list(processor.endpoints_index.serving("test_currency", bma.blockchain.current)) == ["saved"]
+
+    new_node = make_node("new", version="0.12.0", endpoints=ENDPOINTS)
+    processor.insert_node(new_node)
+    assert list(processor.endpoints_index.serving("test_currency", bma.tx.history)) == ["saved", "new"]
+    assert list(processor.endpoints_index.serving("test_currency", bma.blockchain.membership)) == ["saved"]
+
+    processor.delete_node(new_node)
+    assert list(processor.endpoints_index.serving("test_currency", bma.tx.history)) == ["saved"]
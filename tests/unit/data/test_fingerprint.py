@@ -0,0 +1,51 @@
+from duniterpy.api import bma
+from sakia.data.connectors.bma import fingerprint, VOLATILE_FIELDS
+
+
+def tx_history(nb_tx, pending_comment="pending"):
+    transactions = [{
+        "version": 10,
+        "hash": "{0:064X}".format(i),
+        "block_number": i,
+        "time": 1500000000 + i,
+        "comment": "tx {0}".format(i),
+        "issuers": ["7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ"],
+        "inputs": ["{0}:0:T:{1:064X}:0".format(100 + i, i)],
+        "outputs": ["{0}:0:SIG(FADxcH5LmXGmGFgdixSes6nWnC4Vb4pRUBYT81zQRhjn)".format(100 + i)],
+        "unlocks": ["0:SIG(0)"],
+        "signatures": ["{0:088X}".format(i)]
+    } for i in range(0, nb_tx)]
+    return {
+        "currency": "test_currency",
+        "pubkey": "7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ",
+        "history": {
+            "sent": transactions[:nb_tx // 2],
+            "received": transactions[nb_tx // 2:],
+            "sending": [],
+            "receiving": [],
+            "pending": [{"comment": pending_comment}]
+        }
+    }
+
+
+def test_fingerprint_is_canonical():
+    assert fingerprint({"a": [1, 2, {"b": 3, "c": [4]}]}) == fingerprint({"a": [{"c": [4], "b": 3}, 2, 1]})
+    assert fingerprint({"a": [1, 2]}) != fingerprint({"a": [1, 3]})
+    assert fingerprint({"a": 1}) != fingerprint({"b": 1})
+
+
+def test_fingerprint_skips_volatile_fields():
+    requirements = {"identities": [{"uid": "john", "membershipPendingExpiresIn": 10,
+                                    "certifications": [{"from": "doe", "expiresIn": 100}]}]}
+    later = {"identities": [{"uid": "john", "membershipPendingExpiresIn": 5,
+                             "certifications": [{"from": "doe", "expiresIn": 95}]}]}
+    other = {"identities": [{"uid": "john", "membershipPendingExpiresIn": 5,
+                             "certifications": [{"from": "jane", "expiresIn": 95}]}]}
+    volatile = VOLATILE_FIELDS[bma.wot.requirements]
+    assert fingerprint(requirements, volatile) == fingerprint(later, volatile)
+    assert fingerprint(requirements, volatile) != fingerprint(other, volatile)
+    assert fingerprint(requirements) != fingerprint(later)
+
+    volatile = VOLATILE_FIELDS[bma.tx.history]
+    assert fingerprint(tx_history(10), volatile) == fingerprint(tx_history(10, "other"), volatile)
+    assert fingerprint(tx_history(10), volatile) != fingerprint(tx_history(11), volatile)
@@ -1,5 +1,8 @@
-from duniterpy.documents import Peer
-from sakia.data.connectors import NodeConnector
+import asyncio
+import pytest
+from duniterpy.documents import Peer, BlockUID, BMAEndpoint
+from sakia.data.connectors import NodeConnector, BlockHeadersCache, SessionPool
+from sakia.data.entities import Node, UserParameters
 
 
 def test_from_peer():
@@ -16,3 +19,90 @@ BASIC_MERKLED_API duniter.inso.ovh 80
     assert connector.node.pubkey == "8Fi1VSTbjkXguwThF4v2ZxC5whK7pwG2vcGTkPUPjPGU"
     assert connector.node.endpoints[0].inline() == "BASIC_MERKLED_API duniter.inso.ovh 80"
     assert connector.node.currency == "meta_brouzouf"
+
+
+@pytest.mark.asyncio
+async def test_request_peers_fetches_new_leaves_concurrently():
+    node = Node(currency="test_currency", pubkey="pubkey", endpoints=[BMAEndpoint("node.test", None, None, 80)],
+                peer_blockstamp=BlockUID.empty(), state=Node.ONLINE,
+                merkle_peers_root="old_root", merkle_peers_leaves=("leaf0", "leaf1"))
+    connector = NodeConnector(node, UserParameters())
+    connector.max_concurrent_leaves = 4
+    requested = []
+    running = []
+    max_running = 0
+
+    async def safe_request(endpoint, request, proxy, req_args={}):
+        nonlocal max_running
+        if 'leaves' in req_args:
+            return {'root': "new_root", 'leaves': ["leaf{0}".format(i) for i in range(0, 12)]}
+        running.append(req_args['leaf'])
+        max_running = max(max_running, len(running))
+        await asyncio.sleep(0.01)
+        running.remove(req_args['leaf'])
+        requested.append(req_args['leaf'])
+        return {'leaf': {'value': {}}}
+
+    connector.safe_request = safe_request
+    await connector.request_peers()
+    assert sorted(requested) == sorted("leaf{0}".format(i) for i in range(2, 12))
+    assert max_running == 4
+    assert node.merkle_peers_root == "new_root"
+    assert len(node.merkle_peers_leaves) == 12
+
+
+def test_leaves_concurrency_fits_in_the_session_pool():
+    node = Node(currency="test_currency", pubkey="pubkey", endpoints=[BMAEndpoint("node.test", None, None, 80)],
+                peer_blockstamp=BlockUID.empty(), state=Node.ONLINE)
+    assert NodeConnector(node, UserParameters()).leaves_concurrency() == NodeConnector.max_concurrent_leaves
+    connector = NodeConnector(node, UserParameters(), session_pool=SessionPool(limit_per_host=4))
+    assert connector.leaves_concurrency() == 2
+    connector = NodeConnector(node, UserParameters(),
+                              session_pool=SessionPool(limit_per_host=NodeConnector.max_concurrent_leaves
+                                                       + NodeConnector.websockets_per_node))
+    assert connector.leaves_concurrency() == NodeConnector.max_concurrent_leaves
+
+
+def block_hash(number, fork="A"):
+    return fork + format(number, "063X")
+
+
+def block(number, fork="A"):
+    return {'number': number, 'hash': block_hash(number, fork),
+            'previousHash': block_hash(number - 1, fork), 'medianTime': 1500000000 + number}
+
+
+@pytest.mark.asyncio
+async def test_refresh_block_uses_shared_headers():
+    headers_cache = BlockHeadersCache()
+    requested = []
+    connectors = []
+    for pubkey in ("pubkey1", "pubkey2"):
+        node = Node(currency="test_currency", pubkey=pubkey, endpoints=[BMAEndpoint("node.test", None, None, 80)],
+                    peer_blockstamp=BlockUID.empty(), current_buid=BlockUID(10, block_hash(10)), state=Node.ONLINE)
+        connector = NodeConnector(node, UserParameters(), headers_cache=headers_cache)
+
+        async def safe_request(endpoint, request, proxy, req_args={}, pubkey=pubkey):
+            requested.append((pubkey, req_args['number']))
+            return block(req_args['number'], "B" if pubkey == "pubkey2" else "A")
+
+        connector.safe_request = safe_request
+        connectors.append(connector)
+
+    # The previous block of a new head is in the head itself
+    for connector in connectors:
+        await connector.refresh_block(block(11))
+        assert connector.node.previous_buid == BlockUID(10, block_hash(10))
+    assert requested == []
+
+    # The ancestor of a farther head is requested once
+    for connector in connectors:
+        await connector.refresh_block(block(14))
+        assert connector.node.previous_buid == BlockUID(11, block_hash(11))
+        assert connector.node.current_buid == BlockUID(14, block_hash(14))
+    assert requested == [("pubkey1", 11)]
+
+    # A node on another fork gets its own ancestor
+    await connectors[1].refresh_block(block(16, "B"))
+    assert requested == [("pubkey1", 11), ("pubkey2", 14)]
+    assert connectors[1].node.previous_buid == BlockUID(14, block_hash(14, "B"))
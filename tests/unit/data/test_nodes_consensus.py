@@ -0,0 +1,32 @@
+from duniterpy.documents import BlockUID, block_uid
+from sakia.data.entities import Node
+from sakia.data.processors.nodes_consensus import NodesConsensus
+
+HEAD = block_uid("15-76543400E78B56CC21FB1DDC6CBAB24E0FACC9A798F5ED8736EA007F38617D67")
+FORK = block_uid("15-AEFFCB00E78B56CC21FB1DDC6CBAB24E0FACC9A798F5ED8736EA007F38617D67")
+
+
+def test_consensus_of_members(make_node):
+    consensus = NodesConsensus()
+    assert consensus.current_buid() == BlockUID.empty()
+
+    members = [make_node("member{0}".format(i), current_buid=HEAD, member=True) for i in range(0, 2)]
+    forked = [make_node("forked{0}".format(i), current_buid=FORK) for i in range(0, 3)]
+    for n in forked:
+        consensus.update(n)
+    assert consensus.current_buid() == FORK
+    for n in members:
+        consensus.update(n)
+    # The blocks of the members nodes win
+    assert consensus.current_buid() == HEAD
+    assert consensus.synced_nodes() == members
+    assert consensus.synced_members_nodes() == members
+
+    members[0].state = Node.OFFLINE
+    consensus.update(members[0])
+    assert consensus.synced_nodes() == [members[1]]
+
+    consensus.remove(members[1])
+    assert consensus.current_buid() == FORK
+    assert consensus.synced_nodes() == forked
+    assert consensus.synced_members_nodes() == []
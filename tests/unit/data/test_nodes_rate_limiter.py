@@ -0,0 +1,57 @@
+import asyncio
+import pytest
+from sakia.data.connectors import NodesRateLimiter
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_spreads_requests(make_node):
+    rate_limiter = NodesRateLimiter(rate=20, burst=2)
+    limited = make_node("limited")
+    loop = asyncio.get_event_loop()
+    start = loop.time()
+    for i in range(0, 4):
+        await rate_limiter.acquire(limited)
+    # The burst is sent at once, the two next requests wait 1/20s each
+    assert loop.time() - start >= 0.09
+    assert rate_limiter.delay(limited) > 0
+    assert rate_limiter.delay(make_node("other")) == 0
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker(make_node):
+    rate_limiter = NodesRateLimiter(failures_threshold=3, reset_timeout=0)
+    failing, working = make_node("failing"), make_node("working")
+    for i in range(0, 3):
+        rate_limiter.record_failure(failing)
+    rate_limiter.reset_timeout = 30
+    assert not rate_limiter.allows(failing)
+    assert rate_limiter.schedule([failing, working]) == [working]
+
+    # A single probe is let through after the reset timeout
+    rate_limiter.reset_timeout = 0
+    assert rate_limiter.allows(failing)
+    # Ranking the node does not use its probe
+    assert rate_limiter.schedule([failing, working]) == [failing, working]
+    assert rate_limiter.allows(failing)
+    await rate_limiter.acquire(failing)
+    rate_limiter.reset_timeout = 30
+    assert not rate_limiter.allows(failing)
+    rate_limiter.record_success(failing)
+    assert rate_limiter.allows(failing)
+
+    # A failed probe opens the circuit again
+    for i in range(0, 3):
+        rate_limiter.record_failure(failing)
+    rate_limiter.reset_timeout = 0
+    await rate_limiter.acquire(failing)
+    rate_limiter.record_failure(failing)
+    rate_limiter.reset_timeout = 30
+    assert not rate_limiter.allows(failing)
+
+
+def test_limitation_delays_queued_requests(make_node):
+    rate_limiter = NodesRateLimiter(rate=1, burst=4)
+    limited, other = make_node("limited"), make_node("other")
+    rate_limiter.record_limitation(limited)
+    assert rate_limiter.delay(limited) > 0
+    assert rate_limiter.schedule([limited, other]) == [other, limited]
@@ -92,3 +92,17 @@ UNKNOWNAPI some useless information""",
     node2 = nodes_repo.get_one(pubkey="7Aqw6Efa9EzE7gtsc8SveLLrM7gm6NEGoywSv4FJx6pZ")
     assert node2.current_buid == block_uid("16-77543400E78B56CC21FB1DDC6CBAB24E0FACC9A798F5ED8736EA007F38617D67")
     assert node2.previous_buid == block_uid("15-76543400E78B56CC21FB1DDC6CBAB24E0FACC9A798F5ED8736EA007F38617D67")
+
+
+def test_bulk_insert_update_nodes(meta_repo):
+    nodes_repo = NodesRepo(meta_repo.conn)
+    nodes = [Node(currency="testcurrency", pubkey="pubkey{0}".format(i),
+                  endpoints="BASIC_MERKLED_API testnet.duniter.org 80",
+                  peer_blockstamp=BlockUID.empty()) for i in range(0, 3)]
+    nodes_repo.insert_all(nodes)
+    nodes[1].uid = "doe"
+    nodes_repo.update_all(nodes[1:])
+    found = nodes_repo.get_by_pubkeys("testcurrency", ["pubkey1", "pubkey2", "unknown"])
+    assert sorted(found.keys()) == ["pubkey1", "pubkey2"]
+    assert found["pubkey1"].uid == "doe"
+    assert len(nodes_repo.get_all(currency="testcurrency")) == 3
@@ -0,0 +1,24 @@
+from sakia.data.connectors import NodesScoreboard
+
+
+def test_rank_by_latency_and_errors(make_node):
+    scoreboard = NodesScoreboard(exploration=0)
+    fast, slow, failing, unknown = make_node("fast"), make_node("slow"), make_node("failing"), make_node("unknown")
+    scoreboard.record_success(fast, 0.1)
+    scoreboard.record_success(slow, 2)
+    scoreboard.record_success(failing, 0.05)
+    for i in range(0, 5):
+        scoreboard.record_error(failing)
+    scoreboard.record_limitation(slow)
+    assert scoreboard.rank([failing, slow, fast, unknown]) == [unknown, fast, slow, failing]
+    assert scoreboard.score(slow).limitations == 1
+
+
+def test_scores_are_restored_from_nodes(make_node):
+    scoreboard = NodesScoreboard()
+    saved = make_node("saved", latency=0.5, error_rate=0.1, limitations=3)
+    assert scoreboard.cost(saved) == 0.5 + 0.1 * scoreboard.error_penalty
+    scoreboard.record_success(saved, 1.5)
+    scoreboard.store(saved)
+    assert saved.latency == 0.7
+    assert saved.limitations == 3
@@ -0,0 +1,33 @@
+from duniterpy.documents import block_uid
+from sakia.data.repositories import NodesRepo
+from sakia.data.processors.nodes_store import NodesStore
+
+HEAD = block_uid("15-76543400E78B56CC21FB1DDC6CBAB24E0FACC9A798F5ED8736EA007F38617D67")
+ENDPOINTS = "BASIC_MERKLED_API testnet.duniter.org 80"
+
+
+def test_store_writes_on_flush(meta_repo, make_node):
+    nodes_repo = NodesRepo(meta_repo.conn)
+    nodes_repo.insert(make_node("persisted", currency="testcurrency", endpoints=ENDPOINTS, current_buid=HEAD))
+    store = NodesStore.load(nodes_repo, "testcurrency")
+    assert store.get("persisted").pubkey == "persisted"
+
+    new_node = make_node("new", currency="testcurrency", endpoints=ENDPOINTS, current_buid=HEAD)
+    for i in range(0, 10):
+        new_node.latency = i
+        store.put(new_node)
+    store.put(store.get("persisted"))
+    assert len(nodes_repo.get_all(currency="testcurrency")) == 1
+    assert store.consensus.current_buid() == HEAD
+    assert store.pending() == 2
+
+    # The node updated many times is written once
+    assert store.flush() == 2
+    assert nodes_repo.get_one(currency="testcurrency", pubkey="new").latency == 9
+
+    store.remove(store.get("persisted"))
+    store.remove(new_node)
+    store.put(new_node)
+    assert store.flush() == 2
+    assert [n.pubkey for n in nodes_repo.get_all(currency="testcurrency")] == ["new"]
+    assert store.stats() == {'nodes': 1, 'updates': 12, 'writes': 4, 'pending': 0}
@@ -0,0 +1,44 @@
+import json
+import jsonschema
+import pytest
+from sakia.data.connectors import SeenMessages
+
+BLOCK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "number": {"type": "number"},
+        "hash": {"type": "string"},
+        "medianTime": {"type": "number"}
+    },
+    "required": ["number", "hash", "medianTime"]
+}
+
+
+def test_duplicates_are_not_validated_again(monkeypatch):
+    seen_messages = SeenMessages()
+    block = {"number": 12, "hash": "ABCD", "medianTime": 1500000000}
+    validated = []
+    validate = jsonschema.validate
+    monkeypatch.setattr(jsonschema, "validate", lambda data, schema: validated.append(data) or validate(data, schema))
+
+    data, seen = seen_messages.parse('block', json.dumps(block), BLOCK_SCHEMA)
+    assert data == block and not seen
+    data, seen = seen_messages.parse('block', json.dumps(block), BLOCK_SCHEMA)
+    assert data == block and seen
+    # The same block formatted differently by another node
+    data, seen = seen_messages.parse('block', json.dumps(block, indent=2, sort_keys=True), BLOCK_SCHEMA)
+    assert data == block and seen
+    assert len(validated) == 1
+
+    data, seen = seen_messages.parse('block', json.dumps(dict(block, number=13, hash="EF01")), BLOCK_SCHEMA)
+    assert not seen
+    # A copy of the block with other fields is not taken for the block
+    data, seen = seen_messages.parse('block', json.dumps(dict(block, medianTime=1400000000)), BLOCK_SCHEMA)
+    assert data['medianTime'] == 1400000000 and not seen
+    assert len(validated) == 3
+    with pytest.raises(jsonschema.ValidationError):
+        seen_messages.parse('block', json.dumps({"number": 14, "hash": "2345"}), BLOCK_SCHEMA)
+    with pytest.raises(jsonschema.ValidationError):
+        seen_messages.parse('block', "not json", BLOCK_SCHEMA)
+
+    assert seen_messages.stats()['block'] == {'received': 7, 'duplicates': 2, 'duplicate_rate': 2 / 7}
@@ -0,0 +1,15 @@
+import pytest
+from sakia.data.connectors import SessionPool
+
+
+@pytest.mark.asyncio
+async def test_session_is_reused_until_closed():
+    pool = SessionPool(limit_per_host=2)
+    session = pool.session()
+    assert pool.session() is session
+    assert session.connector.limit_per_host == 2
+    await pool.close()
+    assert session.closed
+    new_session = pool.session()
+    assert new_session is not session
+    await pool.close()
@@ -0,0 +1,101 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from duniterpy.documents import BlockUID
+from sakia.errors import NoPeerAvailable
+from sakia.services import BlockchainService
+
+BATCHES = 5
+DELAY = 0.05
+
+
+class Signal:
+    def emit(self, *args):
+        pass
+
+
+class FakeBlockchainProcessor:
+    def __init__(self, fail_at=None):
+        self.current = BlockUID(0, "0" * 64)
+        self.fail_at = fail_at
+        self.requested_blocks = []
+        self.events = []
+
+    def initialized(self, currency):
+        return True
+
+    def current_buid(self, currency):
+        return self.current
+
+    async def indexed_new_blocks(self, currency, network_number):
+        return [n for n in range(10, BATCHES * 10 + 1, 10) if n > self.current.number]
+
+    async def next_blocks(self, start, filter, currency):
+        number = min(n for n in filter if n > start)
+        self.events.append(("download", number))
+        await asyncio.sleep(DELAY)
+        if number == self.fail_at:
+            raise NoPeerAvailable("", 0)
+        return [SimpleNamespace(number=number)]
+
+    def handle_new_blocks(self, currency, blocks):
+        self.current = BlockUID(blocks[-1].number, "0" * 64)
+        self.events.append(("applied", blocks[-1].number))
+
+    async def get_block(self, currency, number, cached=True):
+        self.requested_blocks.append((number, cached))
+        return SimpleNamespace(number=number, blockUID=BlockUID(number, "0" * 64))
+
+
+class FakeService:
+    def __init__(self, result):
+        self.result = result
+
+    async def handle_new_blocks(self, blocks):
+        await asyncio.sleep(DELAY)
+        return self.result
+
+    async def refresh_sources(self, new_tx, new_dividends):
+        return {}
+
+
+def blockchain_service(processor):
+    app = SimpleNamespace(db=SimpleNamespace(commit=lambda: None),
+                          transaction_state_changed=Signal(), new_transfer=Signal(), new_dividend=Signal(),
+                          identity_changed=Signal(), new_blocks_handled=Signal(), sources_refreshed=Signal())
+    return BlockchainService(app, "test_currency", processor, None, FakeService([]),
+                             FakeService(([], {}, {})), FakeService(None))
+
+
+@pytest.mark.asyncio
+async def test_blocks_download_while_handling():
+    processor = FakeBlockchainProcessor()
+    service = blockchain_service(processor)
+    await service.handle_blockchain_progress(BlockUID(BATCHES * 10, "0" * 64))
+    assert processor.current.number == BATCHES * 10
+    # The download of each batch starts before the previous batch is applied
+    for number in range(10, BATCHES * 10, 10):
+        assert processor.events.index(("download", number + 10)) < processor.events.index(("applied", number))
+
+
+@pytest.mark.asyncio
+async def test_blocks_downloaded_are_handled_before_an_error():
+    processor = FakeBlockchainProcessor(fail_at=30)
+    service = blockchain_service(processor)
+    await service.handle_blockchain_progress(BlockUID(BATCHES * 10, "0" * 64))
+    assert processor.current.number == 20
+    assert not service._update_lock.locked()
+
+
+@pytest.mark.asyncio
+async def test_rollback_waits_for_the_blocks_being_handled():
+    processor = FakeBlockchainProcessor()
+    service = blockchain_service(processor)
+    progress = asyncio.ensure_future(service.handle_blockchain_progress(BlockUID(BATCHES * 10, "0" * 64)))
+    await asyncio.sleep(0)
+    assert service._update_lock.locked()
+    await service.rollback(BlockUID(BATCHES * 10, "0" * 64))
+    assert progress.done()
+    # The local blocks are compared to the blocks of the network, not to the cached ones
+    assert processor.requested_blocks == [(BATCHES * 10, False)]
+    assert not service._update_lock.locked()
@@ -0,0 +1,138 @@
+import asyncio
+import pytest
+import time
+from sakia.data.connectors import NodesScoreboard
+from sakia.data.entities import Node
+from sakia.data.processors import NodesProcessor
+from sakia.services.polling import NodesPollingScheduler
+
+
+@pytest.mark.asyncio
+async def test_polls_concurrently_within_limit(fake_connector):
+    scheduler = NodesPollingScheduler(max_concurrency=4)
+    connectors = [fake_connector("pubkey{0}".format(i)) for i in range(0, 8)]
+    for c in connectors:
+        scheduler.add(c)
+    running = True
+    task = asyncio.ensure_future(scheduler.run(lambda: running))
+    # The first polls are still running, the other nodes wait for a free slot
+    await asyncio.sleep(0.01)
+    assert scheduler.stats()['running'] == 4
+    assert scheduler.queue_depth() == 4
+
+    async def end_of_cycle():
+        while scheduler.cycle_time() is None:
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(end_of_cycle(), 5)
+    # Each node was polled once in the cycle, the next polls being due after the online interval
+    assert all(c.polls == 1 for c in connectors)
+    assert scheduler.queue_depth() == 0
+    running = False
+    await task
+
+
+def test_intervals_depend_on_node_state(fake_connector):
+    scheduler = NodesPollingScheduler()
+    member = fake_connector("member", member=True)
+    online = fake_connector("online")
+    offline = fake_connector("offline", state=Node.OFFLINE)
+    assert scheduler.interval(member) == scheduler.member_interval
+    assert scheduler.interval(online) == scheduler.online_interval
+
+    intervals = []
+    for i in range(0, 10):
+        offline.node.failures = i + 1
+        intervals.append(scheduler.interval(offline))
+    assert intervals[:3] == [30, 60, 120]
+    assert intervals[-1] == scheduler.max_interval
+
+
+@pytest.mark.asyncio
+async def test_websockets_of_best_members_only(fake_connector):
+    scheduler = NodesPollingScheduler(max_websockets=2)
+    scoreboard = NodesScoreboard()
+    fast_member = fake_connector("fast_member", member=True)
+    slow_member = fake_connector("slow_member", member=True)
+    fast_node = fake_connector("fast_node")
+    offline_member = fake_connector("offline_member", state=Node.OFFLINE, member=True)
+    scoreboard.record_success(fast_member.node, 0.1)
+    scoreboard.record_success(slow_member.node, 2)
+    scoreboard.record_success(fast_node.node, 0.05)
+    for c in (fast_member, slow_member, fast_node, offline_member):
+        scheduler.add(c)
+
+    scheduler.select_websockets(scoreboard)
+    assert [c.websockets_enabled for c in (fast_member, slow_member, fast_node, offline_member)] \
+        == [True, True, False, False]
+
+
+@pytest.mark.asyncio
+async def test_websockets_are_not_swapped_for_close_nodes(fake_connector):
+    scheduler = NodesPollingScheduler(max_websockets=1, websockets_margin=0.25)
+    scoreboard = NodesScoreboard(alpha=1)
+    followed = fake_connector("followed")
+    other = fake_connector("other")
+    other.websockets_enabled = False
+    scoreboard.record_success(followed.node, 1)
+    scoreboard.record_success(other.node, 0.9)
+    for c in (followed, other):
+        scheduler.add(c)
+
+    scheduler.select_websockets(scoreboard)
+    assert (followed.websockets_enabled, other.websockets_enabled) == (True, False)
+    # A node clearly better replaces the followed one
+    scoreboard.record_success(other.node, 0.5)
+    scheduler.select_websockets(scoreboard)
+    assert (followed.websockets_enabled, other.websockets_enabled) == (False, True)
+
+
+@pytest.mark.asyncio
+async def test_backoff_of_offline_nodes_is_saved(fake_connector):
+    stored = []
+    scheduler = NodesPollingScheduler(store_node=stored.append)
+    online = fake_connector("online")
+    offline = fake_connector("offline", state=Node.OFFLINE)
+    for c in (online, offline):
+        scheduler.add(c)
+    running = True
+    task = asyncio.ensure_future(scheduler.run(lambda: running))
+    await asyncio.sleep(0.1)
+    running = False
+    await task
+
+    # Only the retry state of the failing node is saved
+    assert stored == [offline.node]
+    assert offline.node.failures == 1
+    delay = offline.node.retry_time - time.time()
+    assert scheduler.backoff_interval * (1 - scheduler.jitter) - 1 <= delay <= scheduler.backoff_interval
+
+    # The backoff goes on after a restart
+    restarted = NodesPollingScheduler()
+    restarted.add(offline)
+    restarted.add(online)
+    assert restarted.queue_depth() == 1
+
+
+@pytest.mark.asyncio
+async def test_failing_nodes_are_given_up_with_their_backoff(meta_repo, fake_connector):
+    scheduler = NodesPollingScheduler()
+    processor = NodesProcessor(meta_repo.nodes_repo)
+    offline = fake_connector("offline", state=Node.OFFLINE)
+    offline.node.failures = scheduler.max_failures - 1
+    assert not scheduler.given_up(offline)
+    offline.node.failures = scheduler.max_failures
+    offline.node.retry_time = time.time() + scheduler.max_interval
+    assert scheduler.given_up(offline)
+
+    processor.insert_node(offline.node)
+    processor.delete_node(offline.node)
+    assert processor.unknown_node("test_currency", "offline")
+
+    # The node found again goes on with its backoff
+    found_again = fake_connector("offline")
+    assert processor.restore_retries(found_again.node)
+    assert found_again.node.failures == scheduler.max_failures
+    assert scheduler.retry_delay(found_again) > 0
+    scheduler.add(found_again)
+    assert scheduler.queue_depth() == 0
+    assert not processor.restore_retries(fake_connector("other").node)